@@ -0,0 +1,244 @@
+"""
+asyncio 版物品服务进程
+server.py 的 ExchangeServer 每个连接占用一个线程，几台自助机连接时没有问题；但校园网页前端在高峰期会把成百上千个用户的请求转过来，
+一千个持久连接就是一千个线程。AsyncExchangeServer 在一个事件循环中处理所有连接，接口与 server.py 完全相同，client.py 可以直接连接：
+1. 连接的读写都在事件循环中完成，空闲的持久连接只占用一个协程。
+2. 请求本身（登录、审核、添加物品、模糊搜索等）要读写文件或做大量计算，连同结果的 JSON 编码一起交给线程池执行，不阻塞事件循环；
+   候选物品较多的搜索还会由打分引擎分块交给进程池并行打分（见 scoring.py）。
+3. 背压：线程池中排队和正在执行的请求达到 max_pending 时，新请求立即返回 503（服务繁忙），而不是无限排队、越积越慢；
+   每个连接处理完一个请求才读取下一个请求，写响应时等待对方读取（drain），读得慢的客户端不会让服务进程积压数据。
+4. 超时：请求在 timeout 秒内没有完成时返回 504。还在排队的请求直接取消，不会再执行；已经开始执行的查询放弃结果；
+   已经开始执行的修改则等它完成并返回结果，避免客户端以为失败重试、数据却已经改过一次。
+
+用法：
+python async_server.py --storage sqlite --port 8765 --workers 8 --max-pending 64 --timeout 10
+"""
+import argparse
+import asyncio
+import http
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from server import DEFAULT_PORT, ServiceMethods, check_host, error_response, parse_request
+from services import ExchangeService, ServiceError
+
+# 请求头和请求体的最大长度（批量导入时请求体可能有几 MB）
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class AsyncExchangeServer:
+    def __init__(self, service, host='127.0.0.1', port=DEFAULT_PORT, workers=8, max_pending=64, timeout=10.0,
+                 idle_timeout=60.0, backlog=2048):
+        '''
+        初始化函数
+        参数：
+        service (ExchangeService): 业务服务，由服务进程独占
+        host (str): 监听地址，默认只接受本机连接
+        port (int): 监听端口，为 0 时由系统分配
+        workers (int): 执行请求的线程数
+        max_pending (int): 排队和正在执行的请求数的上限，超过时返回 503
+        timeout (float): 单个请求的超时时间（秒），包括排队的时间
+        idle_timeout (float): 持久连接空闲超过该时间（秒）后关闭
+        backlog (int): 等待接受的连接队列长度，大量客户端同时连接时需要足够大
+        '''
+        self.methods = ServiceMethods(service)
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.backlog = backlog
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='exchange-request')
+        self.pending = 0
+        self.stats = {'connections': 0, 'requests': 0, 'busy': 0, 'timeouts': 0}
+        self._server = None
+        self._writers = set()
+
+    async def start(self):
+        '''
+        开始监听。
+        返回：
+        address (tuple): 实际监听的 (地址, 端口)
+        '''
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                  backlog=self.backlog, limit=MAX_HEADER_SIZE)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        '''
+        处理请求，直到被取消。
+        '''
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def close(self):
+        '''
+        停止监听，关闭所有连接，等待线程池中的请求执行完。
+        '''
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def handle_connection(self, reader, writer):
+        '''
+        处理一个连接上的所有请求，直到对方关闭连接、要求关闭或者空闲超时。
+        '''
+        self.stats['connections'] += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, data = await self.dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, data, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def read_request(self, reader):
+        '''
+        读取一个 HTTP 请求。
+        返回：
+        request (tuple): (请求方法, 路径, 请求头, 请求体)；连接已关闭、空闲超时或请求无法解析时返回 None
+        '''
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, _ = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return None
+        if not 0 <= length <= MAX_BODY_SIZE:
+            return None
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), self.timeout) if length else b''
+        except asyncio.TimeoutError:
+            return None
+        return method, path, headers, body
+
+    async def dispatch(self, method, path, body):
+        '''
+        执行一个请求。
+        返回：
+        status (int): HTTP 状态码
+        data (bytes): JSON 编码的响应
+        '''
+        self.stats['requests'] += 1
+        try:
+            if method != 'POST':
+                raise ServiceError(f'不支持的请求方法：{method}')
+            args, token = parse_request(body)
+            function, writes = self.methods.lookup(path.strip('/'), args, token)
+        except Exception as e:
+            return self.encode_error(e)
+        if self.pending >= self.max_pending:
+            self.stats['busy'] += 1
+            return self.encode_error(ServiceError('服务繁忙，请稍后重试'), 503)
+
+        self.pending += 1
+        work = self.executor.submit(self._execute, function, args)
+        future = asyncio.wrap_future(work)
+        future.add_done_callback(self._release)
+        done, _ = await asyncio.wait({future}, timeout=self.timeout)
+        if not done:
+            # 还在排队的请求可以取消；已经开始执行的查询放弃结果；已经开始执行的修改必须等它完成
+            if work.cancel() or not writes:
+                self.stats['timeouts'] += 1
+                return self.encode_error(ServiceError('请求超时，请稍后重试'), 504)
+            await asyncio.wait({future})
+        try:
+            return 200, future.result()
+        except Exception as e:
+            return self.encode_error(e)
+
+    def _execute(self, function, args):
+        # 在线程池中执行，结果的 JSON 编码（搜索结果可能很大）也不占用事件循环
+        return json.dumps({'result': function(*args)}, ensure_ascii=False).encode('utf-8')
+
+    def _release(self, future):
+        self.pending -= 1
+        if not future.cancelled():
+            future.exception()  # 超时后放弃的查询也要取出异常，否则事件循环会报告“异常没有被处理”
+
+    def encode_error(self, error, status=None):
+        '''
+        参数：
+        error (Exception): 异常
+        status (int): HTTP 状态码，为 None 时按异常类型决定
+        返回：
+        status (int): HTTP 状态码
+        data (bytes): JSON 编码的错误响应
+        '''
+        default_status, body = error_response(error)
+        return status or default_status, json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+    def write_response(self, writer, status, data, keep_alive=True):
+        '''
+        响应头和响应体一次写入。
+        '''
+        lines = [f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}',
+                 'Content-Type: application/json; charset=utf-8',
+                 f'Content-Length: {len(data)}']
+        if not keep_alive:
+            lines.append('Connection: close')
+        head = '\r\n'.join(lines) + '\r\n\r\n'
+        writer.write(head.encode('latin-1') + data)
+
+
+async def serve(service, args):
+    server = AsyncExchangeServer(service, args.host, args.port, args.workers, args.max_pending, args.timeout)
+    host, port = await server.start()
+    print(f'物品服务已启动：http://{host}:{port}', flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='物品服务进程（asyncio 版）')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite'], default='pickle', help='存储引擎')
+    parser.add_argument('--write-delay', type=float, default=0.1, help='延迟写入的时间窗口（秒），0 表示每次改动立即写入')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--allow-remote', action='store_true', help='允许监听本机以外的地址')
+    parser.add_argument('--workers', type=int, default=8, help='执行请求的线程数')
+    parser.add_argument('--max-pending', type=int, default=64, help='排队和正在执行的请求数的上限，超过时返回 503')
+    parser.add_argument('--timeout', type=float, default=10.0, help='单个请求的超时时间（秒），超时返回 504')
+    args = parser.parse_args(argv)
+    check_host(parser, args)
+
+    service = ExchangeService(args.storage, write_delay=args.write_delay)
+    try:
+        asyncio.run(serve(service, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
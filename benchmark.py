@@ -0,0 +1,306 @@
+"""
+性能测试
+用固定的随机种子生成校园规模的模拟数据（不同审核状态的用户、默认和自定义的物品类型、一万到一百万个带中文名称和描述的物品），
+然后通过服务层测量登录、注册、审核、添加物品、不同长度关键字的模糊搜索、修改物品类型以及全量加载和保存的耗时。
+结果保存为 JSON 文件，使用 --compare 与之前的结果比较，耗时明显变长的项目会被标出，用于发现存储和搜索的性能退化。
+
+用法：
+python benchmark.py --items 10000 100000 --storage pickle sqlite --output bench.json
+python benchmark.py --items 10000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from item_model import Item
+from services import ExchangeService
+from storage import DEFAULT_ITEM_TYPES, open_storage
+
+# 在默认的三种物品类型之外增加的自定义类型
+CUSTOM_ITEM_TYPES = {
+    '电子产品': {'properties': ['品牌', '型号', '成色']},
+    '衣物': {'properties': ['尺码', '颜色']},
+    '体育用品': {'properties': ['品牌', '适用运动']},
+    '文具': {'properties': ['品牌', '数量']},
+}
+
+# 各类物品名称的词汇：名称由 前缀 + 名词 组成
+ITEM_NOUNS = {
+    '书籍': ['高等数学', '线性代数', '概率论与数理统计', '大学物理', '数据结构', '算法导论', 'Python编程', '英语四级词汇',
+           '红楼梦', '三体', '百年孤独', '经济学原理', '有机化学', '电路分析', '马克思主义基本原理', 'C程序设计'],
+    '食品': ['方便面', '薯片', '牛奶', '饼干', '巧克力', '咖啡', '坚果', '月饼', '苹果', '酸奶', '面包', '辣条'],
+    '工具': ['螺丝刀', '扳手', '电钻', '卷尺', '锤子', '万用表', '电烙铁', '剪刀', '雨伞', '台灯', '插线板', '胶枪'],
+    '电子产品': ['耳机', '鼠标', '键盘', '显示器', '充电宝', '路由器', '平板电脑', '计算器', '移动硬盘', '音箱'],
+    '衣物': ['羽绒服', '卫衣', '运动鞋', '牛仔裤', '围巾', '外套', '衬衫', '帽子', '手套', '学士服'],
+    '体育用品': ['篮球', '足球', '羽毛球拍', '乒乓球拍', '瑜伽垫', '跳绳', '哑铃', '自行车', '滑板', '网球'],
+    '文具': ['笔记本', '中性笔', '文件夹', '订书机', '荧光笔', '计算纸', '便利贴', '书包', '直尺', '橡皮'],
+}
+ITEM_PREFIXES = ['', '二手', '九成新', '全新', '闲置', '毕业清仓', '几乎没用过', '低价转让', '宿舍搬家']
+DESCRIPTION_PHRASES = ['功能完好', '有轻微使用痕迹', '原价购入', '可小刀', '自取优先', '支持当面验货', '包装完整',
+                       '毕业带不走', '只用过一学期', '送配件', '保存得很好', '闵行校区', '徐汇校区', '晚上可取']
+PROPERTY_VALUES = ['人民教育出版社', '高等教育出版社', '清华大学出版社', '2024-09-01', '12个月', '6个月', '小米', '华为',
+                   '得力', '晨光', '李宁', '安踏', 'M', 'L', 'XL', '黑色', '白色', '蓝色', '九成新', '篮球', '10']
+CAMPUS_ADDRESSES = ['东上院', '西上院', '图书馆', '一餐', '二餐', '三餐', '四餐', '学生服务中心', '电院', '机动学院',
+                    '东区宿舍', '西区宿舍', '南区宿舍', '体育馆']
+# 用户审核状态的分布
+USER_STATUSES = (('approved', 0.7), ('pending', 0.2), ('rejected', 0.1))
+
+
+def generate_dataset(data_dir, storage='pickle', items=10000, users=1000, seed=0):
+    '''
+    生成模拟数据并写入存储引擎。相同的参数和随机种子总是生成相同的数据。
+    参数：
+    data_dir (str): 数据文件所在目录
+    storage (str): 存储引擎名称（'pickle' 或 'sqlite'）
+    items (int): 物品数
+    users (int): 用户数（不包括管理员）
+    seed (int): 随机种子
+    返回：
+    dataset (dict): 生成的用户名、物品类型和物品名称，供测试挑选输入
+    '''
+    rng = random.Random(seed)
+    statuses, weights = zip(*USER_STATUSES)
+    usrs_info = {'admin': {'password': '123456', 'status': 'approved', 'address': 'SJTU', 'contact': 'zhangsiyao618@163.com'}}
+    for i in range(users):
+        usrs_info[f'student{i:06d}'] = {
+            'password': f'pwd{rng.randrange(10 ** 6):06d}',
+            'status': rng.choices(statuses, weights)[0],
+            'address': rng.choice(CAMPUS_ADDRESSES),
+            'contact': f'1{rng.randrange(3, 9)}{rng.randrange(10 ** 9):09d}',
+        }
+
+    item_types = {name: {'properties': list(info['properties'])} for name, info in DEFAULT_ITEM_TYPES.items()}
+    item_types.update({name: {'properties': list(info['properties'])} for name, info in CUSTOM_ITEM_TYPES.items()})
+    type_names = [name for name in item_types if name in ITEM_NOUNS]
+
+    item_info_data = []
+    for item_id in range(1, items + 1):
+        item_type = rng.choice(type_names)
+        name = rng.choice(ITEM_PREFIXES) + rng.choice(ITEM_NOUNS[item_type])
+        item_info_data.append(Item({
+            '物品名称': name,
+            '物品描述': '，'.join(rng.sample(DESCRIPTION_PHRASES, rng.randint(1, 4))),
+            '物品地址': rng.choice(CAMPUS_ADDRESSES),
+            '联系人手机': f'1{rng.randrange(3, 9)}{rng.randrange(10 ** 9):09d}',
+            '邮箱': f'user{rng.randrange(10 ** 6)}@sjtu.edu.cn',
+            'type': item_type,
+            'properties': {prop: rng.choice(PROPERTY_VALUES) for prop in item_types[item_type]['properties']},
+            'id': item_id,
+        }))
+
+    engine = open_storage(storage, data_dir)
+    try:
+        engine.save_users(usrs_info, list(usrs_info))
+        engine.save_item_types(item_types)
+        engine.save_items(item_info_data)
+    finally:
+        engine.close()
+    return {'users': usrs_info, 'item_types': item_types,
+            'items': [(item['type'], item['物品名称'], item['物品描述']) for item in item_info_data]}
+
+
+def summarize(durations):
+    '''
+    参数：
+    durations (list): 每次操作的耗时（秒）
+    返回：
+    summary (dict): 次数、总耗时、平均值、中位数、95 分位数和最大值（毫秒）
+    '''
+    ordered = sorted(durations)
+    ms = 1000.0
+    return {
+        'n': len(ordered),
+        'total_ms': sum(ordered) * ms,
+        'mean_ms': statistics.fmean(ordered) * ms,
+        'p50_ms': ordered[len(ordered) // 2] * ms,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * ms,
+        'max_ms': ordered[-1] * ms,
+    }
+
+
+def timed(operation, inputs):
+    '''
+    对每个输入调用一次 operation 并记录耗时。
+    参数：
+    operation (function): 被测的操作
+    inputs (iterable): 每次调用的参数元组
+    返回：
+    summary (dict): 耗时统计
+    '''
+    durations = []
+    for args in inputs:
+        start = time.perf_counter()
+        operation(*args)
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def search_keywords(rng, dataset, length, count):
+    '''
+    从物品名称和描述中截取指定长度的关键字，并搭配该物品的类型。
+    '''
+    keywords = []
+    for _ in range(count):
+        item_type, name, desc = rng.choice(dataset['items'])
+        text = name if len(name) >= length else name + desc
+        start = rng.randrange(max(1, len(text) - length + 1))
+        keywords.append((item_type, text[start:start + length]))
+    return keywords
+
+
+def run_benchmarks(storage='pickle', items=10000, users=1000, seed=0, repeat=50, keyword_lengths=(1, 2, 4, 8),
+                   workers=None, data_dir=None, write_delay=None):
+    '''
+    在新生成的数据上运行所有测试。
+    参数：
+    storage (str): 存储引擎名称
+    items (int): 物品数
+    users (int): 用户数
+    seed (int): 随机种子
+    repeat (int): 单条操作（登录、注册、审核、添加物品、搜索）重复的次数
+    keyword_lengths (tuple): 搜索关键字的长度
+    workers (int): 搜索打分使用的进程数，默认为 CPU 核数
+    data_dir (str): 数据目录，默认使用临时目录（测试结束后删除）
+    write_delay (float): 延迟写入的时间窗口（秒），为 None 时每次改动立即写入
+    返回：
+    results (dict): 测试名称到耗时统计的字典
+    '''
+    with tempfile.TemporaryDirectory(prefix='exchange-bench-') as tmp_dir:
+        data_dir = data_dir or tmp_dir
+        rng = random.Random(seed + 1)
+        results = {}
+
+        start = time.perf_counter()
+        dataset = generate_dataset(data_dir, storage, items, users, seed)
+        results['generate'] = summarize([time.perf_counter() - start])
+
+        # 全量加载：打开存储引擎、读取所有物品、建立类型分区和搜索索引
+        durations = []
+        for _ in range(3):
+            start = time.perf_counter()
+            service = ExchangeService(open_storage(storage, data_dir))
+            durations.append(time.perf_counter() - start)
+            service.close()
+        results['load'] = summarize(durations)
+
+        service = ExchangeService(open_storage(storage, data_dir), write_delay=write_delay)
+        if workers is not None:
+            service.scorer.workers = workers
+        try:
+            approved = [(name, info['password']) for name, info in dataset['users'].items() if info['status'] == 'approved']
+            results['login'] = timed(service.users.login, [rng.choice(approved) for _ in range(repeat)])
+
+            new_users = [(f'bench{i:06d}', 'pwd', 'pwd', rng.choice(CAMPUS_ADDRESSES), '13800000000') for i in range(repeat)]
+            results['signup'] = timed(service.users.sign_up, new_users)
+            results['approve'] = timed(service.users.approve, [(name,) for name, *_ in new_users])
+
+            type_names = list(ITEM_NOUNS)
+            additions = []
+            for i in range(repeat):
+                item_type = rng.choice(type_names)
+                fields = {'物品名称': f'测试物品{i}', '物品描述': rng.choice(DESCRIPTION_PHRASES), '物品地址': '图书馆',
+                          '联系人手机': '13800000000', '邮箱': 'bench@sjtu.edu.cn'}
+                values = [rng.choice(PROPERTY_VALUES) for _ in dataset['item_types'][item_type]['properties']]
+                additions.append((item_type, fields, values))
+            results['add_item'] = timed(service.items.add, additions)
+            # 延迟写入时，上面的改动在这里一次写入
+            results['flush'] = timed(service.flush, [()])
+
+            for length in keyword_lengths:
+                keywords = search_keywords(rng, dataset, length, repeat)
+                results[f'search_kw{length}'] = timed(lambda item_type, keyword: list(service.search.search(item_type, keyword)),
+                                                      keywords)
+
+            # 修改自定义类型的属性，该类型的所有物品都会被更新；交替增减一个属性，保证每次都有改动
+            properties = list(CUSTOM_ITEM_TYPES['电子产品']['properties'])
+            modifications = [('电子产品', '电子产品', properties + ['颜色'] if i % 2 == 0 else properties) for i in range(3)]
+            results['modify_type'] = timed(service.item_types.modify, modifications)
+
+            results['save'] = timed(service.catalog.save, [() for _ in range(3)])
+        finally:
+            service.close()
+        return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    与之前的结果比较，打印每项的平均耗时之比。
+    参数：
+    results (dict): 本次的结果
+    baseline (dict): 之前的结果
+    tolerance (float): 平均耗时增加超过该比例时视为退化
+    返回：
+    regressions (list): 退化的项目
+    '''
+    regressions = []
+    baseline_runs = {run['name']: run['results'] for run in baseline['runs']}
+    for run in results['runs']:
+        old_results = baseline_runs.get(run['name'])
+        if old_results is None:
+            continue
+        for bench, summary in run['results'].items():
+            old = old_results.get(bench)
+            if old is None or old['mean_ms'] == 0:
+                continue
+            ratio = summary['mean_ms'] / old['mean_ms']
+            flag = ''
+            if ratio > 1 + tolerance:
+                flag = '  <-- 变慢'
+                regressions.append(f"{run['name']}/{bench}")
+            print(f"{run['name']:>24} {bench:>12}: {old['mean_ms']:10.3f} ms -> {summary['mean_ms']:10.3f} ms ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='物品复活软件性能测试')
+    parser.add_argument('--items', type=int, nargs='+', default=[10000], help='物品数，可以给出多个')
+    parser.add_argument('--users', type=int, default=1000, help='用户数')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite'], nargs='+', default=['pickle'], help='存储引擎')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--repeat', type=int, default=50, help='单条操作重复的次数')
+    parser.add_argument('--keyword-lengths', type=int, nargs='+', default=[1, 2, 4, 8], help='搜索关键字的长度')
+    parser.add_argument('--workers', type=int, default=None, help='搜索打分的进程数')
+    parser.add_argument('--write-delay', type=float, default=None, help='延迟写入的时间窗口（秒），默认每次改动立即写入')
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--compare', help='与之前的结果 JSON 文件比较')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='平均耗时增加超过该比例时视为退化')
+    args = parser.parse_args(argv)
+
+    results = {
+        'meta': {'seed': args.seed, 'users': args.users, 'repeat': args.repeat, 'write_delay': args.write_delay, 'python': platform.python_version(),
+                 'platform': platform.platform(), 'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'runs': [],
+    }
+    for storage in args.storage:
+        for items in args.items:
+            name = f'{storage}-{items}'
+            print(f'运行 {name} ...', file=sys.stderr)
+            run = run_benchmarks(storage, items, args.users, args.seed, args.repeat, tuple(args.keyword_lengths), args.workers,
+                                 write_delay=args.write_delay)
+            results['runs'].append({'name': name, 'storage': storage, 'items': items, 'results': run})
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('性能退化：' + '，'.join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
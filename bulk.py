@@ -0,0 +1,188 @@
+"""
+批量导入和导出物品
+学期初需要一次迁移成千上万条物品信息，逐条在界面中填写不现实。支持两种文件格式：
+1. CSV：每行一个物品，列为公共信息（物品名称、物品描述、物品地址、联系人手机、邮箱）、“物品类型”和各个属性，
+   某一类物品没有的属性留空。
+2. JSONL：每行一个 JSON 对象，格式与物品信息相同：公共信息、'type' 和 'properties'。
+文件按行读取和写入，不需要把整个文件或全部物品放进内存；导入时逐批检查，检查完后一次写入（见 ItemService.import_items）。
+
+用法：
+python bulk.py import items.csv
+python bulk.py export items.jsonl --type 书籍
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+from services import ITEM_FIELDS, ExchangeService, ServiceError
+
+# CSV 文件中物品类型所在的列
+TYPE_COLUMN = '物品类型'
+
+
+def file_format(path):
+    '''
+    按扩展名判断文件格式。
+    参数：
+    path (str): 文件路径
+    返回：
+    format (str): 'csv' 或 'jsonl'
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.json'):
+        return 'jsonl'
+    raise ServiceError(f'不支持的文件格式：{extension or path}（支持 .csv 和 .jsonl）')
+
+
+def read_csv(file):
+    '''
+    逐行读取 CSV 文件。
+    参数：
+    file (file): 以文本方式打开的文件
+    返回：
+    rows (generator): (行号, 物品信息字典)，行号是文件中的行号（表头是第 1 行）；除公共信息和物品类型以外的非空列都作为属性
+    '''
+    reader = csv.DictReader(file)
+    for record in reader:
+        row = {key: (record.get(key) or '').strip() for key in ITEM_FIELDS}
+        row['type'] = (record.get(TYPE_COLUMN) or '').strip()
+        row['properties'] = {key: value.strip() for key, value in record.items()
+                             if key not in ITEM_FIELDS and key != TYPE_COLUMN and key is not None and value and value.strip()}
+        # 读完这条记录时所在的行（字段中有换行时是记录的最后一行）
+        yield reader.line_num, row
+
+
+def read_jsonl(file):
+    '''
+    逐行读取 JSONL 文件，跳过空行。
+    参数：
+    file (file): 以文本方式打开的文件
+    返回：
+    rows (generator): (行号, 物品信息字典)，行号是文件中的行号，空行也计入
+    '''
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ServiceError(f'第 {line_number} 行不是有效的 JSON')
+        if not isinstance(row, dict):
+            raise ServiceError(f'第 {line_number} 行不是 JSON 对象')
+        yield line_number, row
+
+
+def write_csv(items, file, property_names):
+    '''
+    逐个写入物品。
+    参数：
+    items (iterable): 物品
+    file (file): 以文本方式打开的文件
+    property_names (list): 属性列，物品没有的属性留空
+    返回：
+    count (int): 写入的物品数
+    '''
+    writer = csv.writer(file)
+    writer.writerow(list(ITEM_FIELDS) + [TYPE_COLUMN] + list(property_names))
+    count = 0
+    for item in items:
+        properties = item['properties']
+        writer.writerow([item.get(key, '') for key in ITEM_FIELDS] + [item['type']]
+                        + [properties.get(prop, '') for prop in property_names])
+        count += 1
+    return count
+
+
+def write_jsonl(items, file):
+    '''
+    逐个写入物品，每行一个 JSON 对象。
+    参数：
+    items (iterable): 物品
+    file (file): 以文本方式打开的文件
+    返回：
+    count (int): 写入的物品数
+    '''
+    count = 0
+    for item in items:
+        row = {key: item.get(key, '') for key in ITEM_FIELDS}
+        row['type'] = item['type']
+        row['properties'] = dict(item['properties'])
+        file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def import_file(service, path, skip_invalid=False):
+    '''
+    从文件批量导入物品。
+    参数：
+    service (ExchangeService): 业务服务
+    path (str): CSV 或 JSONL 文件路径
+    skip_invalid (bool): 是否跳过有错误的行
+    返回：
+    imported (int): 导入的物品数
+    errors (list): (行号, 错误信息)
+    '''
+    reader = read_csv if file_format(path) == 'csv' else read_jsonl
+    # utf-8-sig 兼容 Excel 保存的带 BOM 的 CSV 文件
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        return service.items.import_items(reader(file), skip_invalid=skip_invalid)
+
+
+def export_file(service, path, item_type=None):
+    '''
+    把物品导出到文件。
+    参数：
+    service (ExchangeService): 业务服务
+    path (str): CSV 或 JSONL 文件路径
+    item_type (str): 只导出该类型的物品，为 None 时导出所有物品
+    返回：
+    count (int): 导出的物品数
+    '''
+    fmt = file_format(path)
+    items = service.items.export(item_type)
+    with open(path, 'w', encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='') as file:
+        if fmt == 'jsonl':
+            return write_jsonl(items, file)
+        type_names = [item_type] if item_type is not None else service.item_types.names()
+        # 所有导出类型的属性，按第一次出现的顺序排列
+        property_names = list(dict.fromkeys(prop for name in type_names for prop in service.item_types.properties(name)))
+        return write_csv(items, file, property_names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量导入和导出物品')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite'], default='pickle', help='存储引擎')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='从 CSV 或 JSONL 文件导入物品')
+    import_parser.add_argument('path', help='文件路径')
+    import_parser.add_argument('--skip-invalid', action='store_true', help='跳过有错误的行，只导入正确的行')
+    export_parser = commands.add_parser('export', help='把物品导出到 CSV 或 JSONL 文件')
+    export_parser.add_argument('path', help='文件路径')
+    export_parser.add_argument('--type', dest='item_type', help='只导出该类型的物品')
+    args = parser.parse_args(argv)
+
+    service = ExchangeService(args.storage)
+    try:
+        if args.command == 'import':
+            imported, errors = import_file(service, args.path, args.skip_invalid)
+            for line, message in errors:
+                print(f'第 {line} 行：{message}', file=sys.stderr)
+            print(f'导入了 {imported} 个物品，跳过了 {len(errors)} 行')
+        else:
+            count = export_file(service, args.path, args.item_type)
+            print(f'导出了 {count} 个物品')
+    except (ServiceError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+瘦客户端
+RemoteExchangeService 与 ExchangeService 有相同的 users、item_types、items、search 四个服务和 flush、close 方法，
+但不加载任何数据，每个操作都发给物品服务进程（见 server.py）完成。界面程序使用 --server 参数时以这种模式运行。
+
+连接池中保存已经建立的 HTTP/1.1 持久连接，每个请求借用一个连接，用完放回，不必每次重新建立 TCP 连接；
+后台搜索线程和界面线程同时发请求时各用各的连接。服务进程关闭了空闲连接时，请求会换一个新连接重发一次。
+物品列表按页从服务进程取用（RemoteItemList），打开十万个物品的列表也只传输可见的几页；搜索结果也按页取用，取消的搜索不再取下一页。
+登录成功后保存服务进程返回的会话令牌，之后的每个请求都带上它。
+"""
+import http.client
+import json
+import queue
+from collections.abc import Sequence
+from urllib.parse import urlsplit
+
+from server import DEFAULT_PORT, AuthenticationError, PermissionDeniedError
+from services import ImportValidationError, NotRegisteredError, ServiceError
+
+# 服务进程返回的错误类型 -> 客户端抛出的异常
+ERROR_TYPES = {'ServiceError': ServiceError, 'NotRegisteredError': NotRegisteredError,
+               'AuthenticationError': AuthenticationError, 'PermissionDeniedError': PermissionDeniedError}
+
+
+class ConnectionPool:
+    def __init__(self, host, port, size=4, timeout=30):
+        '''
+        初始化函数
+        参数：
+        host (str): 服务进程的地址
+        port (int): 服务进程的端口
+        size (int): 最多保留的空闲连接数；同时发出的请求更多时临时建立新连接，用完后关闭
+        timeout (float): 连接和等待响应的超时时间（秒）
+        '''
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def request(self, path, payload):
+        '''
+        发送一个 POST 请求。
+        参数：
+        path (str): 请求路径
+        payload (dict): 请求体，转换为 JSON 发送
+        返回：
+        status (int): HTTP 状态码
+        body (dict): 解析后的响应
+        '''
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        while True:
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+            try:
+                conn.request('POST', path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                if reused:
+                    continue  # 空闲连接已被服务进程关闭，换一个连接重发
+                raise ServiceError(f'与物品服务的连接中断：{e}')
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise ServiceError(f'无法连接物品服务 {self.host}:{self.port}：{e}')
+            self._release(conn, response)
+            return response.status, json.loads(data)
+
+    def _release(self, conn, response):
+        if response.will_close or self._idle.qsize() >= self.size:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def close(self):
+        '''
+        关闭所有空闲连接。
+        '''
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RemoteItemList(Sequence):
+    def __init__(self, call, page_size=100):
+        '''
+        初始化函数。物品总数在创建时取一次，物品按页取用并缓存；列表是创建时的快照，删除物品后需要重新创建。
+        参数：
+        call (function): call(请求名称, *参数)
+        page_size (int): 每页的物品数
+        '''
+        self.call = call
+        self.page_size = page_size
+        self.count = call('items/count')
+        self._pages = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        page_number, offset = divmod(index, self.page_size)
+        page = self._pages.get(page_number)
+        if page is None:
+            start = page_number * self.page_size
+            page = self._pages[page_number] = self.call('items/slice', start, start + self.page_size)
+        if offset >= len(page):
+            # 取到这一页时服务进程中的物品已经变少了
+            raise IndexError(index)
+        return page[offset]
+
+
+class RemoteUserService:
+    def __init__(self, call, on_login):
+        '''
+        初始化函数
+        参数：
+        call (function): call(请求名称, *参数)
+        on_login (function): on_login(会话令牌)，登录成功后调用
+        '''
+        self.call = call
+        self.on_login = on_login
+
+    def login(self, name, password):
+        '''
+        登录并保存会话令牌。
+        返回：
+        role (str): 'admin' 表示管理员，'user' 表示普通用户
+        '''
+        session = self.call('users/login', name, password)
+        self.on_login(session['token'])
+        return session['role']
+
+    def sign_up(self, name, password, password_confirm, address, contact):
+        self.call('users/sign_up', name, password, password_confirm, address, contact)
+
+    def approve(self, name):
+        self.approve_many([name])
+
+    def reject(self, name):
+        self.reject_many([name])
+
+    def approve_many(self, names):
+        return self.call('users/approve_many', list(names))
+
+    def reject_many(self, names):
+        return self.call('users/reject_many', list(names))
+
+    def get(self, name):
+        return self.call('users/get', name)
+
+    def list(self, status=None):
+        return self.call('users/list', status)
+
+
+class RemoteItemTypeService:
+    def __init__(self, call):
+        self.call = call
+
+    @property
+    def version(self):
+        return self.call('item_types/version')
+
+    def names(self):
+        return self.call('item_types/names')
+
+    def properties(self, name):
+        return self.call('item_types/properties', name)
+
+    def add(self, name, properties):
+        self.call('item_types/add', name, list(properties))
+
+    def modify(self, old_name, new_name, properties):
+        self.call('item_types/modify', old_name, new_name, list(properties))
+
+
+class RemoteItemService:
+    def __init__(self, call, export_page_size=1000):
+        self.call = call
+        self.export_page_size = export_page_size
+
+    def all(self):
+        '''
+        返回：
+        items (RemoteItemList): 按页从服务进程取用的物品列表
+        '''
+        return RemoteItemList(self.call)
+
+    def filter_by_name(self, text):
+        return self.call('items/filter_by_name', text)
+
+    def add(self, item_type, fields, property_values):
+        return self.call('items/add', item_type, fields, list(property_values))
+
+    def import_items(self, rows, batch_size=1000, skip_invalid=False):
+        '''
+        批量导入物品：所有行连同行号一次发给服务进程，由它检查并一次写入。
+        参数：
+        rows (iterable): (行号, 物品信息字典)
+        '''
+        rows = list(rows)
+        imported, errors = self.call('items/import_items', [row for _, row in rows], skip_invalid,
+                                     [line for line, _ in rows])
+        return imported, [tuple(error) for error in errors]
+
+    def export(self, item_type=None):
+        '''
+        按页从服务进程取用要导出的物品。
+        '''
+        after_id = None
+        while True:
+            page = self.call('items/export_page', item_type, after_id, self.export_page_size)
+            yield from page
+            if len(page) < self.export_page_size:
+                return
+            after_id = page[-1]['id']
+
+    def _update(self, item, data):
+        # 客户端的物品是普通字典，原地更新，界面中引用它的地方随之变化
+        item.clear()
+        item.update(data)
+        return item
+
+    def upgrade(self, item):
+        return self._update(item, self.call('items/get', item['id']))
+
+    def modify(self, item, fields, properties=None):
+        self._update(item, self.call('items/modify', item['id'], fields, properties))
+
+    def delete(self, item):
+        self.call('items/delete', item['id'])
+
+
+class RemoteSearchService:
+    def __init__(self, call, page_size=100):
+        self.call = call
+        self.page_size = page_size
+
+    def search(self, item_type, keyword, threshold=50, cancelled=None):
+        '''
+        按页从服务进程取用搜索结果，每页找够 page_size 个结果服务进程就停止打分；cancelled() 返回 True 时不再取下一页。
+        '''
+        after_id = None
+        while cancelled is None or not cancelled():
+            page = self.call('search/search', item_type, keyword, threshold, after_id, self.page_size)
+            yield from page
+            if len(page) < self.page_size:
+                return
+            after_id = page[-1]['id']
+
+
+class RemoteExchangeService:
+    def __init__(self, url=f'http://127.0.0.1:{DEFAULT_PORT}', pool_size=4, timeout=30):
+        '''
+        初始化函数，不建立连接，第一次请求时才连接服务进程。
+        参数：
+        url (str): 服务进程的地址，例如 http://127.0.0.1:8765
+        pool_size (int): 连接池中最多保留的空闲连接数
+        timeout (float): 请求的超时时间（秒）
+        '''
+        parts = urlsplit(url if '//' in url else f'http://{url}')
+        self.pool = ConnectionPool(parts.hostname or '127.0.0.1', parts.port or DEFAULT_PORT, pool_size, timeout)
+        self.token = None  # 最近一次登录得到的会话令牌
+        self.users = RemoteUserService(self.call, self._set_token)
+        self.item_types = RemoteItemTypeService(self.call)
+        self.items = RemoteItemService(self.call)
+        self.search = RemoteSearchService(self.call)
+
+    def call(self, name, *args):
+        '''
+        调用服务进程的一个方法。
+        参数：
+        name (str): 'service/method'
+        args: 参数，必须可以转换为 JSON
+        返回：
+        result: 方法的返回值
+        '''
+        payload = {'args': list(args)}
+        if self.token is not None:
+            payload['token'] = self.token
+        status, body = self.pool.request(f'/{name}', payload)
+        error = body.get('error')
+        if error is None:
+            return body.get('result')
+        if 'errors' in error:
+            raise ImportValidationError(error['message'], [tuple(e) for e in error['errors']])
+        raise ERROR_TYPES.get(error['type'], ServiceError)(error['message'])
+
+    def _set_token(self, token):
+        self.token = token
+
+    def is_loaded(self):
+        '''
+        物品由服务进程加载，客户端不需要等待。
+        '''
+        return True
+
+    def wait_loaded(self, timeout=None):
+        return True
+
+    def flush(self):
+        '''
+        让服务进程立即写入延迟写入的改动。
+        '''
+        self.call('service/flush')
+
+    def close(self):
+        '''
+        关闭连接（不会关闭服务进程）。
+        '''
+        self.pool.close()
@@ -8,32 +8,81 @@
 2. 管理员功能：管理员可以定义新的物品类型或修改已定义的物品类型，也可以查看所有物品的详细信息，进行删除或修改，这保证了系统的安全与可维护性。
 3. 普通用户功能：普通用户需填写基本信息进行注册，经管理员批准后成为正式用户；可以填写信息添加“可复活”物品或根据物品类型和关键字来查询物品（支持部分/模糊匹配）。 
 """
+import time
+
+# 启动计时（--startup-timing）的起点，放在其他导入之前，导入模块的耗时也计算在内
+STARTUP_START = time.perf_counter()
+
 import tkinter as tk
-from tkinter import messagebox
-from fuzzywuzzy import fuzz
-import pickle
-from PIL import Image, ImageTk
+from tkinter import filedialog, messagebox
+import argparse
+import sys
+from bulk import export_file, import_file
+from services import ExchangeService, ImportValidationError, NotRegisteredError, ServiceError
+from search_worker import SearchWorker
+from widgets import PagedResultsView, VirtualListbox, load_thumbnail
+
+
+class StartupTimer:
+    def __init__(self, start):
+        '''
+        初始化函数，记录启动过程中各个阶段的耗时，用于确认登录窗口出现得有多快。
+        参数：
+        start (float): 计时起点（time.perf_counter()）
+        '''
+        self.start = start
+        self.last = start
+        self.phases = []
+
+    def mark(self, name):
+        '''
+        结束一个阶段。
+        参数：
+        name (str): 阶段名称
+        '''
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self, file=sys.stderr):
+        '''
+        打印各个阶段和总的耗时（毫秒）。
+        '''
+        for name, duration in self.phases:
+            print(f'{name:<12}{duration * 1000:10.1f} ms', file=file)
+        print(f'{"合计":<12}{(self.last - self.start) * 1000:10.1f} ms', file=file)
+
 
 class ExchangeSystemApp:
-    def __init__(self, root):
+    def __init__(self, root, storage='pickle', write_delay=0.1, server=None, timer=None):
         '''
         初始化函数
+        参数：
+        root (tk.Tk): 主窗口
+        storage (str 或 StorageEngine): 存储引擎名称（'pickle' 或 'sqlite'），也可以直接传入存储引擎对象
+        write_delay (float): 延迟写入的时间窗口（秒），改动在后台成组写入，界面不再等待写文件；0 表示每次改动立即写入
+        server (str): 物品服务进程的地址（见 server.py）；指定时以瘦客户端模式运行，不在本地加载数据，storage 和 write_delay 不起作用
+        timer (StartupTimer): 记录启动各阶段耗时的计时器，为 None 时不计时
         '''
         self.window = root
         self.window.title('欢迎登录')
         self.window.geometry('450x300')
 
-        # 加载物品信息数据
-        self.item_info_file = "item_info.pickle"
-        self.load_item_info()
+        # 业务逻辑都由服务层完成，界面只负责收集输入和显示结果
+        if server:
+            # 只有瘦客户端模式才需要 HTTP 客户端
+            from client import RemoteExchangeService
+            self.service = RemoteExchangeService(server)
+        else:
+            # 物品在后台线程中加载和建立索引，登录窗口不必等待；用到物品的界面见 when_loaded
+            self.service = ExchangeService(storage, write_delay=write_delay, background_load=True)
+        if timer is not None:
+            timer.mark('打开存储')
 
         # 画布
         self.canvas = tk.Canvas(self.window, height=300, width=200)
-        self.im = Image.open("image.jpeg")
-        new_width = 150
-        new_height = 120
-        self.im_resized = self.im.resize((new_width, new_height), Image.LANCZOS)
-        self.image_file = ImageTk.PhotoImage(self.im_resized)
+        # 缩小后的图片缓存为 PNG 文件，原图没有变化时不再解码和缩小 240 KB 的 JPEG
+        self.image_file = load_thumbnail("image.jpeg", (150, 120), master=self.window)
         self.image = self.canvas.create_image(50, 1, anchor='nw', image=self.image_file)
         self.canvas.pack(side='top')
 
@@ -52,61 +101,36 @@ class ExchangeSystemApp:
         self.btn_login.place(x=150, y=230)
         self.btn_sign_up = tk.Button(self.window, text='Sign up', command=self.usr_sign_up)
         self.btn_sign_up.place(x=250, y=230)
+        if timer is not None:
+            timer.mark('创建登录窗口')
 
-    def load_user_data(self):
-        '''
-        加载用户数据，如果文件不存在则创建一个新文件，并设置一个默认的管理员账户。
-        '''
-        try:
-            with open('usrs_info.pickle', 'rb') as usr_file:
-                usrs_info = pickle.load(usr_file)
-        except FileNotFoundError:
-            usrs_info = {'admin': {'password': '123456', 'status': 'approved', 'address': 'SJTU', 'contact': 'zhangsiyao618@163.com'}}
-            with open('usrs_info.pickle', 'wb') as usr_file:
-                pickle.dump(usrs_info, usr_file)
-        return usrs_info
-    
-    def load_item_types(self):
-        '''
-        加载物品类型数据，如果文件不存在则创建一个新文件，并设置默认的物品类型。
-        '''
-        try:
-            with open('item_types.pickle', 'rb') as file:
-                item_types = pickle.load(file)
-        except FileNotFoundError:
-            item_types = {'书籍': {'properties': ['作者','出版社']}, '食品': {'properties': ['生产日期','保质期']}, '工具': {'properties': ['品牌','型号']}}
-            with open('item_types.pickle', 'wb') as file:
-                pickle.dump(item_types, file)
-        return item_types
-
-    def save_item_types(self, item_types):
-        '''
-        保存物品类型数据到文件。
-        参数：
-        item_types (dict): 物品类型数据
-        '''
-        with open('item_types.pickle', 'wb') as file:
-            pickle.dump(item_types, file)
-
-    def load_item_info(self):
+    def close(self):
         '''
-        加载物品信息数据，如果文件不存在则返回空字典。
-        返回：
-        item_info_data(list): 物品信息数据
+        程序退出时写入尚未写入的改动，释放存储引擎和打分进程池。
         '''
-        try:
-            with open(self.item_info_file, "rb") as f:
-                self.item_info_data = pickle.load(f)
-        except (FileNotFoundError, EOFError):
-            self.item_info_data = []  # 如果没有数据文件，初始化为空列表
-        return self.item_info_data
+        self.service.close()
 
-    def save_item_info(self):
+    def when_loaded(self, action, widget=None):
         '''
-        保存物品信息到文件。
+        物品加载完成后再执行 action。物品还在后台加载时显示等待光标，每 100 毫秒检查一次，界面不会卡住。
+        参数：
+        action (function): 用到物品的操作，例如打开物品列表
+        widget (tk.Misc): 显示等待光标的窗口，默认为主窗口
         '''
-        with open(self.item_info_file, 'wb') as f:
-            pickle.dump(self.item_info_data, f)
+        widget = widget or self.window
+        if self.service.is_loaded():
+            action()
+            return
+        widget.config(cursor="watch")
+
+        def poll():
+            if not self.service.is_loaded():
+                self.window.after(100, poll)
+                return
+            if widget.winfo_exists():
+                widget.config(cursor="")
+                action()
+        self.window.after(100, poll)
 
     def usr_login(self):
         '''
@@ -115,25 +139,22 @@ class ExchangeSystemApp:
         '''
         usr_name = self.var_usr_name.get()
         usr_pwd = self.var_usr_pwd.get()
-        usrs_info = self.load_user_data()
-
-        if usr_name in usrs_info:
-            if usr_pwd == usrs_info[usr_name]['password']:
-                status = usrs_info[usr_name]['status']
-                if status == 'approved':
-                    self.window.withdraw()  # 隐藏登录窗口
-                    if usr_name == 'admin':
-                        self.admin_panel()
-                    else:
-                        self.user_panel(usr_name)
-                else:
-                    tk.messagebox.showinfo(message='错误提示：用户未审核通过，请联系管理员')
-            else:
-                tk.messagebox.showinfo(message='错误提示：密码不对，请重试')
-        else:
-            is_sign_up = tk.messagebox.askyesno('提示', '你还没有注册，请先注册')
+        try:
+            role = self.service.users.login(usr_name, usr_pwd)
+        except NotRegisteredError as e:
+            is_sign_up = tk.messagebox.askyesno('提示', str(e))
             if is_sign_up:
                 self.usr_sign_up()
+            return
+        except ServiceError as e:
+            tk.messagebox.showinfo(message=str(e))
+            return
+
+        self.window.withdraw()  # 隐藏登录窗口
+        if role == 'admin':
+            self.admin_panel()
+        else:
+            self.user_panel(usr_name)
 
     def usr_sign_up(self):
         '''
@@ -147,17 +168,13 @@ class ExchangeSystemApp:
             na = new_address.get()
             nc = new_contact.get()
 
-            usrs_info = self.load_user_data()
-            if np != npf:
-                tk.messagebox.showerror('错误提示', '密码和确认密码必须一样')
-            elif nn in usrs_info:
-                tk.messagebox.showerror('错误提示', '用户名已存在！')
-            else:
-                usrs_info[nn] = {'password': np, 'status': 'pending', 'address': na, 'contact': nc}
-                with open('usrs_info.pickle', 'wb') as usr_file:
-                    pickle.dump(usrs_info, usr_file)
-                tk.messagebox.showinfo('欢迎', '你已经成功注册，等待管理员审核')
-                window_sign_up.destroy()
+            try:
+                self.service.users.sign_up(nn, np, npf, na, nc)
+            except ServiceError as e:
+                tk.messagebox.showerror('错误提示', str(e))
+                return
+            tk.messagebox.showinfo('欢迎', '你已经成功注册，等待管理员审核')
+            window_sign_up.destroy()
 
         def cancel_sign_up():
             window_sign_up.destroy()
@@ -210,62 +227,61 @@ class ExchangeSystemApp:
             '''
             更新待审核用户的列表，将状态为 'pending' 的用户显示到列表框中。
             '''
-            self.user_listbox.delete(0, tk.END)  # 清空列表框
-            usrs_info = self.load_user_data()
-            # 筛选出状态为 'pending' 的用户
-            pending_users = [user for user, info in usrs_info.items() if info['status'] == 'pending']
-            # 将待审核用户显示到列表框中
-            for user in pending_users:
-                self.user_listbox.insert(tk.END, user)
+            # 通过状态索引取出状态为 'pending' 的用户，不必检查所有用户
+            pending_users = self.service.users.list(status='pending')
+            # 将待审核用户交给虚拟列表框，只显示可见的几行
+            self.user_listbox.set_rows(pending_users)
 
-        def approve_user():
+        def decide_users(decide, verb):
             '''
-            批准新用户注册成功，将用户状态改为 'approved'，并保存到文件中。
+            一次审核所有选中的用户：所有改动一次写入，审核完的用户直接从列表中移除，不重新读取待审核用户。
+            参数：
+            decide (function): self.service.users.approve_many 或 reject_many
+            verb (str): 提示中的动作，'审核通过' 或 '拒绝'
             '''
-            selected_user = self.user_listbox.get(tk.ACTIVE)  # 获取选中的用户
-            usrs_info = self.load_user_data()
-
-            if selected_user in usrs_info:
-                usrs_info[selected_user]['status'] = 'approved'
-                with open('usrs_info.pickle', 'wb') as usr_file:
-                    pickle.dump(usrs_info, usr_file)
-                tk.messagebox.showinfo(message=f'{selected_user} 已审核通过')
-                update_user_list()  # 更新用户列表
+            selected_users = self.user_listbox.selected_rows()
+            if not selected_users:
+                tk.messagebox.showinfo(message='请先选择用户（按住 Ctrl 或 Shift 可以多选）')
+                return
+            try:
+                decided = decide(selected_users)
+            except ServiceError as e:
+                tk.messagebox.showinfo(message=str(e))
+                update_user_list()  # 列表可能已经过时（例如用户被其他管理员处理）
+                return
+            self.user_listbox.remove_rows(decided)
+            if len(decided) == 1:
+                tk.messagebox.showinfo(message=f'{decided[0]} 已{verb}')
             else:
-                tk.messagebox.showinfo(message='用户不存在')
+                tk.messagebox.showinfo(message=f'{len(decided)} 个用户已{verb}')
 
-        def reject_user():
+        def approve_user():
             '''
-            拒绝新用户注册，将用户状态改为 'rejected'，并保存到文件中。
+            批准选中的用户注册，将用户状态改为 'approved'，并保存到文件中。
             '''
-            selected_user = self.user_listbox.get(tk.ACTIVE)  
-            usrs_info = self.load_user_data()
+            decide_users(self.service.users.approve_many, '审核通过')
 
-            if selected_user in usrs_info:
-                usrs_info[selected_user]['status'] = 'rejected'
-                with open('usrs_info.pickle', 'wb') as usr_file:
-                    pickle.dump(usrs_info, usr_file)
-                tk.messagebox.showinfo(message=f'{selected_user} 已拒绝')
-                update_user_list() 
-            else:
-                tk.messagebox.showinfo(message='用户不存在')
+        def reject_user():
+            '''
+            拒绝选中的用户注册，将用户状态改为 'rejected'，并保存到文件中。
+            '''
+            decide_users(self.service.users.reject_many, '拒绝')
 
         def view_user_info():
             '''
             查看用户信息，显示用户的地址、联系方式等信息。
             '''
-            selected_user = self.user_listbox.get(tk.ACTIVE)  # 获取选中的用户
-            usrs_info = self.load_user_data()
-
-            if selected_user in usrs_info:
-                user_info = usrs_info[selected_user]
-                info_text = f"用户名: {selected_user}\n" \
-                            f"地址: {user_info['address']}\n" \
-                            f"联系方式: {user_info['contact']}\n" \
-                            f"状态: {user_info['status']}"
-                tk.messagebox.showinfo(message=info_text)
-            else:
-                tk.messagebox.showinfo(message='用户不存在')  
+            selected_user = self.user_listbox.selected()  # 获取选中的用户
+            try:
+                user_info = self.service.users.get(selected_user)
+            except ServiceError as e:
+                tk.messagebox.showinfo(message=str(e))
+                return
+            info_text = f"用户名: {selected_user}\n" \
+                        f"地址: {user_info['address']}\n" \
+                        f"联系方式: {user_info['contact']}\n" \
+                        f"状态: {user_info['status']}"
+            tk.messagebox.showinfo(message=info_text)
 
         def display_user_list():
             '''
@@ -273,11 +289,8 @@ class ExchangeSystemApp:
             '''
             top = tk.Toplevel(admin_window)
             top.title("选择用户")
-            user_listbox = tk.Listbox(top, height=10, width=40)
+            user_listbox = VirtualListbox(top, self.service.users.list(), height=10, width=40)
             user_listbox.pack(pady=20)
-            users_info = self.load_user_data()
-            for user in users_info.keys():
-                user_listbox.insert(tk.END, user)
 
             def on_user_select(event):
                 '''
@@ -285,9 +298,11 @@ class ExchangeSystemApp:
                 参数：
                 event (tk.Event): 事件对象
                 '''
-                selected_user = user_listbox.get(tk.ACTIVE)  # 获取选中的用户
-                usrs_info = self.load_user_data()
-                user_info = usrs_info[selected_user]
+                selected_user = user_listbox.selected()  # 获取选中的用户
+                try:
+                    user_info = self.service.users.get(selected_user)
+                except ServiceError:
+                    return
                 info_text = f"用户名: {selected_user}\n" \
                             f"地址: {user_info['address']}\n" \
                             f"联系方式: {user_info['contact']}\n" \
@@ -295,7 +310,7 @@ class ExchangeSystemApp:
                 tk.messagebox.showinfo(message=info_text)
 
             # 绑定选中事件，点击Listbox中的一个用户名时会触发view_user_info
-            user_listbox.bind("<Double-1>", on_user_select)
+            user_listbox.bind_rows("<Double-1>", on_user_select)
 
         def add_item_type():
             '''
@@ -304,16 +319,14 @@ class ExchangeSystemApp:
             property_vars = [] 
             def save_new_type():
                 name = new_type_name.get()
-                properties = [property_var.get() for property_var in property_vars if property_var.get().strip() != ""] 
-                if name:
-                    item_types = self.load_item_types()
-                    item_types[name] = {'properties': properties}
-                    self.save_item_types(item_types)
-                    tk.messagebox.showinfo("成功", f"物品类型 '{name}' 添加成功！")
-                    new_type_window.destroy()
-                    update_item_types()
-                else:
-                    tk.messagebox.showerror("错误", "请输入物品类型名称")
+                try:
+                    self.service.item_types.add(name, [property_var.get() for property_var in property_vars])
+                except ServiceError as e:
+                    tk.messagebox.showerror("错误", str(e))
+                    return
+                tk.messagebox.showinfo("成功", f"物品类型 '{name}' 添加成功！")
+                new_type_window.destroy()
+                update_item_types()
 
             def add_property_input():
                 '''动态添加一个新的属性输入框'''
@@ -340,26 +353,6 @@ class ExchangeSystemApp:
             btn_save_type = tk.Button(new_type_window, text="保存", command=save_new_type)
             btn_save_type.pack(pady=5)
 
-        def update_items_with_new_properties(item_type_name, modified_properties):
-            '''
-            更新属于指定物品类型的所有物品，使其属性与新的物品类型属性同步。
-            参数:
-            item_type_name (str): 被修改的物品类型的名称。
-            modified_properties (list): 物品类型的新属性结构。
-            '''
-            new_properties = {}
-            for index, item in enumerate(self.item_info_data):
-                if item['type'] == item_type_name:
-                    old_properties = item['properties']
-                    for prop_name in modified_properties:
-                        if prop_name not in old_properties.keys():
-                            # 如果新属性在旧属性中不存在，添加新属性，并为其设置默认值（这里默认值可根据业务逻辑调整）
-                            new_properties[prop_name] = "未知"
-                        else:
-                            new_properties[prop_name] = old_properties[prop_name]
-                    self.item_info_data[index]['properties'] = new_properties
-            self.save_item_info()
-
         def modify_item_type():
             '''
             修改物品类型，选择一个物品类型后可以修改名称和属性，点击保存后将修改保存到文件中。
@@ -370,36 +363,22 @@ class ExchangeSystemApp:
                 保存修改后的物品类型，将原类型删除并添加新类型。
                 '''
                 selected_type = listbox_item_types.get(tk.ACTIVE)
-                modified_properties = []
-                if selected_type:
-                    new_name = new_type_name.get()
-                    modified_properties = [prop_var.get().strip() for prop_var in property_vars]
-                    modified_properties = [prop for prop in modified_properties if prop]  # 移除空属性
-                    if new_name and modified_properties:
-                        # 更新物品类型的名称和属性
-                        item_types = self.load_item_types()
-                        item_types[new_name] = {'properties': modified_properties}
-                        
-                        # 删除原来的物品类型
-                        if selected_type != new_name:
-                            del item_types[selected_type]
-                        
-                        self.save_item_types(item_types)
-                        tk.messagebox.showinfo("成功", f"物品类型 '{selected_type}' 修改为 '{new_name}'")
-                        modify_window.destroy()
-                    else:
-                        tk.messagebox.showerror("错误", "请输入新的物品类型名称和属性")
-                else:
-                    tk.messagebox.showerror("错误", "请选择要修改的物品类型")
-
-                update_items_with_new_properties(selected_type, modified_properties)
+                new_name = new_type_name.get()
+                try:
+                    # 服务层只写入物品类型的新版本，该类型的物品随后升级
+                    self.service.item_types.modify(selected_type, new_name, [prop_var.get() for prop_var in property_vars])
+                except ServiceError as e:
+                    tk.messagebox.showerror("错误", str(e))
+                    return
+                tk.messagebox.showinfo("成功", f"物品类型 '{selected_type}' 修改为 '{new_name}'")
+                modify_window.destroy()
 
             modify_window = tk.Toplevel(admin_window)
             modify_window.title("修改物品类型")
             modify_window.geometry("300x600")
 
             # 显示所有物品类型
-            item_types = list(self.load_item_types().keys())
+            item_types = self.service.item_types.names()
             listbox_item_types = tk.Listbox(modify_window)
             for item in item_types:
                 listbox_item_types.insert(tk.END, item)
@@ -417,8 +396,7 @@ class ExchangeSystemApp:
                     selected_type = listbox_item_types.get(selected_index)
                 if selected_type:
                     # 获取选中物品类型的属性
-                    item_types_data = self.load_item_types()
-                    properties = item_types_data[selected_type]['properties']
+                    properties = self.service.item_types.properties(selected_type)
                     new_type_name.set(selected_type)
                     # 清除之前的属性输入框
                     for widget in property_frame.winfo_children():
@@ -473,21 +451,21 @@ class ExchangeSystemApp:
 
         def update_item_types():
             '''
-            更新物品类型列表，将所有物品类型显示到列表框中。
+            更新物品类型列表，将所有物品类型显示到列表框中；物品类型没有变化时不重建列表。
             '''
-            listbox_item_types.delete(0, tk.END)
-            item_types = list(self.load_item_types().keys())
-            for item in item_types:
-                listbox_item_types.insert(tk.END, item)
+            nonlocal item_types_version
+            if item_types_version == self.service.item_types.version:
+                return
+            listbox_item_types.set_rows(self.service.item_types.names())
+            item_types_version = self.service.item_types.version
 
         def check_item_attribute():
             '''
             查看物品类型的属性，选择一个物品类型后会显示该类型的属性。
             '''
-            selected_type = listbox_item_types.get(tk.ACTIVE)
+            selected_type = listbox_item_types.selected()
             if selected_type:
-                item_types = self.load_item_types()
-                properties = item_types[selected_type]['properties']
+                properties = self.service.item_types.properties(selected_type)
                 properties_text = "\n".join(properties)
                 tk.messagebox.showinfo("物品属性", f"'{selected_type}' 的属性：\n{properties_text}")
                 update_item_types()
@@ -500,13 +478,11 @@ class ExchangeSystemApp:
             '''
             item_list_window = tk.Toplevel(admin_window)
             item_list_window.title('物品列表')
-            item_listbox = tk.Listbox(item_list_window, width=20, height=20)
+            # 虚拟列表框只取出可见的物品名称，输入文字时通过搜索索引筛选物品名称
+            item_listbox = VirtualListbox(item_list_window, self.service.items.all(), label=lambda item: item['物品名称'],
+                                          filter_rows=self.service.items.filter_by_name, width=20, height=20)
             item_listbox.pack(padx=10, pady=10)
 
-            # 将物品名称添加到列表框中
-            for item in self.item_info_data:
-                item_listbox.insert(tk.END, item['物品名称'])
-
             modify_button = tk.Button(item_list_window, text="修改信息", command=lambda: modify_item(item_listbox))
             modify_button.pack(padx=10, pady=5)
             delete_button = tk.Button(item_list_window, text="删除物品", command=lambda: delete_item(item_listbox))
@@ -517,21 +493,22 @@ class ExchangeSystemApp:
             修改物品信息，选择一个物品后可以修改物品的名称、描述、地址、联系方式等信息。
             输入框中显示原来的信息，修改后点击“保存修改”按钮保存修改。
             参数：
-            item_listbox (tk.Listbox): 物品列表框
+            item_listbox (VirtualListbox): 物品列表框
             '''
-            selected_index = item_listbox.curselection()
-            if not selected_index:
+            selected_item = item_listbox.selected()
+            if selected_item is None:
                 tk.messagebox.showwarning("警告", "请选择一个物品")
                 return
+            # 物品类型修改过时，先把物品的属性升级到当前版本
+            self.service.items.upgrade(selected_item)
 
-            selected_item = self.item_info_data[selected_index[0]]
             modify_window = tk.Toplevel(admin_window)
             modify_window.title("修改物品信息")
             entry_vars = {}
             row = 0
 
             for key, value in selected_item.items():
-                if key != 'type' and key != 'properties':  # 忽略物品类型和属性
+                if key not in ('id', 'type', 'properties', 'schema_version'):  # 忽略物品编号、类型、属性和版本号
                     label = tk.Label(modify_window, text=key)
                     label.grid(row=row, column=0, sticky="w", padx=10, pady=5)
                     entry_var = tk.StringVar(value=value)
@@ -564,16 +541,14 @@ class ExchangeSystemApp:
                 entry_vars['properties'] = properties_vars
 
             def save_changes():
-                for key, entry_var in entry_vars.items():
-                    if key == 'properties':  # 处理物品属性
-                        updated_properties = {k: v.get() for k, v in entry_var.items()}
-                        selected_item[key] = updated_properties
-                    else:
-                        selected_item[key] = entry_var.get()  
+                fields = {key: entry_var.get() for key, entry_var in entry_vars.items() if key != 'properties'}
+                updated_properties = None
+                if 'properties' in entry_vars:  # 处理物品属性
+                    updated_properties = {k: v.get() for k, v in entry_vars['properties'].items()}
 
                 # 保存更新后的数据
-                self.item_info_data[selected_index[0]] = selected_item
-                self.save_item_info()
+                self.service.items.modify(selected_item, fields, updated_properties)
+                item_listbox.refresh()
 
                 messagebox.showinfo("成功", "物品信息已更新")
                 modify_window.destroy()  # 关闭修改窗口
@@ -586,32 +561,81 @@ class ExchangeSystemApp:
             '''
             删除物品，选择一个物品后点击“删除物品”按钮可以删除物品。
             参数：
-            item_listbox (tk.Listbox): 物品列表框
+            item_listbox (VirtualListbox): 物品列表框
             '''
-            selected_index = item_listbox.curselection()
-            if not selected_index:
+            selected_item = item_listbox.selected()
+            if selected_item is None:
                 tk.messagebox.showwarning("警告", "请选择一个物品")
                 return
-            item_name = self.item_info_data[selected_index[0]]['物品名称']
+            item_name = selected_item['物品名称']
             confirmation = messagebox.askyesno("确认删除", f"确定要删除物品 '{item_name}' 吗？")
             # 如果用户确认删除
             if confirmation:
-                self.item_info_data.pop(selected_index[0])
-                self.save_item_info()
+                self.service.items.delete(selected_item)
                 tk.messagebox.showinfo("成功", f"物品 '{item_name}' 已删除！")
-                item_listbox.delete(selected_index)
+                item_listbox.set_rows(self.service.items.all())
+
+        def import_items():
+            '''
+            从 CSV 或 JSONL 文件批量导入物品；有错误的行时询问是否跳过这些行。
+            '''
+            path = filedialog.askopenfilename(parent=admin_window, title="批量导入物品",
+                                              filetypes=[("CSV 文件", "*.csv"), ("JSONL 文件", "*.jsonl"), ("所有文件", "*.*")])
+            if not path:
+                return
+            admin_window.config(cursor="watch")
+            admin_window.update_idletasks()
+            try:
+                try:
+                    imported, errors = import_file(self.service, path)
+                except ImportValidationError as e:
+                    if not tk.messagebox.askyesno("导入失败", f"{e}\n\n是否跳过有错误的行，只导入正确的行？"):
+                        return
+                    imported, errors = import_file(self.service, path, skip_invalid=True)
+            except (ServiceError, OSError) as e:
+                tk.messagebox.showerror("错误", str(e))
+                return
+            finally:
+                admin_window.config(cursor="")
+            tk.messagebox.showinfo("成功", f"导入了 {imported} 个物品，跳过了 {len(errors)} 行")
+
+        def export_items():
+            '''
+            把物品导出到 CSV 或 JSONL 文件；在物品类型列表中选中了类型时只导出该类型的物品。
+            '''
+            item_type = listbox_item_types.selected()
+            path = filedialog.asksaveasfilename(parent=admin_window, title=f"导出物品（{item_type or '全部类型'}）",
+                                                defaultextension=".csv",
+                                                filetypes=[("CSV 文件", "*.csv"), ("JSONL 文件", "*.jsonl")])
+            if not path:
+                return
+            admin_window.config(cursor="watch")
+            admin_window.update_idletasks()
+            try:
+                count = export_file(self.service, path, item_type)
+            except (ServiceError, OSError) as e:
+                tk.messagebox.showerror("错误", str(e))
+                return
+            finally:
+                admin_window.config(cursor="")
+            tk.messagebox.showinfo("成功", f"导出了 {count} 个物品")
 
         def logout():
             '''
-            退出管理员面板，返回登录窗口。
+            退出管理员面板，返回登录窗口；尚未写入的改动在退出时写入。
             '''
+            try:
+                self.service.flush()
+            except (ServiceError, OSError) as e:
+                # 没写入的改动仍由后台重试，不妨碍退出
+                tk.messagebox.showerror("错误", f"保存改动失败：{e}")
             admin_window.destroy()
             self.window.deiconify()  # 显示登录窗口
 
         btn_logout = tk.Button(admin_window, text="退出", command=logout)
         btn_logout.pack(pady=10)
 
-        btn_view_items = tk.Button(admin_window, text="查看物品列表", command=view_items)
+        btn_view_items = tk.Button(admin_window, text="查看物品列表", command=lambda: self.when_loaded(view_items, admin_window))
         btn_view_items.pack(pady=10)
 
         listbox_frame = tk.Frame(admin_window)
@@ -619,13 +643,14 @@ class ExchangeSystemApp:
 
         # 显示待审核用户列表
         tk.Label(listbox_frame, text="待审核用户列表").grid(row=0, column=0, padx=10, pady=10)
-        self.user_listbox = tk.Listbox(listbox_frame, height=10, width=30)
+        self.user_listbox = VirtualListbox(listbox_frame, height=10, width=30, selectmode='extended')
         self.user_listbox.grid(row=1, column=0, padx=10, pady=10)
 
         # 显示物品类型列表
         tk.Label(listbox_frame, text="物品类型列表").grid(row=0, column=1, padx=10, pady=10)
-        listbox_item_types = tk.Listbox(listbox_frame, height=10, width=30)
+        listbox_item_types = VirtualListbox(listbox_frame, height=10, width=30)
         listbox_item_types.grid(row=1, column=1, padx=10, pady=20)
+        item_types_version = None  # 列表框中显示的物品类型对应的版本号
 
         update_user_list()
         update_item_types()
@@ -638,7 +663,9 @@ class ExchangeSystemApp:
         btn_view_info = tk.Button(left_buttons_frame, text="查看用户信息", command=view_user_info)
         btn_view_info.pack(pady=5,padx = 70)
 
-        # 审核通过/拒绝按钮
+        # 审核通过/拒绝按钮，作用于所有选中的用户
+        btn_select_all = tk.Button(left_buttons_frame, text="全选", command=lambda: self.user_listbox.select_all())
+        btn_select_all.pack(pady=5)
         btn_approve = tk.Button(left_buttons_frame, text="批准", command=approve_user)
         btn_approve.pack(pady=5)
         btn_reject = tk.Button(left_buttons_frame, text="拒绝", command=reject_user)
@@ -656,11 +683,17 @@ class ExchangeSystemApp:
         btn_attribute_info =  tk.Button(right_buttons_frame, text="查看属性", command=check_item_attribute)
         btn_attribute_info.pack(pady=5, padx = 70)
         
-        btn_add_type = tk.Button(right_buttons_frame, text="添加物品类型", command=add_item_type)
+        btn_add_type = tk.Button(right_buttons_frame, text="添加物品类型", command=lambda: self.when_loaded(add_item_type, admin_window))
         btn_add_type.pack(pady=5)
 
-        btn_modify_type = tk.Button(right_buttons_frame, text="修改物品类型", command=modify_item_type)
+        btn_modify_type = tk.Button(right_buttons_frame, text="修改物品类型", command=lambda: self.when_loaded(modify_item_type, admin_window))
         btn_modify_type.pack(pady=5)
+
+        # 批量导入和导出物品
+        btn_import_items = tk.Button(right_buttons_frame, text="批量导入物品", command=lambda: self.when_loaded(import_items, admin_window))
+        btn_import_items.pack(pady=5)
+        btn_export_items = tk.Button(right_buttons_frame, text="导出物品", command=lambda: self.when_loaded(export_items, admin_window))
+        btn_export_items.pack(pady=5)
         
 
     def user_panel(self, usr_name):
@@ -708,10 +741,28 @@ class ExchangeSystemApp:
         row += 1  
 
         tk.Label(user_window, text="选择物品类别").grid(row=row, column=0, sticky='w', padx=10, pady=5)
-        item_types = list(self.load_item_types().keys())
+        item_types = self.service.item_types.names()
         item_type_menu = tk.OptionMenu(user_window, item_type_var, *item_types)
         item_type_menu.grid(row=row, column=1, padx=10, pady=5)
         row += 1  
+        menu_version = self.service.item_types.version
+
+        def refresh_type_menu(event=None):
+            '''
+            物品类型的版本号变化后重建下拉菜单，没有变化时什么也不做。
+            参数：
+            event (tk.Event): 事件对象
+            '''
+            nonlocal menu_version
+            if menu_version == self.service.item_types.version:
+                return
+            menu = item_type_menu['menu']
+            menu.delete(0, tk.END)
+            for name in self.service.item_types.names():
+                menu.add_command(label=name, command=tk._setit(item_type_var, name))
+            menu_version = self.service.item_types.version
+
+        item_type_menu.bind('<Button-1>', refresh_type_menu)
 
         # 用于动态展示属性输入框
         property_vars = []
@@ -729,8 +780,7 @@ class ExchangeSystemApp:
             selected_type = item_type_var.get()
             if selected_type:
                 # 获取物品类别的属性
-                item_types_data = self.load_item_types()
-                properties = item_types_data[selected_type]['properties']
+                properties = self.service.item_types.properties(selected_type)
                 
                 # 动态创建属性输入框
                 nonlocal property_vars
@@ -758,41 +808,22 @@ class ExchangeSystemApp:
             添加物品，点击“添加物品”按钮后将物品信息保存到文件中。
             '''
             item_name = item_name_var.get()
-            item_desc = item_desc_var.get()
-            item_address = item_address_var.get()
-            item_phone = item_phone_var.get()
-            item_email = item_email_var.get()
-            item_type = item_type_var.get()
-
-            # 检查是否填写了必填字段
-            if not item_name or not item_desc or not item_address or not item_phone or not item_email or not item_type:
-                tk.messagebox.showerror("错误", "所有字段必须填写！")
-                return
-            
-            property_names = self.load_item_types()[item_type]['properties']
-            properties = {property_names[i]: property_var.get() for i, property_var in enumerate(property_vars)}
-
-            # 检查是否有空值
-            if any(value == "" for value in properties.values()):
-                tk.messagebox.showerror("错误", "所有属性字段必须填写！")
-                return
-
-            # 存储物品信息
-            item_info = {
+            fields = {
                 '物品名称': item_name,
-                '物品描述': item_desc,
-                '物品地址': item_address,
-                '联系人手机': item_phone,
-                '邮箱': item_email,
-                'type': item_type,
-                'properties': properties
+                '物品描述': item_desc_var.get(),
+                '物品地址': item_address_var.get(),
+                '联系人手机': item_phone_var.get(),
+                '邮箱': item_email_var.get(),
             }
-            self.item_info_data.append(item_info)
-            with open(self.item_info_file, "wb") as f:
-                pickle.dump(self.item_info_data, f)
+            # 检查必填字段并存储物品信息
+            try:
+                self.service.items.add(item_type_var.get(), fields, [property_var.get() for property_var in property_vars])
+            except ServiceError as e:
+                tk.messagebox.showerror("错误", str(e))
+                return
             tk.messagebox.showinfo("成功", f"物品 '{item_name}' 已成功添加！")
 
-        btn_add_item = tk.Button(user_window, text="添加物品", command=add_item)
+        btn_add_item = tk.Button(user_window, text="添加物品", command=lambda: self.when_loaded(add_item, user_window))
         btn_add_item.grid(row=row, column=1, padx=10, pady=5)
         row += 1    
 
@@ -800,14 +831,15 @@ class ExchangeSystemApp:
             '''
             搜索物品，弹出搜索窗口，用户可以选择物品类型和输入关键字搜索物品，如果找到匹配的物品则显示物品信息。
             匹配规则：物品名称和描述的相似度高于阈值则认为匹配成功。
+            搜索结果显示在搜索窗口下方，边输入边搜索时每次搜索的结果替换上一次的结果，不会每次都弹出新窗口。
             '''
             search_window = tk.Toplevel(self.window)
             search_window.title('搜索物品')
-            search_window.geometry('500x300')
+            search_window.geometry('560x560')
 
             # 选择物品类型
             item_type_var = tk.StringVar()
-            item_types = list(self.load_item_types().keys())  # 获取物品类型
+            item_types = self.service.item_types.names()  # 获取物品类型
             tk.Label(search_window, text="选择物品类型").grid(row=0, column=0, padx=10, pady=5, sticky='w')
             item_type_menu = tk.OptionMenu(search_window, item_type_var, *item_types)
             item_type_menu.grid(row=0, column=1, padx=10, pady=5)
@@ -818,44 +850,102 @@ class ExchangeSystemApp:
             keyword_entry = tk.Entry(search_window, textvariable=keyword_var)
             keyword_entry.grid(row=1, column=1, padx=10, pady=5)
 
-            def perform_search():
+            status_var = tk.StringVar()
+            tk.Label(search_window, textvariable=status_var).grid(row=3, column=0, columnspan=2, padx=10, pady=5, sticky='w')
+
+            # 搜索在后台线程中进行，结果通过 after() 逐批送回界面，搜索期间窗口可以正常操作
+            worker = SearchWorker(search_window, self.service.search.search)
+            found = 0
+            typing_job = None
+
+            def format_item(i, item):
                 '''
-                执行搜索
+                按格式输出一个物品的信息，只对当前页的物品调用。
+                参数：
+                i (int): 物品在结果中的序号
+                item (dict): 物品信息
                 '''
+                item_info = f"物品 {i+1}: {item['物品名称']}" + "\n" + "\n".join([f"{key}: {value}" for key, value in item.items() if key not in ('id', '物品名称', 'type', 'properties', 'schema_version')]) 
+                return item_info + "\n" + "\n".join([f"{key}: {value}" for key, value in item['properties'].items()])
+
+            def perform_search(from_button=True):
+                '''
+                执行搜索，取消还在进行的上一次搜索。
+                参数：
+                from_button (bool): 是否由“搜索”按钮触发；边输入边搜索时不弹出提示框
+                '''
+                nonlocal found
                 item_type = item_type_var.get()
                 keyword = keyword_var.get()
                 threshold = 50  # 相似度阈值
-                if not item_type or not keyword:
-                    tk.messagebox.showerror("错误", "物品类型和关键字不能为空！")
+                if not from_button and (not item_type or not keyword):
+                    worker.cancel()
+                    status_var.set('')
+                    results_view.clear()
                     return
 
-                all_items = self.load_item_info()
-                filtered_items = []
-                for item in all_items:
-                    if item['type'] == item_type:
-                        # 计算物品名称和关键字的相似度
-                        name_match_score = fuzz.partial_ratio(keyword, item['物品名称'])
-                        desc_match_score = fuzz.partial_ratio(keyword, item['物品描述'])
-                        
-                        # 如果相似度高于阈值，则认为匹配成功
-                        if name_match_score >= threshold or desc_match_score >= threshold:
-                            filtered_items.append(item)
-
-                if filtered_items:
-                    result_text = ""
-                    for i, item in enumerate(filtered_items):
-                        # 对于每个物品，按格式输出属性
-                        item_info = f"物品 {i+1}: {item['物品名称']}" + "\n" + "\n".join([f"{key}: {value}" for key, value in item.items() if key != '物品名称' and key != 'type' and key != 'properties']) 
-                        item_info = item_info + "\n" + "\n".join([f"{key}: {value}" for key, value in item['properties'].items()])
-                        result_text += item_info + "\n\n"  
-                    tk.messagebox.showinfo("搜索结果", result_text.strip())  # 去掉末尾的多余换行
-                else:
-                    tk.messagebox.showinfo("没有结果", "未找到符合条件的物品。")
+                found = 0
+                results_view.reset()
+                # 物品还在后台加载时，搜索线程会等加载完成后再开始
+                status_var.set('正在搜索…' if self.service.is_loaded() else '物品信息正在加载，加载完成后开始搜索…')
+
+                def on_batch(items):
+                    nonlocal found
+                    found += len(items)
+                    results_view.extend(items)
+                    status_var.set(f'正在搜索…已找到 {found} 个物品')
+
+                def on_done():
+                    results_view.finish()
+                    if found:
+                        status_var.set(f'找到 {found} 个物品')
+                    else:
+                        status_var.set('未找到符合条件的物品。')
+                        if from_button:
+                            tk.messagebox.showinfo("没有结果", "未找到符合条件的物品。")
+
+                def on_error(error):
+                    status_var.set('')
+                    if isinstance(error, ServiceError):
+                        tk.messagebox.showerror("错误", str(error))
+                    else:
+                        tk.messagebox.showerror("错误", f"搜索失败：{error}")
+
+                # 物品名称或描述与关键字的相似度高于阈值，则认为匹配成功；结果按需逐批计算，候选物品较多时多进程并行计算
+                worker.submit((item_type, keyword, threshold), on_batch, on_done, on_error)
+
+            def on_input_changed(*args):
+                '''
+                边输入边搜索：输入停顿 300 毫秒后再搜索，避免每输入一个字就搜索一次。
+                '''
+                nonlocal typing_job
+                if typing_job is not None:
+                    search_window.after_cancel(typing_job)
+                typing_job = search_window.after(300, on_typing_paused)
+
+            def on_typing_paused():
+                nonlocal typing_job
+                typing_job = None
+                perform_search(from_button=False)
+
+            def on_close(event):
+                if event.widget is search_window:
+                    worker.close()
+
+            keyword_var.trace('w', on_input_changed)
+            item_type_var.trace('w', on_input_changed)
+            search_window.bind('<Destroy>', on_close)
 
             # 搜索按钮
             search_button = tk.Button(search_window, text="搜索", command=perform_search)
             search_button.grid(row=2, column=1, padx=10, pady=10)
 
+            # 搜索结果
+            results_view = PagedResultsView(search_window, None, None, format_item)
+            results_view.window.grid(row=4, column=0, columnspan=2, sticky='nsew')
+            search_window.grid_rowconfigure(4, weight=1)
+            results_view.clear()
+
         # 搜索物品按钮
         btn_search = tk.Button(user_window, text="搜索物品", command=search_item)
         btn_search.grid(row=row, column=1, padx=10, pady=5)
@@ -863,8 +953,13 @@ class ExchangeSystemApp:
 
         def logout():
             '''
-            退出用户面板，返回登录窗口。
+            退出用户面板，返回登录窗口；尚未写入的改动在退出时写入。
             '''
+            try:
+                self.service.flush()
+            except (ServiceError, OSError) as e:
+                # 没写入的改动仍由后台重试，不妨碍退出
+                tk.messagebox.showerror("错误", f"保存改动失败：{e}")
             user_window.destroy()  # 关闭用户面板
             self.window.deiconify()  # 显示登录窗口
 
@@ -873,6 +968,28 @@ class ExchangeSystemApp:
         
 # 主程序
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='物品复活软件')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite'], default='pickle', help='存储引擎')
+    parser.add_argument('--write-delay', type=float, default=0.1, help='延迟写入的时间窗口（秒），0 表示每次改动立即写入')
+    parser.add_argument('--server', help='物品服务进程的地址（例如 http://127.0.0.1:8765），指定时以瘦客户端模式运行')
+    parser.add_argument('--startup-timing', action='store_true', help='打印启动各阶段的耗时，登录窗口显示后立即退出')
+    args = parser.parse_args()
+
+    timer = StartupTimer(STARTUP_START) if args.startup_timing else None
+    if timer is not None:
+        timer.mark('导入模块')
     root = tk.Tk()
-    app = ExchangeSystemApp(root)
-    root.mainloop()
\ No newline at end of file
+    if timer is not None:
+        timer.mark('创建主窗口')
+    app = ExchangeSystemApp(root, storage=args.storage, write_delay=args.write_delay, server=args.server, timer=timer)
+    if timer is None:
+        root.mainloop()
+    else:
+        # 处理完所有待处理的事件（包括绘制），登录窗口就已经显示出来了
+        root.update()
+        timer.mark('显示登录窗口')
+        app.service.wait_loaded()
+        timer.mark('后台加载物品')
+        timer.report()
+        root.destroy()
+    app.close()
\ No newline at end of file
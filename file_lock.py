@@ -0,0 +1,169 @@
+"""
+多个程序共享同一个数据目录
+前台的多台自助机和管理员的电脑可以同时运行 exchange_sys_new.py，使用同一个数据目录。这里提供三样工具：
+1. FileLock：跨进程的文件锁（POSIX 上用 fcntl.flock，Windows 上用 msvcrt.locking），同一进程内的线程之间也互斥，可以重入。
+2. atomic_write：先写临时文件再改名替换，其他程序只会读到完整的旧文件或完整的新文件。
+3. SharedCounter：保存在文件中的计数器，在文件锁中预留编号，多个程序分配的物品编号不会重复。
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            # LK_LOCK 最多重试 10 秒，其他程序持有锁更久时继续等待
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    def __init__(self, path):
+        '''
+        初始化函数
+        参数：
+        path (str): 锁文件路径，不存在时自动创建；文件内容没有意义
+        '''
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        '''
+        获得锁，其他程序或其他线程持有锁时等待。同一线程可以重复获得。
+        '''
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, 'a+b')
+                _lock_file(self._file)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        '''
+        释放锁。
+        '''
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_file(self._file)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def close(self):
+        '''
+        关闭锁文件（不删除，其他程序可能正在使用）。
+        '''
+        with self._thread_lock:
+            if self._file is not None and self._depth == 0:
+                self._file.close()
+                self._file = None
+
+
+def temp_path(path):
+    '''
+    参数：
+    path (str): 目标文件路径
+    返回：
+    tmp_file (str): 同目录下的临时文件路径，每个进程的每个线程各不相同
+    '''
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+def atomic_write(path, dump, sync=True):
+    '''
+    原子地替换文件：先由 dump 写入临时文件，再改名为目标文件；写入失败时删除临时文件，目标文件保持不变。
+    参数：
+    path (str): 目标文件路径
+    dump (function): dump(file)，向以二进制方式打开的文件写入内容
+    sync (bool): 改名之前是否把临时文件刷新到磁盘
+    '''
+    tmp_file = temp_path(path)
+    try:
+        with open(tmp_file, 'wb') as f:
+            dump(f)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            os.remove(tmp_file)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class SharedCounter:
+    def __init__(self, path, lock):
+        '''
+        初始化函数
+        参数：
+        path (str): 保存下一个编号的文件路径
+        lock (FileLock): 保护该文件的文件锁
+        '''
+        self.path = path
+        self.lock = lock
+        self._fd = None
+
+    def reserve(self, count=1, minimum=1):
+        '''
+        预留连续的 count 个编号。
+        参数：
+        count (int): 编号个数
+        minimum (int): 最小的编号（例如已有物品的最大编号加一），计数器落后时从这里开始
+        返回：
+        first (int): 预留的第一个编号，预留的是 first 到 first + count - 1
+        '''
+        with self.lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+            # 文件只有几个字节并且只在锁中读写，直接原地改写，不必每次都写临时文件再改名
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            try:
+                first = int(os.read(self._fd, 32) or 0)
+            except ValueError:
+                first = 0
+            first = max(first, minimum)
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.write(self._fd, str(first + count).encode().ljust(20))
+        return first
+
+    def close(self):
+        '''
+        关闭计数器文件。
+        '''
+        with self.lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,355 @@
+"""
+物品追加日志
+物品信息以 item_info.pickle 作为快照，每次添加、修改、删除只向同目录下的 item_info.pickle.log 追加一条记录，
+写入代价只与本次改动的大小有关，而与物品总数无关。启动时先读取快照再回放日志；日志超过阈值后在后台线程中合并（压缩）回快照。
+每条记录都以物品编号（id）为键，回放是幂等的，所以合并过程中途退出也不会丢失或重复数据。
+日志还记录了已经读到的位置，其他程序追加的记录可以只读取新增的部分（见 changes）。
+多个程序可以同时使用同一份日志：追加、轮换、合并和重写快照都在文件锁（item_info.pickle.lock）中进行，
+物品编号从共享的计数器（item_info.pickle.ids）中分配，不同程序添加的物品不会使用相同的编号。
+"""
+import os
+import pickle
+import threading
+
+from file_lock import FileLock, SharedCounter, atomic_write, temp_path
+from item_model import pack_items
+
+
+def file_stamp(path):
+    '''
+    文件的变化标记。
+    参数：
+    path (str): 文件路径
+    返回：
+    stamp (tuple): 文件的修改时间和大小，文件不存在时返回 None
+    '''
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def file_inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+class ItemLog:
+    def __init__(self, snapshot_file, compact_threshold=4 * 1024 * 1024):
+        '''
+        初始化函数
+        参数：
+        snapshot_file (str): 快照文件路径，即 item_info.pickle
+        compact_threshold (int): 日志文件超过该字节数后触发后台合并
+        '''
+        self.snapshot_file = snapshot_file
+        self.log_file = snapshot_file + '.log'
+        self.compacting_file = self.log_file + '.compacting'
+        self.compact_threshold = compact_threshold
+        self.next_id = 1
+        self._lock = threading.Lock()
+        self.file_lock = FileLock(snapshot_file + '.lock')
+        self.ids = SharedCounter(snapshot_file + '.ids', self.file_lock)
+        self._log = None
+        self._compactor = None
+        # 内存中的数据已经包含的内容：快照的变化标记、日志文件的 inode 和已读到的位置
+        self._snapshot_stamp = None
+        self._log_inode = None
+        self.offset = 0
+        # 内存中的数据是否包含待合并日志中的全部记录；不包含时合并后不能认为内存与新快照一致
+        self._compacting_loaded = False
+
+    def load(self):
+        '''
+        加载快照并按顺序回放日志，没有编号的旧物品会按顺序补上编号。
+        返回：
+        items (list): 物品信息数据
+        '''
+        # 在文件锁中读取：回放时会截掉末尾写了一半的记录，不能截掉其他程序正在写入的记录
+        with self.file_lock:
+            self._snapshot_stamp = file_stamp(self.snapshot_file)
+            items = self._read_snapshot()
+            self._replay(self.compacting_file, items)
+            self._log_inode = file_inode(self.log_file)
+            self.offset = self._replay(self.log_file, items)
+            self.next_id = max(items.keys(), default=0) + 1
+            # 上次合并未完成，留下的日志在后台继续合并
+            if os.path.exists(self.compacting_file):
+                self._compacting_loaded = True
+                self._start_compactor()
+        items = list(items.values())
+        # 多个程序同时写入时，先分配编号的物品可能后写入日志；物品列表要按编号排列
+        if any(items[i]['id'] > items[i + 1]['id'] for i in range(len(items) - 1)):
+            items.sort(key=lambda item: item['id'])
+        return items
+
+    def allocate_id(self):
+        '''
+        分配一个新的物品编号。
+        返回：
+        item_id (int): 物品编号
+        '''
+        return self.allocate_ids(1)[0]
+
+    def allocate_ids(self, count):
+        '''
+        从共享的计数器中一次分配多个编号。
+        参数：
+        count (int): 编号个数
+        返回：
+        item_ids (range): 物品编号
+        '''
+        with self._lock:
+            first = self.ids.reserve(count, self.next_id)
+            self.next_id = first + count
+        return range(first, first + count)
+
+    def add(self, item):
+        '''
+        追加一条添加记录；物品还没有编号时为其分配编号。
+        参数：
+        item (dict): 物品信息
+        '''
+        if 'id' not in item:
+            item['id'] = self.allocate_id()
+        self._append(('add', item['id'], item))
+
+    def modify(self, item):
+        '''
+        追加一条修改记录，记录物品修改后的完整内容。
+        参数：
+        item (dict): 修改后的物品信息
+        '''
+        self._append(('modify', item['id'], item))
+
+    def delete(self, item):
+        '''
+        追加一条删除记录。
+        参数：
+        item (dict): 被删除的物品信息
+        '''
+        self._append(('delete', item['id'], None))
+
+    def append(self, records):
+        '''
+        一次追加多条记录，只写入和刷新一次文件（用于成组提交）。
+        参数：
+        records (list): (操作, 物品编号, 物品信息) 组成的列表，删除记录的物品信息为 None
+        '''
+        with self._lock:
+            for _, item_id, _ in records:
+                self.next_id = max(self.next_id, item_id + 1)
+        self._append(*records)
+
+    def changes(self):
+        '''
+        读取上次读取之后其他程序追加到日志中的记录。
+        返回：
+        records (list): (操作, 物品编号, 物品信息) 组成的列表；快照被重写或日志被轮换时无法只读取增量，返回 None
+        '''
+        with self._lock:
+            if file_stamp(self.snapshot_file) != self._snapshot_stamp:
+                return None
+            inode = file_inode(self.log_file)
+            if inode != self._log_inode:
+                if self._log_inode is not None:
+                    return None
+                # 日志是其他程序新建的，从头读取
+                self._log_inode, self.offset = inode, 0
+            if inode is None:
+                return []
+            records = []
+            self.offset = self._read_records(self.log_file, self.offset, records.append)
+            for _, item_id, _ in records:
+                self.next_id = max(self.next_id, item_id + 1)
+            return records
+
+    def rewrite(self, items):
+        '''
+        把完整的物品列表直接写成快照并清空日志（用于一次性全量保存）。
+        参数：
+        items (list): 物品信息数据
+        '''
+        self._wait_compactor()
+        missing = [item for item in items if 'id' not in item]
+        for item, item_id in zip(missing, self.allocate_ids(len(missing))):
+            item['id'] = item_id
+        with self._lock, self.file_lock:
+            atomic_write(self.snapshot_file, lambda f: pickle.dump(pack_items(items), f))
+            self._snapshot_stamp = file_stamp(self.snapshot_file)
+            self._close_log()
+            for path in (self.compacting_file, self.log_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._log_inode, self.offset = None, 0
+
+    def close(self):
+        '''
+        关闭日志文件，并等待正在进行的后台合并结束。
+        '''
+        self._wait_compactor()
+        with self._lock:
+            self._close_log()
+        self.ids.close()
+        self.file_lock.close()
+
+    def _append(self, *records):
+        with self._lock, self.file_lock:
+            if self._log is not None and os.fstat(self._log.fileno()).st_ino != file_inode(self.log_file):
+                # 其他程序轮换了日志，改为追加到新的日志文件；内存中的数据会在下次 changes 时重新加载
+                self._close_log()
+            if self._log is None:
+                self._log = open(self.log_file, 'ab')
+                if self._log_inode is None:
+                    self._log_inode = os.fstat(self._log.fileno()).st_ino
+            size_before = os.fstat(self._log.fileno()).st_size
+            for record in records:
+                pickle.dump(record, self._log)
+            self._log.flush()
+            size = self._log.tell()
+            # 期间没有其他程序追加记录时，自己写入的记录不需要再读回来
+            if size_before == self.offset:
+                self.offset = size
+        if size >= self.compact_threshold:
+            self._rotate()
+
+    def _close_log(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _rotate(self):
+        '''
+        把当前日志改名为待合并日志，之后的记录写入新的日志文件，再启动后台合并。
+        '''
+        with self._lock, self.file_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            # 上一次的待合并日志还没处理完时先合并它，当前日志留到下一次
+            if not os.path.exists(self.compacting_file):
+                stamp = file_stamp(self.log_file)
+                if stamp is None or stamp[1] < self.compact_threshold:
+                    return  # 其他程序刚刚轮换过日志
+                # 其他程序追加的记录还没有读入时（offset 落在日志末尾之前），内存中的数据不包含整个待合并日志
+                self._compacting_loaded = self._log_inode == file_inode(self.log_file) and self.offset == stamp[1]
+                self._close_log()
+                os.replace(self.log_file, self.compacting_file)
+                self._log_inode, self.offset = None, 0
+            else:
+                self._compacting_loaded = False
+            self._start_compactor()
+
+    def _start_compactor(self):
+        self._compactor = threading.Thread(target=self._compact, name='item-log-compactor', daemon=True)
+        self._compactor.start()
+
+    def _wait_compactor(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def _compact(self):
+        '''
+        后台合并：只读取磁盘上的快照和待合并日志，不触碰界面线程正在使用的内存数据。
+        几个程序可能同时合并同一份待合并日志，只有第一个完成的程序替换快照，其余的放弃自己的结果。
+        '''
+        with self.file_lock:
+            compacting_inode = file_inode(self.compacting_file)
+            snapshot_stamp = file_stamp(self.snapshot_file)
+        if compacting_inode is None:
+            return
+        items = self._read_snapshot()
+        self._replay(self.compacting_file, items, truncate=False)
+        tmp_file = self._write_snapshot(list(items.values()))
+        with self._lock, self.file_lock:
+            if file_inode(self.compacting_file) != compacting_inode or file_stamp(self.snapshot_file) != snapshot_stamp:
+                os.remove(tmp_file)
+                return
+            os.replace(tmp_file, self.snapshot_file)
+            # 合并前内存中的数据已经包含快照和待合并日志时，合并后仍然一致，不需要重新加载；
+            # 否则保留原来的变化标记，下次 changes 返回 None，由调用方重新加载
+            if self._snapshot_stamp == snapshot_stamp and self._compacting_loaded:
+                self._snapshot_stamp = file_stamp(self.snapshot_file)
+            os.remove(self.compacting_file)
+
+    def _read_snapshot(self):
+        '''
+        读取快照文件。
+        返回：
+        items (dict): 物品编号到物品信息的有序字典
+        '''
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                data = pickle.load(f)
+        except (FileNotFoundError, EOFError):
+            data = []
+        items = {}
+        next_id = max((item.get('id', 0) for item in data), default=0) + 1
+        for item in data:
+            if 'id' not in item:
+                item['id'] = next_id
+                next_id += 1
+            items[item['id']] = item
+        return items
+
+    def _write_snapshot(self, items):
+        '''
+        把物品列表按列写入临时文件，由调用方替换快照文件。
+        返回：
+        tmp_file (str): 临时文件路径
+        '''
+        tmp_file = temp_path(self.snapshot_file)
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(pack_items(items), f)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_file
+
+    def _replay(self, path, items, truncate=True):
+        '''
+        按顺序回放一个日志文件。
+        参数：
+        path (str): 日志文件路径
+        items (dict): 物品编号到物品信息的有序字典，回放结果直接写入其中
+        truncate (bool): 是否截掉末尾写了一半的记录（只在持有文件锁时截掉）
+        返回：
+        offset (int): 回放到的位置
+        '''
+        def apply(record):
+            op, item_id, item = record
+            if op == 'delete':
+                items.pop(item_id, None)
+            else:
+                items[item_id] = item
+        return self._read_records(path, 0, apply, truncate=truncate)
+
+    def _read_records(self, path, offset, callback, truncate=False):
+        '''
+        从指定位置开始按顺序读取日志记录，只读取完整的记录。
+        参数：
+        path (str): 日志文件路径
+        offset (int): 开始读取的位置
+        callback (function): 每读到一条记录调用一次
+        truncate (bool): 是否截掉末尾写了一半的记录
+        返回：
+        offset (int): 最后一条完整记录之后的位置
+        '''
+        try:
+            f = open(path, 'r+b' if truncate else 'rb')
+        except FileNotFoundError:
+            return offset
+        with f:
+            f.seek(offset)
+            while True:
+                try:
+                    record = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError):
+                    if truncate:
+                        f.truncate(offset)
+                    break
+                offset = f.tell()
+                callback(record)
+        return offset
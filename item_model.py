@@ -0,0 +1,498 @@
+"""
+紧凑的物品表示
+原来每个物品是一个有 7、8 个长中文键的字典，再套一个属性字典，100 万个物品时字典本身的开销比物品内容还大。
+Item 用 __slots__ 保存公共信息，属性值按列存放在 PropertyTable 中：同一个物品类型（同一个版本）的物品属性名称相同，
+属性名称只在表中保存一份，每个物品只占每一列中的一格；取值不多的属性值和物品类型用符号表编码（见 symbols.py）。
+Item 实现了字典的接口（item['物品名称']、item.get、item.items() ……），item['properties'] 返回可以读写的属性视图，
+界面和其他代码仍可以把物品当作字典使用。物品写入 pickle 文件时也只保存值，属性名称在同一个文件中只写一次；整个物品列表用 pack_items 按列写入，
+读取时成批创建物品。
+"""
+import threading
+from array import array
+from collections.abc import MutableMapping
+
+from symbols import decode_column, encode_column, symbols
+
+# 物品的字典键与 Item 中字段的对应关系，按原来字典中的顺序排列
+_SLOTS = {'物品名称': 'name', '物品描述': 'description', '物品地址': 'address', '联系人手机': 'phone',
+          '邮箱': 'email', 'type': 'type', 'id': 'id', 'schema_version': 'schema_version'}
+# 用符号表去重的字段：取值范围固定，重复的值共用一个字符串对象。
+# 符号表只增不减，地址等自由填写的字段不放入符号表
+_INTERNED = frozenset(('type',))
+# 物品的字典键的顺序（'properties' 排在类型之后）
+_KEYS = ('物品名称', '物品描述', '物品地址', '联系人手机', '邮箱', 'type', 'properties', 'id', 'schema_version')
+# Item 中保存字典键的字段，按 ItemBlock 中列的顺序排列
+_FIELD_SLOTS = tuple(_SLOTS.values())
+
+
+class PropertyTable:
+    '''
+    属性名称相同的物品的属性值，按列存放：第 i 列第 row 格是第 row 个物品的第 i 个属性的值。
+    每一列默认保存符号表中的编号（array，每格 4 个字节）；某一列的不同值超过 MAX_DISTINCT 个后，
+    这一列改为直接保存值（例如型号、书名这类几乎各不相同的属性）。
+    删除的行放入空闲列表，之后添加的物品优先复用。
+    '''
+    MAX_DISTINCT = 1024
+
+    def __init__(self, keys):
+        '''
+        初始化函数
+        参数：
+        keys (tuple): 属性名称
+        '''
+        self.keys = tuple(symbols.intern(key) for key in keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.columns = [array('I') for _ in keys]
+        # 编码列中出现过的不同值；为 None 表示这一列直接保存值
+        self.distinct = [set() for _ in keys]
+        self._free = []
+        self._lock = threading.Lock()  # 写入时使用，释放行不加锁（见 release）
+
+    def _decode_column(self, i):
+        values = symbols.values
+        self.columns[i] = [values[code] for code in self.columns[i]]
+        self.distinct[i] = None
+
+    def _encode(self, i, value):
+        '''
+        参数：
+        i (int): 列号
+        value (str): 值
+        返回：
+        stored: 第 i 列中保存的内容（编号或值本身）
+        '''
+        distinct = self.distinct[i]
+        if distinct is not None:
+            try:
+                if value in distinct or len(distinct) < self.MAX_DISTINCT:
+                    distinct.add(value)
+                    return symbols.code(value)
+            except TypeError:
+                pass  # 不能作为字典键的值只能直接保存
+            self._decode_column(i)
+        return value
+
+    def _store(self, i, values):
+        '''
+        把一列值转换为第 i 列的保存形式。
+        参数：
+        i (int): 列号
+        values (list 或 tuple): 一列值，或 encode_column 编码过的一列
+        返回：
+        stored (list): 编号或值
+        '''
+        distinct = self.distinct[i]
+        if distinct is not None:
+            encoded = isinstance(values, tuple)
+            try:
+                merged = distinct.union(values[0] if encoded else values)
+            except TypeError:
+                merged = None
+            if merged is not None and len(merged) <= self.MAX_DISTINCT:
+                self.distinct[i] = merged
+                if encoded:
+                    # 文件中的编号转换为符号表中的编号，不必逐个查字典
+                    remap = [symbols.code(value) for value in values[0]]
+                    return [remap[code] for code in values[1]]
+                return [symbols.code(value) for value in values]
+            self._decode_column(i)
+        return decode_column(values)
+
+    def allocate(self, values):
+        '''
+        写入一个物品的属性值。
+        参数：
+        values (sequence): 按属性名称的顺序排列的值
+        返回：
+        row (int): 行号
+        '''
+        with self._lock:
+            stored = [self._encode(i, value) for i, value in enumerate(values)]
+            if self._free:
+                row = self._free.pop()
+                for column, value in zip(self.columns, stored):
+                    column[row] = value
+            else:
+                row = len(self.columns[0]) if self.columns else 0
+                for column, value in zip(self.columns, stored):
+                    column.append(value)
+            return row
+
+    def allocate_many(self, columns, count):
+        '''
+        成批写入属性值，先复用空闲的行，其余的行一次追加到每一列的末尾。
+        参数：
+        columns (list): 每个属性一列值（可以是 encode_column 编码过的列），每列 count 个
+        count (int): 物品数
+        返回：
+        rows (list): 每个物品的行号
+        '''
+        with self._lock:
+            columns = [self._store(i, values) for i, values in enumerate(columns)]
+            rows = []
+            while self._free and len(rows) < count:
+                rows.append(self._free.pop())
+            for column, values in zip(self.columns, columns):
+                for row, value in zip(rows, values):
+                    column[row] = value
+            reused = len(rows)
+            start = len(self.columns[0]) if self.columns else 0
+            for column, values in zip(self.columns, columns):
+                column.extend(values[reused:])
+            rows.extend(range(start, start + count - reused))
+            return rows
+
+    def release(self, row):
+        '''
+        释放一行。物品对象被回收时（__del__）也会调用，所以这里不能加锁：
+        list 和 array 的单个操作在 GIL 下是原子的，垃圾回收可能发生在任何线程持有任何锁的时候。
+        参数：
+        row (int): 行号
+        '''
+        for column in self.columns:
+            column[row] = 0 if isinstance(column, array) else None
+        self._free.append(row)
+
+    def get(self, row, i):
+        '''
+        参数：
+        row (int): 行号
+        i (int): 列号
+        返回：
+        value (str): 第 row 个物品的第 i 个属性的值
+        '''
+        value = self.columns[i][row]
+        return value if self.distinct[i] is None else symbols.values[value]
+
+    def set(self, row, i, value):
+        '''
+        修改第 row 个物品的第 i 个属性的值。
+        '''
+        with self._lock:
+            self.columns[i][row] = self._encode(i, value)
+
+    def row(self, row):
+        '''
+        参数：
+        row (int): 行号
+        返回：
+        values (tuple): 该行按属性名称顺序排列的值
+        '''
+        return tuple(self.get(row, i) for i in range(len(self.columns)))
+
+    def column(self, i, rows):
+        '''
+        参数：
+        i (int): 列号
+        rows (list): 行号
+        返回：
+        values (list): 这些行第 i 个属性的值
+        '''
+        column = self.columns[i]
+        if self.distinct[i] is None:
+            return [column[row] for row in rows]
+        values = symbols.values
+        return [values[column[row]] for row in rows]
+
+    def __len__(self):
+        '''
+        正在使用的行数。
+        '''
+        return (len(self.columns[0]) if self.columns else 0) - len(self._free)
+
+
+# 属性名称（元组）到属性表的字典，所有物品共用
+_tables = {}
+
+
+def property_table(keys):
+    '''
+    参数：
+    keys (tuple): 属性名称
+    返回：
+    table (PropertyTable): 这组属性名称对应的属性表，没有时新建
+    '''
+    table = _tables.get(keys)
+    if table is None:
+        table = _tables.setdefault(keys, PropertyTable(keys))
+    return table
+
+
+class PropertyView(MutableMapping):
+    '''
+    物品属性的字典视图，读写的都是物品当前所在属性表中的值。
+    增加或删除属性时物品会移到另一个属性表。
+    '''
+    __slots__ = ('item',)
+
+    def __init__(self, item):
+        self.item = item
+
+    def __getitem__(self, key):
+        table = self.item._table
+        if table is None:
+            raise KeyError(key)
+        return table.get(self.item._row, table.index[key])
+
+    def __setitem__(self, key, value):
+        table = self.item._table
+        if table is not None and key in table.index:
+            table.set(self.item._row, table.index[key], value)
+        else:
+            self.item['properties'] = {**self, key: value}
+
+    def __delitem__(self, key):
+        properties = dict(self)
+        del properties[key]
+        self.item['properties'] = properties
+
+    def __iter__(self):
+        table = self.item._table
+        return iter(table.keys if table is not None else ())
+
+    def __len__(self):
+        table = self.item._table
+        return len(table.keys) if table is not None else 0
+
+    def copy(self):
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # 单独保存属性视图时保存为普通字典
+        return (dict, (dict(self),))
+
+
+class Item(MutableMapping):
+    '''
+    一个物品。字段为 None 表示字典中没有这个键。
+    '''
+    __slots__ = ('name', 'description', 'address', 'phone', 'email', 'type', 'id', 'schema_version',
+                 '_table', '_row', '_extra')
+
+    def __init__(self, item_info=None):
+        '''
+        初始化函数
+        参数：
+        item_info (dict): 物品信息，可以是原来的字典格式，也可以是另一个 Item（复制）
+        '''
+        self.name = self.description = self.address = self.phone = self.email = None
+        self.type = self.id = self.schema_version = None
+        self._table = None
+        self._row = None
+        self._extra = None  # 其他键，原来的字典中有时会出现
+        if item_info is not None:
+            self.update(item_info)
+
+    def _set_properties(self, properties):
+        keys = tuple(properties)
+        values = [properties[key] for key in keys]  # 先取出值，properties 可能就是自己的属性视图
+        table = property_table(keys)
+        row = table.allocate(values)
+        self._release()
+        self._table, self._row = table, row
+
+    def _release(self):
+        if self._table is not None:
+            self._table.release(self._row)
+            self._table = self._row = None
+
+    def __del__(self):
+        try:
+            self._release()
+        except Exception:
+            pass  # 解释器退出时模块可能已经被清理
+
+    def __getitem__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+        elif key == 'properties':
+            value = PropertyView(self) if self._table is not None else None
+        else:
+            value = self._extra.get(key) if self._extra is not None else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            setattr(self, slot, symbols.intern(value) if slot in _INTERNED and value is not None else value)
+        elif key == 'properties':
+            self._set_properties(value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            setattr(self, slot, None)
+        elif key == 'properties':
+            self._release()
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            return getattr(self, slot) is not None
+        if key == 'properties':
+            return self._table is not None
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for key in _KEYS:
+            if key in self:
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        # 比 Mapping.get 少一次异常处理，物品的字段读取得很频繁
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+            return default if value is None else value
+        return super().get(key, default)
+
+    def clear(self):
+        for slot in _SLOTS.values():
+            setattr(self, slot, None)
+        self._release()
+        self._extra = None
+
+    def copy(self):
+        return Item(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # 只保存值；属性名称元组是属性表中的同一个对象，在一个 pickle 文件中只写一次
+        table = self._table
+        return (_restore_item, (self.name, self.description, self.address, self.phone, self.email, self.type,
+                                self.id, self.schema_version,
+                                table.keys if table is not None else None,
+                                table.row(self._row) if table is not None else None,
+                                self._extra))
+
+
+def _restore_item(name, description, address, phone, email, item_type, item_id, version, keys, values, extra):
+    item = Item()
+    item.name, item.description, item.address, item.phone, item.email = name, description, address, phone, email
+    item.type = symbols.intern(item_type) if item_type is not None else None
+    item.id, item.schema_version = item_id, version
+    if keys is not None:
+        table = property_table(keys)
+        item._table, item._row = table, table.allocate(values)
+    item._extra = extra
+    return item
+
+
+class ItemBlock:
+    '''
+    按列写入 pickle 的物品列表：每个字段一列，属性按属性表分组后每个属性一列。
+    读取时得到的是 Item 的列表（见 _unpack_items），不是 ItemBlock。
+    '''
+    def __init__(self, items):
+        '''
+        初始化函数
+        参数：
+        items (list): 物品（Item 或字典）
+        '''
+        self.items = items
+
+    def __reduce__(self):
+        items = [as_item(item) for item in self.items]
+        fields = [encode_column([getattr(item, slot) for item in items]) for slot in _FIELD_SLOTS]
+        shapes = {}  # 属性名称 -> 序号
+        shape_of = []
+        members = []  # 每组属性中的物品
+        for item in items:
+            table = item._table
+            if table is None:
+                shape_of.append(-1)
+                continue
+            shape = shapes.get(table.keys)
+            if shape is None:
+                shape = shapes[table.keys] = len(members)
+                members.append([])
+            shape_of.append(shape)
+            members[shape].append(item)
+        values = []
+        for group in members:
+            table, rows = group[0]._table, [item._row for item in group]
+            values.append([encode_column(table.column(i, rows)) for i in range(len(table.keys))])
+        extras = {i: item._extra for i, item in enumerate(items) if item._extra}
+        return (_unpack_items, (fields, list(shapes), shape_of, values, extras))
+
+
+def _unpack_items(fields, shapes, shape_of, values, extras):
+    items = [Item() for _ in shape_of]
+    for slot, column in zip(_FIELD_SLOTS, fields):
+        for item, value in zip(items, decode_column(column, intern=slot in _INTERNED)):
+            setattr(item, slot, value)
+    groups = [[] for _ in shapes]
+    for item, shape in zip(items, shape_of):
+        if shape >= 0:
+            groups[shape].append(item)
+    for keys, columns, group in zip(shapes, values, groups):
+        table = property_table(keys)
+        for item, row in zip(group, table.allocate_many(columns, len(group))):
+            item._table, item._row = table, row
+    for i, extra in extras.items():
+        items[i]._extra = extra
+    return items
+
+
+def pack_items(items):
+    '''
+    参数：
+    items (list): 物品（Item 或字典）
+    返回：
+    block (ItemBlock): 用 pickle 保存时按列写入的物品列表，读取时得到 Item 的列表
+    '''
+    return ItemBlock(items)
+
+
+def property_matcher(key, value):
+    '''
+    按属性值筛选物品。编码的属性列只比较整数编号，不比较字符串。
+    参数：
+    key (str): 属性名称
+    value (str): 属性值
+    返回：
+    match (function): match(物品) 返回物品的属性 key 是否等于 value
+    '''
+    code = symbols.lookup(value)
+
+    def match(item):
+        table = item._table
+        i = table.index.get(key) if table is not None else None
+        if i is None:
+            return False
+        if table.distinct[i] is None:
+            return table.columns[i][item._row] == value
+        return table.columns[i][item._row] == code
+    return match
+
+
+def as_item(item_info):
+    '''
+    参数：
+    item_info (dict 或 Item): 物品信息
+    返回：
+    item (Item): item_info 本身是 Item 时原样返回，否则转换为 Item
+    '''
+    # 用 type 而不是 isinstance 判断：Item 是抽象基类的子类，isinstance 要慢得多
+    return item_info if type(item_info) is Item else Item(item_info)
@@ -0,0 +1,234 @@
+"""
+并发负载测试
+在临时目录中生成模拟数据（见 benchmark.py），在单独的进程中启动物品服务（默认 asyncio 版，--server thread 为线程版），
+然后在本机同时建立大量持久连接（默认 1000 个）。每个连接连续发送请求，请求按比例混合登录、搜索、添加物品和审核，
+每个连接先以管理员身份登录一次，之后的请求都带上会话令牌（审核用户需要管理员权限）。
+测试结束后统计吞吐量（每秒成功完成的请求数）、各类请求的延迟分布，以及服务繁忙（503）、超时（504）、其他错误和连接失败的次数。
+客户端只用一个事件循环，服务进程与客户端分开运行，客户端的开销不计入服务进程。
+
+用法：
+python load_test.py --connections 1000 --duration 20
+python load_test.py --connections 1000 --server thread --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import CAMPUS_ADDRESSES, DESCRIPTION_PHRASES, ITEM_NOUNS, PROPERTY_VALUES, generate_dataset, search_keywords, summarize
+
+# 请求的比例
+OPERATION_WEIGHTS = {'login': 50, 'search': 20, 'add_item': 20, 'approve': 10}
+SERVER_SCRIPTS = {'async': 'async_server.py', 'thread': 'server.py'}
+
+
+def request_factory(dataset, seed=0):
+    '''
+    参数：
+    dataset (dict): generate_dataset 返回的模拟数据
+    seed (int): 随机种子
+    返回：
+    make_request (function): make_request(rng) 随机返回 (操作名称, 请求路径, 参数)
+    '''
+    rng = random.Random(seed)
+    users = dataset['users']
+    approved = [(name, info['password']) for name, info in users.items() if info['status'] == 'approved']
+    pending = [name for name, info in users.items() if info['status'] == 'pending'] or ['admin']
+    keywords = search_keywords(rng, dataset, 2, 200)
+    item_types = dataset['item_types']
+    type_names = list(ITEM_NOUNS)
+    operations, weights = zip(*OPERATION_WEIGHTS.items())
+
+    def make_request(rng):
+        operation = rng.choices(operations, weights)[0]
+        if operation == 'login':
+            return operation, '/users/login', list(rng.choice(approved))
+        if operation == 'search':
+            return operation, '/search/search', list(rng.choice(keywords))
+        if operation == 'approve':
+            # 审核已经通过的用户也会重新写入一次，仍然是一次完整的修改
+            return operation, '/users/approve_many', [[rng.choice(pending)]]
+        item_type = rng.choice(type_names)
+        fields = {'物品名称': f'压测物品{rng.randrange(10 ** 6)}', '物品描述': rng.choice(DESCRIPTION_PHRASES),
+                  '物品地址': rng.choice(CAMPUS_ADDRESSES), '联系人手机': '13800000000', '邮箱': 'load@sjtu.edu.cn'}
+        values = [rng.choice(PROPERTY_VALUES) for _ in item_types[item_type]['properties']]
+        return operation, '/items/add', [item_type, fields, values]
+    return make_request
+
+
+async def send_request(reader, writer, host, path, payload):
+    '''
+    在持久连接上发送一个请求并读取响应。
+    返回：
+    status (int): HTTP 状态码
+    body (bytes): 响应体
+    '''
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n')
+    writer.write(head.encode('latin-1') + body)
+    return await read_response(reader)
+
+
+async def run_connection(host, port, make_request, deadline, results, seed, request_timeout, admin):
+    '''
+    在一个持久连接上以管理员身份登录，然后连续发送请求，直到 deadline。
+    参数：
+    results (dict): 统计结果，直接写入其中
+    admin (tuple): 管理员的 (用户名, 密码)
+    '''
+    rng = random.Random(seed)
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), request_timeout)
+    except (OSError, asyncio.TimeoutError):
+        results['connect_failed'] += 1
+        return
+    try:
+        status, body = await asyncio.wait_for(send_request(reader, writer, host, '/users/login', {'args': list(admin)}),
+                                              request_timeout)
+        if status != 200:
+            results['connect_failed'] += 1
+            return
+        token = json.loads(body)['result']['token']
+        while time.monotonic() < deadline:
+            operation, path, args = make_request(rng)
+            start = time.perf_counter()
+            status, _ = await asyncio.wait_for(send_request(reader, writer, host, path, {'args': args, 'token': token}),
+                                               request_timeout)
+            elapsed = time.perf_counter() - start
+            results['status'][status] = results['status'].get(status, 0) + 1
+            if status == 200:
+                results['latency'].setdefault(operation, []).append(elapsed)
+            elif status in (503, 504):
+                # 服务繁忙或超时：稍等再发，模拟客户端的退避
+                await asyncio.sleep(rng.uniform(0.05, 0.2))
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        results['dropped'] += 1
+    finally:
+        writer.close()
+
+
+async def read_response(reader):
+    '''
+    读取一个 HTTP 响应。
+    返回：
+    status (int): HTTP 状态码
+    body (bytes): 响应体
+    '''
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    lines = head.split('\r\n')
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return int(lines[0].split(' ', 2)[1]), body
+
+
+async def run_clients(host, port, make_request, connections, duration, seed, request_timeout, admin):
+    '''
+    同时运行所有连接。
+    返回：
+    results (dict): 各类请求的耗时、各状态码的次数、连接失败和中途断开的次数、实际的测试时长
+    '''
+    results = {'latency': {}, 'status': {}, 'connect_failed': 0, 'dropped': 0}
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(*(run_connection(host, port, make_request, deadline, results, seed + i, request_timeout, admin)
+                           for i in range(connections)))
+    results['elapsed'] = time.monotonic() - start
+    return results
+
+
+def start_server(kind, data_dir, storage, write_delay, extra_args=()):
+    '''
+    在单独的进程中启动物品服务，并等待它开始监听。
+    返回：
+    process (subprocess.Popen): 服务进程
+    port (int): 监听端口
+    '''
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), SERVER_SCRIPTS[kind])
+    command = [sys.executable, script, '--storage', storage, '--write-delay', str(write_delay), '--port', '0', *extra_args]
+    process = subprocess.Popen(command, cwd=data_dir, stdout=subprocess.PIPE, text=True, encoding='utf-8',
+                               env=dict(os.environ, PYTHONUNBUFFERED='1'))
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f'物品服务启动失败（退出码 {process.returncode}）')
+    return process, int(line.rstrip().rsplit(':', 1)[1])
+
+
+def run_load_test(server='async', connections=1000, duration=20.0, storage='pickle', items=10000, users=1000, seed=0,
+                  write_delay=0.1, request_timeout=60.0, server_args=()):
+    '''
+    生成数据、启动服务进程并运行负载测试。
+    返回：
+    report (dict): 吞吐量、各类请求的延迟统计、状态码和连接的统计
+    '''
+    with tempfile.TemporaryDirectory(prefix='exchange-load-') as data_dir:
+        dataset = generate_dataset(data_dir, storage, items, users, seed)
+        make_request = request_factory(dataset, seed)
+        process, port = start_server(server, data_dir, storage, write_delay, server_args)
+        try:
+            admin = ('admin', dataset['users']['admin']['password'])
+            results = asyncio.run(run_clients('127.0.0.1', port, make_request, connections, duration, seed, request_timeout,
+                                              admin))
+        finally:
+            process.terminate()
+            process.wait()
+    completed = sum(len(durations) for durations in results['latency'].values())
+    return {
+        'throughput_rps': completed / results['elapsed'],
+        'completed': completed,
+        'elapsed_s': results['elapsed'],
+        'status': {str(status): count for status, count in sorted(results['status'].items())},
+        'connect_failed': results['connect_failed'],
+        'dropped': results['dropped'],
+        'latency': {operation: summarize(durations) for operation, durations in sorted(results['latency'].items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='物品服务并发负载测试')
+    parser.add_argument('--server', choices=list(SERVER_SCRIPTS), default='async', help='服务进程的实现')
+    parser.add_argument('--connections', type=int, default=1000, help='并发连接数')
+    parser.add_argument('--duration', type=float, default=20.0, help='测试时长（秒）')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite'], default='pickle', help='存储引擎')
+    parser.add_argument('--items', type=int, default=10000, help='物品数')
+    parser.add_argument('--users', type=int, default=1000, help='用户数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--write-delay', type=float, default=0.1, help='服务进程延迟写入的时间窗口（秒）')
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    parser.add_argument('server_args', nargs=argparse.REMAINDER, help='传给服务进程的其他参数，写在 -- 之后，例如 -- --workers 16')
+    args = parser.parse_args(argv)
+
+    server_args = args.server_args[1:] if args.server_args[:1] == ['--'] else args.server_args
+    report = run_load_test(args.server, args.connections, args.duration, args.storage, args.items, args.users, args.seed,
+                           args.write_delay, server_args=server_args)
+    results = {
+        'meta': {'server': args.server, 'connections': args.connections, 'duration': args.duration, 'storage': args.storage,
+                 'items': args.items, 'users': args.users, 'seed': args.seed, 'server_args': server_args,
+                 'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': report,
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    print(f"{args.server}: {args.connections} 个连接，{report['throughput_rps']:.0f} 请求/秒，"
+          f"状态码 {report['status']}，连接失败 {report['connect_failed']}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,478 @@
+"""
+常驻内存的数据仓库
+界面上的每次点击不再重新读取和反序列化数据文件，而是读取常驻内存的数据，只有在数据文件被其他程序修改后才重新加载。
+用户数据例外：它按用户名存取，每次只读写一个用户。
+所有写操作都经过仓库完成，保证内存中的数据与文件始终一致。
+物品目录可能同时被界面线程和后台搜索线程使用，它的方法都在同一把锁中执行。
+物品目录中的物品都是紧凑的 Item 对象（见 item_model.py），从旧数据文件读到的字典在加载时转换。
+"""
+import bisect
+import functools
+import threading
+
+from item_model import as_item, property_matcher
+from search_index import NgramIndex
+
+
+def locked(method):
+    '''
+    装饰器：在对象的 lock 中执行方法。
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class UserRepository:
+    def __init__(self, storage):
+        '''
+        初始化函数。用户数据按用户名存取（见 user_store.py 和 SQLite 的 users 表），
+        不再把所有账户读进内存：读取、写入一个用户的代价与账户总数无关。
+        参数：
+        storage (StorageEngine): 存储引擎
+        '''
+        self.storage = storage
+
+    def get(self, name):
+        '''
+        参数：
+        name (str): 用户名
+        返回：
+        user_info (dict): 用户信息的副本，用户不存在时返回 None
+        '''
+        user_info = self.storage.get_user(name)
+        return dict(user_info) if user_info is not None else None
+
+    def list(self, status=None):
+        '''
+        参数：
+        status (str): 只返回该状态的用户（使用状态索引），为 None 时返回所有用户
+        返回：
+        names (list): 用户名列表
+        '''
+        return self.storage.list_users(status)
+
+    def save(self, name, user_info):
+        '''
+        保存一个用户的信息，只写入这一个用户。
+        参数：
+        name (str): 用户名
+        user_info (dict): 用户信息
+        '''
+        self.storage.save_user(name, user_info)
+
+    def add(self, name, user_info):
+        '''
+        保存一个新用户；同名用户已存在时不保存。
+        参数：
+        name (str): 用户名
+        user_info (dict): 用户信息
+        返回：
+        added (bool): 是否保存
+        '''
+        return self.storage.add_user(name, user_info)
+
+    def save_many(self, users):
+        '''
+        一次保存多个用户（一次写入，或一个事务）。
+        参数：
+        users (dict): 用户名到用户信息的字典
+        '''
+        self.storage.save_users(users, list(users))
+
+
+class ItemTypeRegistry:
+    def __init__(self, storage):
+        '''
+        初始化函数
+        参数：
+        storage (StorageEngine): 存储引擎
+        '''
+        self.storage = storage
+        self._version = 0
+        self._types = None
+        self._stamp = None
+
+    def _refresh(self):
+        '''
+        第一次使用时，或物品类型被其他程序修改后，重新加载物品类型并增加版本号。
+        '''
+        stamp = self.storage.item_types_stamp()
+        if self._types is None or stamp != self._stamp:
+            self._types = self.storage.load_item_types()
+            self._stamp = self.storage.item_types_stamp()
+            self._version += 1
+        return self._types
+
+    @property
+    def version(self):
+        '''
+        物品类型的版本号，每次变化后加一，调用方据此判断是否需要重建界面。
+        '''
+        self._refresh()
+        return self._version
+
+    def all(self):
+        '''
+        返回：
+        item_types (dict): 物品类型名称到类型定义的字典（只读）
+        '''
+        return self._refresh()
+
+    def names(self):
+        '''
+        返回：
+        names (list): 所有物品类型的名称
+        '''
+        return list(self._refresh().keys())
+
+    def get(self, name):
+        '''
+        参数：
+        name (str): 物品类型名称
+        返回：
+        item_type (dict): 物品类型定义，类型不存在时返回 None
+        '''
+        return self._refresh().get(name)
+
+    def save(self, item_types):
+        '''
+        保存物品类型数据，同时更新内存中的数据并增加版本号。
+        存储引擎可能合并了其他程序同时做的修改，所以下次使用时重新读取一次。
+        参数：
+        item_types (dict): 物品类型数据
+        '''
+        self.storage.save_item_types(item_types)
+        self._types = item_types
+        self._stamp = None
+        self._version += 1
+
+
+class ItemCatalog:
+    def __init__(self, storage, prepare=None):
+        '''
+        初始化函数
+        参数：
+        storage (StorageEngine): 存储引擎
+        prepare (function): prepare(物品列表)，物品从磁盘读入后、建立索引前调用（例如升级物品类型的版本）
+        '''
+        self.storage = storage
+        self.prepare = prepare
+        self.items = []
+        self.by_id = {}
+        # 按物品类型分区：物品类型 -> {物品编号: 物品信息}，只涉及某一类物品的操作不必遍历全部物品
+        self.by_type = {}
+        self._indexed_type = {}
+        self.search_index = NgramIndex()
+        self.lock = threading.RLock()
+        # 物品可以在后台线程中加载（见 ExchangeService）；加载的一方在物品可用后调用 mark_loaded
+        self.loaded = threading.Event()
+        self.load_error = None
+
+    def mark_loaded(self, error=None):
+        '''
+        标记物品已经加载完成（或者加载失败），唤醒所有在 wait_loaded 中等待的线程。
+        参数：
+        error (Exception): 加载失败的原因，为 None 表示加载成功
+        '''
+        self.load_error = error
+        self.loaded.set()
+
+    def wait_loaded(self, timeout=None):
+        '''
+        等待物品加载完成。
+        参数：
+        timeout (float): 最长等待时间（秒），为 None 时一直等待
+        返回：
+        loaded (bool): 是否已经加载完成（超时返回 False）；加载失败时抛出失败的原因
+        '''
+        if not self.loaded.wait(timeout):
+            return False
+        if self.load_error is not None:
+            raise self.load_error
+        return True
+
+    @locked
+    def load(self):
+        '''
+        加载物品信息，并重建编号表、类型分区和搜索索引。
+        返回：
+        items (list): 物品信息数据
+        '''
+        self.items[:] = map(as_item, self.storage.load_items())
+        if self.prepare is not None:
+            self.prepare(self.items)
+        self.by_id = {}
+        self.by_type = {}
+        self._indexed_type = {}
+        self.search_index = NgramIndex()
+        for item in self.items:
+            self._index(item)
+        return self.items
+
+    @locked
+    def save(self):
+        '''
+        全量保存物品信息。
+        '''
+        self.storage.save_items(self.items)
+
+    @locked
+    def refresh(self):
+        '''
+        增量刷新：数据没有变化时直接使用内存中的物品；其他程序修改了物品时只读取变化的部分，
+        无法读取增量时才重新加载全部物品。
+        返回：
+        items (list): 物品信息数据
+        '''
+        records = self.storage.load_item_changes()
+        if records is None:
+            return self.load()
+        records = [(op, item_id, as_item(item) if item is not None else None) for op, item_id, item in records]
+        if self.prepare is not None:
+            self.prepare([item for op, _, item in records if op != 'delete'])
+        for op, item_id, item in records:
+            existing = self.by_id.get(item_id)
+            if op == 'delete':
+                if existing is not None:
+                    self._unindex(item_id)
+                    self.items.pop(self.position(existing))
+            elif existing is not None:
+                # 原地更新，保持物品在列表中的位置和对象不变
+                self._unindex(item_id)
+                existing.clear()
+                existing.update(item)
+                self._index(existing)
+            elif self.items and item_id < self.items[-1]['id']:
+                # 其他程序先分配了编号、后写入的物品，插入到按编号排列的位置
+                self.items.insert(bisect.bisect_left(self.items, item_id, key=lambda x: x['id']), item)
+                self._index(item)
+            else:
+                self.items.append(item)
+                self._index(item)
+        return self.items
+
+    def _index(self, item):
+        # 搜索索引最先建立：它检查字段的值，出错时各个索引都保持不变
+        self.search_index.add(item)
+        self.by_id[item['id']] = item
+        self.by_type.setdefault(item['type'], {})[item['id']] = item
+        self._indexed_type[item['id']] = item['type']
+
+    def _unindex(self, item_id):
+        # 物品可能已被原地修改，按建立索引时记录的类型找到原来的分区
+        item = self.by_id.pop(item_id)
+        del self.by_type[self._indexed_type.pop(item_id)][item_id]
+        self.search_index.remove(item_id)
+        return item
+
+    @locked
+    def add(self, item):
+        '''
+        添加一个物品并保存，只写入这一个物品（整文件模式除外）。
+        先分配编号并建立索引，再写入：物品无法建立索引时不会写入，写入失败时物品目录保持不变。
+        参数：
+        item (dict): 物品信息
+        返回：
+        item (Item): 加入物品目录的物品
+        '''
+        item = as_item(item)
+        if item.get('id') is None:
+            item['id'] = self.storage.allocate_item_id()
+        self._index(item)
+        try:
+            self.storage.add_item(item)
+            self.items.append(item)
+            if self.storage.writes_full_items:
+                try:
+                    self.save()
+                except Exception:
+                    self.items.pop()
+                    raise
+        except Exception:
+            self._unindex(item['id'])
+            raise
+        return item
+
+    @locked
+    def add_many(self, items):
+        '''
+        一次添加多个物品（批量导入），所有物品一次写入：一次追加日志或一个事务，整文件模式只保存一次。
+        先为所有物品建立索引再写入：有物品无法建立索引时不写入任何物品；写入失败时物品目录保持不变。
+        参数：
+        items (iterable): 物品信息
+        返回：
+        items (list): 加入物品目录的物品
+        '''
+        items = [as_item(item) for item in items]
+        for item, item_id in zip(items, self.storage.allocate_item_ids(len(items))):
+            item['id'] = item_id
+        indexed = []
+        try:
+            for item in items:
+                self._index(item)
+                indexed.append(item)
+            if self.storage.writes_full_items:
+                self.items.extend(items)
+                try:
+                    self.save()
+                except Exception:
+                    del self.items[len(self.items) - len(items):]
+                    raise
+            else:
+                self.storage.write_batch(item_records=[('add', item['id'], item) for item in items])
+                self.items.extend(items)
+        except Exception:
+            for item in indexed:
+                self._unindex(item['id'])
+            raise
+        return items
+
+    @locked
+    def modify(self, items):
+        '''
+        保存被修改的物品，只写入这些物品（整文件模式除外）。
+        参数：
+        items (list): 被修改的物品信息
+        '''
+        for item in items:
+            self.storage.modify_item(item)
+            # 物品类型可能已经改变，先从原来的分区中移除
+            self._unindex(item['id'])
+            self._index(item)
+        if self.storage.writes_full_items:
+            self.save()
+
+    @locked
+    def write(self, items):
+        '''
+        只把物品写回磁盘，不更新索引（物品的名称、描述和类型都没有变化时使用），所有物品一次写入。
+        参数：
+        items (list): 物品信息
+        '''
+        if self.storage.writes_full_items:
+            self.save()
+        else:
+            self.storage.write_batch(item_records=[('modify', item['id'], item) for item in items])
+
+    @locked
+    def rename_type(self, old_name, new_name):
+        '''
+        物品类型改名后，把内存中该类型的物品移到新的分区（只修改内存，磁盘上的物品稍后再写回）。
+        参数：
+        old_name (str): 原来的类型名称
+        new_name (str): 新的类型名称
+        '''
+        partition = self.by_type.pop(old_name, {})
+        self.by_type.setdefault(new_name, {}).update(partition)
+        for item_id, item in partition.items():
+            item['type'] = new_name
+            self._indexed_type[item_id] = new_name
+
+    def position(self, item):
+        '''
+        查找物品在物品列表中的位置。物品列表按编号从小到大排列，因此使用二分查找。
+        参数：
+        item (dict): 物品信息
+        返回：
+        index (int): 物品在物品列表中的位置
+        '''
+        index = bisect.bisect_left(self.items, item['id'], key=lambda x: x['id'])
+        if index < len(self.items) and self.items[index] is item:
+            return index
+        # 其他程序添加的物品可能打乱了顺序，退回逐个查找
+        return next(i for i, x in enumerate(self.items) if x is item)
+
+    @locked
+    def delete(self, item):
+        '''
+        删除一个物品并保存，只写入这一条删除（整文件模式除外）。
+        写入失败时物品目录保持不变。
+        参数：
+        item (dict): 被删除的物品信息
+        返回：
+        item (dict): 被删除的物品信息
+        '''
+        index = self.position(item)
+        self.storage.delete_item(item)
+        self.items.pop(index)
+        if self.storage.writes_full_items:
+            try:
+                self.save()
+            except Exception:
+                self.items.insert(index, item)
+                raise
+        self._unindex(item['id'])
+        return item
+
+    @locked
+    def of_type(self, item_type, properties=None):
+        '''
+        参数：
+        item_type (str): 物品类型名称
+        properties (dict): 只返回这些属性等于给定值的物品（编码的属性只比较编号），为 None 时不筛选
+        返回：
+        items (list): 该类型的所有物品，按物品列表中的顺序排列
+        '''
+        partition = self.by_type.get(item_type, {})
+        items = [partition[item_id] for item_id in sorted(partition)]
+        for key, value in (properties or {}).items():
+            items = list(filter(property_matcher(key, value), items))
+        return items
+
+    def iter_items(self, item_type=None, chunk_size=1000):
+        '''
+        按物品列表中的顺序逐个产生物品，每次只在锁中取出一小批，不复制整个物品列表；
+        遍历期间其他线程添加或删除物品不会使遍历出错（按编号记住遍历到的位置）。
+        参数：
+        item_type (str): 只产生该类型的物品，为 None 时产生所有物品
+        chunk_size (int): 每批取出的物品数
+        返回：
+        items (generator): 物品
+        '''
+        last_id = None
+        while True:
+            with self.lock:
+                start = 0 if last_id is None else bisect.bisect_right(self.items, last_id, key=lambda x: x['id'])
+                chunk = self.items[start:start + chunk_size]
+            if not chunk:
+                return
+            last_id = chunk[-1]['id']
+            for item in chunk:
+                if item_type is None or item['type'] == item_type:
+                    yield item
+
+    @locked
+    def filter_by_name(self, text):
+        '''
+        找出名称中包含 text 的物品，先用搜索索引缩小范围。
+        参数：
+        text (str): 筛选文本
+        返回：
+        items (list): 物品，按物品列表中的顺序排列
+        '''
+        item_ids = self.search_index.containing('物品名称', text)
+        return [self.by_id[item_id] for item_id in sorted(item_ids) if text in self.by_id[item_id]['物品名称']]
+
+    @locked
+    def search_candidates(self, keyword, item_type, threshold=50):
+        '''
+        从搜索索引和类型分区中取出可能匹配的物品。
+        参数：
+        keyword (str): 搜索关键字
+        item_type (str): 物品类型名称
+        threshold (int): 相似度阈值
+        返回：
+        items (list): 候选物品，按物品列表中的顺序排列（物品编号的顺序就是物品列表中的顺序）
+        '''
+        partition = self.by_type.get(item_type)
+        if not partition:
+            return []
+        candidate_ids = self.search_index.candidates(keyword, threshold)
+        if len(partition) < len(candidate_ids):
+            item_ids = [item_id for item_id in partition if item_id in candidate_ids]
+        else:
+            item_ids = [item_id for item_id in candidate_ids if item_id in partition]
+        return [partition[item_id] for item_id in sorted(item_ids)]
@@ -0,0 +1,253 @@
+"""
+物品类型的版本
+修改物品类型时不再立即改写该类型的所有物品，而是给物品类型增加一个版本：物品类型记录每个版本的属性和属性的改名，
+每个物品记录写入时所用的版本号（'schema_version'，没有时为 0）。物品在被读取时按版本历史逐步升级，
+后台再以低优先级分批把升级后的物品写回磁盘。无论该类型有多少物品，修改物品类型都只需要写入物品类型本身。
+
+物品类型的数据格式：
+{'properties': [当前的属性], 'history': [每次修改后的 {'properties': [...], 'renames': {原属性名: 新属性名}}],
+ 'former_names': [改名前用过的类型名称]}
+版本号就是 history 的长度；没有 history 的物品类型版本为 0。
+"""
+import threading
+
+# 新属性在旧物品中没有对应的值时使用的默认值
+UNKNOWN_VALUE = "未知"
+
+
+def schema_version(item_type):
+    '''
+    参数：
+    item_type (dict): 物品类型定义
+    返回：
+    version (int): 物品类型当前的版本号
+    '''
+    return len(item_type.get('history', ()))
+
+
+def detect_renames(old_properties, new_properties):
+    '''
+    按位置识别属性的改名：修改物品类型的窗口中第 i 个输入框原来显示的是第 i 个属性，
+    如果它的内容变成了一个原来没有的名称，并且原来的名称也不再出现，就认为是改名。
+    参数：
+    old_properties (list): 原来的属性
+    new_properties (list): 输入框中的内容（与原来的属性按位置对应，可能有空白）
+    返回：
+    renames (dict): 原属性名到新属性名的字典
+    '''
+    renames = {}
+    for old, new in zip(old_properties, new_properties):
+        if new and new != old and new not in old_properties and old not in new_properties:
+            renames[old] = new
+    return renames
+
+
+def evolve(item_type, properties, renames=None, former_name=None):
+    '''
+    生成物品类型的下一个版本；属性没有变化时（例如只改了类型名称）不增加版本号。
+    参数：
+    item_type (dict): 物品类型定义，为 None 时创建新的物品类型
+    properties (list): 新的属性
+    renames (dict): 原属性名到新属性名的字典
+    former_name (str): 物品类型改名时原来的名称
+    返回：
+    item_type (dict): 新的物品类型定义
+    '''
+    if item_type is None:
+        return {'properties': list(properties), 'history': []}
+    renames = {old: new for old, new in (renames or {}).items() if old != new}
+    history = list(item_type.get('history', ()))
+    if list(properties) != list(item_type['properties']) or renames:
+        history.append({'properties': list(properties), 'renames': renames})
+    former_names = list(item_type.get('former_names', ()))
+    if former_name is not None and former_name not in former_names:
+        former_names.append(former_name)
+    evolved = {'properties': list(properties), 'history': history}
+    if former_names:
+        evolved['former_names'] = former_names
+    return evolved
+
+
+def upgrade_properties(properties, steps):
+    '''
+    按版本历史逐步升级物品的属性，每一步都生成新的字典。
+    参数：
+    properties (dict): 物品原来的属性
+    steps (list): 需要应用的版本历史
+    返回：
+    properties (dict): 升级后的属性
+    '''
+    for step in steps:
+        source = {new: old for old, new in step['renames'].items()}
+        properties = {prop: properties.get(source.get(prop, prop), UNKNOWN_VALUE) for prop in step['properties']}
+    return properties
+
+
+class SchemaMigrator:
+    def __init__(self, registry, batch_size=500, pause=0.05):
+        '''
+        初始化函数
+        参数：
+        registry (ItemTypeRegistry): 物品类型表
+        batch_size (int): 后台每批写回的物品数
+        pause (float): 后台两批之间的间隔（秒），让出时间给界面线程
+        '''
+        self.registry = registry
+        self.batch_size = batch_size
+        self.pause = pause
+        self.catalog = None
+        self.last_error = None  # 后台写回最近一次失败的原因，下一批写回成功后清除
+        self._types = {}
+        self._aliases = {}  # 改名前的类型名称 -> 现在的名称
+        self._types_version = None
+        # 内存中已经升级（或等待升级）但还没有写回磁盘的物品编号
+        self._unsaved = set()
+        self._work = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+
+    def attach(self, catalog):
+        '''
+        关联物品目录并启动后台写回线程。
+        参数：
+        catalog (ItemCatalog): 物品目录
+        '''
+        self.catalog = catalog
+        self._worker = threading.Thread(target=self._run, name='schema-migrator', daemon=True)
+        self._worker.start()
+
+    def refresh(self):
+        '''
+        物品类型变化后重建缓存。每批操作（一次搜索、一次导出、一次写回）开始时调用一次，
+        升级单个物品（upgrade）时只使用缓存，不再检查物品类型文件。
+        '''
+        version = self.registry.version
+        if version != self._types_version:
+            self._types = self.registry.all()
+            self._aliases = {former: name for name, info in self._types.items()
+                             for former in info.get('former_names', ())}
+            self._types_version = version
+
+    def _upgrade(self, item):
+        '''
+        把一个物品升级到其类型的当前版本（只修改内存中的物品）。
+        返回：
+        changed (bool): 物品是否被修改
+        '''
+        changed = False
+        item_type = self._types.get(item['type'])
+        if item_type is None:
+            current_name = self._aliases.get(item['type'])
+            if current_name is None:
+                return False
+            item['type'] = current_name
+            item_type = self._types[current_name]
+            changed = True
+        history = item_type.get('history', ())
+        version = item.get('schema_version', 0)
+        if version < len(history):
+            item['properties'] = upgrade_properties(item['properties'], history[version:])
+            item['schema_version'] = len(history)
+            changed = True
+        return changed
+
+    def prepare(self, items):
+        '''
+        物品从磁盘读入内存时（加载或增量刷新）升级物品，升级过的物品稍后在后台写回。
+        参数：
+        items (list): 刚读入的物品
+        '''
+        self.refresh()
+        if not self._aliases and not any(info.get('history') for info in self._types.values()):
+            return
+        upgraded = [item['id'] for item in items if self._upgrade(item)]
+        if upgraded:
+            self._schedule(upgraded)
+
+    def upgrade(self, item):
+        '''
+        读取物品的属性之前调用，把物品升级到缓存中物品类型的当前版本；调用方应先调用一次 refresh。
+        参数：
+        item (dict): 物品信息
+        返回：
+        item (dict): 同一个物品对象
+        '''
+        with self.catalog.lock:
+            if self._upgrade(item):
+                self._schedule([item['id']])
+        return item
+
+    def current_version(self, type_name):
+        '''
+        参数：
+        type_name (str): 物品类型名称
+        返回：
+        version (int): 新物品应记录的版本号
+        '''
+        self.refresh()
+        return schema_version(self._types[type_name])
+
+    def type_modified(self, type_name):
+        '''
+        物品类型修改后调用：该类型的物品只登记为待升级，由读取时或后台写回时升级。
+        参数：
+        type_name (str): 修改后的物品类型名称
+        '''
+        self.refresh()
+        with self.catalog.lock:
+            self._schedule(self.catalog.by_type.get(type_name, {}).keys())
+
+    def saved(self, item):
+        '''
+        物品已经按当前版本写回（例如被修改后保存），不必再由后台写回。
+        参数：
+        item (dict): 物品信息
+        '''
+        self._unsaved.discard(item['id'])
+
+    def _schedule(self, item_ids):
+        self._unsaved.update(item_ids)
+        self._work.set()
+
+    def step(self):
+        '''
+        后台写回一批物品：先升级，再一次写入。
+        返回：
+        more (bool): 是否还有待写回的物品
+        '''
+        with self.catalog.lock:
+            self.refresh()
+            batch = []
+            # 整文件模式每次写入都要重写整个文件，所以一次处理完
+            limit = len(self._unsaved) if self.catalog.storage.writes_full_items else self.batch_size
+            while self._unsaved and len(batch) < limit:
+                item = self.catalog.by_id.get(self._unsaved.pop())
+                if item is not None:
+                    self._upgrade(item)
+                    batch.append(item)
+            if batch:
+                self.catalog.write(batch)
+            self.last_error = None
+            return bool(self._unsaved)
+
+    def _run(self):
+        while True:
+            self._work.wait()
+            if self._stop.is_set():
+                return
+            self._work.clear()
+            try:
+                while self.step() and not self._stop.wait(self.pause):
+                    pass
+            except Exception as e:
+                # 写回失败的物品在下次读取或下次启动时仍会升级；记下原因，由 ExchangeService.flush 和 close 报告
+                self.last_error = e
+
+    def close(self):
+        '''
+        停止后台写回；还没写回的物品保持原来的版本，下次加载时会再次升级。
+        '''
+        self._stop.set()
+        self._work.set()
+        if self._worker is not None:
+            self._worker.join()
@@ -0,0 +1,137 @@
+"""
+模糊匹配打分引擎
+一次对一批物品计算关键字与物品名称、物品描述的 fuzz.partial_ratio，打分规则与原来逐个调用 fuzzywuzzy 完全相同。
+候选物品较多时把物品分块交给进程池并行计算，充分利用多核；还提供 top-k 模式，只返回得分最高的 k 个物品，
+找到 k 个满分物品后提前结束；iter_match 则按需逐批产生结果，便于分页显示。
+fuzzywuzzy 和进程池相关的模块在第一次打分时才导入，不搜索的程序（例如只显示登录窗口）不必等待导入。
+"""
+import heapq
+import os
+import threading
+
+
+def score_batch(keyword, texts, threshold=50, full=False):
+    '''
+    对一批 (物品名称, 物品描述) 打分。
+    参数：
+    keyword (str): 搜索关键字
+    texts (list): (物品名称, 物品描述) 组成的列表
+    threshold (int): 相似度阈值
+    full (bool): 为 True 时总是计算两项得分中的较大值；为 False 时名称已达到阈值就不再计算描述
+    返回：
+    matches (list): (在 texts 中的位置, 得分) 组成的列表，只包含达到阈值的物品
+    '''
+    from fuzzywuzzy import fuzz
+
+    cache = {}  # 同一批中重复的字符串只计算一次
+
+    def score(text):
+        result = cache.get(text)
+        if result is None:
+            result = cache[text] = fuzz.partial_ratio(keyword, text)
+        return result
+
+    matches = []
+    for position, (name, desc) in enumerate(texts):
+        name_score = score(name)
+        if name_score >= threshold and not full:
+            matches.append((position, name_score))
+            continue
+        best = max(name_score, score(desc))
+        if best >= threshold:
+            matches.append((position, best))
+    return matches
+
+
+class ScoringEngine:
+    def __init__(self, workers=None, parallel_threshold=5000, chunk_size=2000):
+        '''
+        初始化函数
+        参数：
+        workers (int): 进程池的进程数，默认为 CPU 核数
+        parallel_threshold (int): 候选物品数达到该值时才使用进程池
+        chunk_size (int): 每个进程一次处理的物品数
+        '''
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._pool_lock = threading.Lock()  # 后台搜索线程和界面线程可能同时创建进程池
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # 图形界面进程中不使用 fork，避免把 Tk 的状态复制到子进程
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _score(self, keyword, texts, threshold, full):
+        if self.workers < 2 or len(texts) < self.parallel_threshold:
+            return score_batch(keyword, texts, threshold, full)
+        pool = self._get_pool()
+        futures = [(start, pool.submit(score_batch, keyword, texts[start:start + self.chunk_size], threshold, full))
+                   for start in range(0, len(texts), self.chunk_size)]
+        return [(start + position, score) for start, future in futures for position, score in future.result()]
+
+    def match(self, keyword, items, threshold=50, top_k=None):
+        '''
+        找出名称或描述与关键字的相似度不低于阈值的物品。
+        参数：
+        keyword (str): 搜索关键字
+        items (list): 候选物品
+        threshold (int): 相似度阈值
+        top_k (int): 为 None 时按原来的顺序返回所有匹配的物品；否则只返回得分最高的 top_k 个物品（得分相同时保持原来的顺序）
+        返回：
+        matches (list): 匹配的物品
+        '''
+        texts = [(item['物品名称'], item['物品描述']) for item in items]
+        if top_k is None:
+            return [items[position] for position, _ in self._score(keyword, texts, threshold, False)]
+        return [items[position] for position in self._top_k(keyword, texts, threshold, top_k)]
+
+    def iter_match(self, keyword, items, threshold=50, cancelled=None):
+        '''
+        与 match 相同，但以生成器的形式按原来的顺序逐批产生匹配的物品：只有在调用方继续取结果时才计算下一批，
+        显示第一页结果时不必算完所有候选物品。
+        参数：
+        keyword (str): 搜索关键字
+        items (list): 候选物品
+        threshold (int): 相似度阈值
+        cancelled (function): cancelled() 返回 True 时在下一批开始前停止，即使前面的批次没有匹配的物品；为 None 时不检查
+        '''
+        step = self.chunk_size * max(self.workers, 1)
+        for start in range(0, len(items), step):
+            if cancelled is not None and cancelled():
+                return
+            batch = items[start:start + step]
+            texts = [(item['物品名称'], item['物品描述']) for item in batch]
+            for position, _ in self._score(keyword, texts, threshold, False):
+                yield batch[position]
+
+    def _top_k(self, keyword, texts, threshold, top_k):
+        '''
+        分块计算得分并保留得分最高的 top_k 个物品；已经有 top_k 个满分物品时，剩下的物品不可能排到前面，提前结束。
+        '''
+        best = []  # (得分, -位置) 组成的小顶堆
+        step = self.chunk_size * max(self.workers, 1)
+        for start in range(0, len(texts), step):
+            for position, score in self._score(keyword, texts[start:start + step], threshold, True):
+                entry = (score, -(start + position))
+                if len(best) < top_k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+            if len(best) == top_k and best[0][0] == 100:
+                break
+        return [-position for score, position in sorted(best, reverse=True)]
+
+    def close(self):
+        '''
+        关闭进程池。
+        '''
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,129 @@
+"""
+物品搜索索引
+对物品名称和物品描述建立字符 n-gram 倒排索引，搜索时先从索引中取出少量候选物品，只对候选物品计算 fuzz.partial_ratio。
+中文的每个汉字本身就是一个语素，因此这里使用单字（n=1）作为索引单位，并记录每个字在物品中出现的次数：
+partial_ratio 的相似度只来自两个字符串中按顺序匹配上的字符，匹配字符数不会超过两者公共字符（按出现次数计）的个数，
+由此可以算出相似度的上界。上界低于阈值的物品一定不会匹配，所以剪枝前后的搜索结果完全相同。
+（二字或更长的 n-gram 无法给出这样的上界：'abcd' 与 'axcx' 没有公共二元组，相似度却正好是 50。）
+"""
+from collections import Counter, defaultdict
+
+
+class NgramIndex:
+    # 参与搜索的字段
+    FIELDS = ('物品名称', '物品描述')
+
+    def __init__(self, items=()):
+        '''
+        初始化函数
+        参数：
+        items (iterable): 需要建立索引的物品，每个物品都带有编号 'id'
+        '''
+        # 字段 -> 字符 -> {物品编号: 出现次数}
+        self._postings = {field: defaultdict(dict) for field in self.FIELDS}
+        # 字段 -> {物品编号: (字段长度, 字符计数)}，删除和修改时据此撤销旧的索引项
+        self._entries = {field: {} for field in self.FIELDS}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._entries[self.FIELDS[0]])
+
+    def add(self, item):
+        '''
+        把一个物品加入索引。
+        参数：
+        item (dict): 物品信息
+        '''
+        item_id = item['id']
+        # 先统计所有字段（字段的值不是字符串时在这里出错），再写入索引，出错时索引保持不变
+        entries = {}
+        for field in self.FIELDS:
+            text = item.get(field, '')
+            if not isinstance(text, str):
+                raise TypeError(f'{field} 必须是字符串，不能是 {type(text).__name__}')
+            entries[field] = (len(text), Counter(text))
+        for field, entry in entries.items():
+            postings = self._postings[field]
+            for char, count in entry[1].items():
+                postings[char][item_id] = count
+            self._entries[field][item_id] = entry
+
+    def remove(self, item_id):
+        '''
+        从索引中移除一个物品。
+        参数：
+        item_id (int): 物品编号
+        '''
+        for field in self.FIELDS:
+            entry = self._entries[field].pop(item_id, None)
+            if entry is None:
+                continue
+            postings = self._postings[field]
+            for char in entry[1]:
+                posting = postings[char]
+                posting.pop(item_id, None)
+                if not posting:
+                    del postings[char]
+
+    def update(self, item):
+        '''
+        物品被修改后更新索引。
+        参数：
+        item (dict): 修改后的物品信息
+        '''
+        self.remove(item['id'])
+        self.add(item)
+
+    def containing(self, field, text):
+        '''
+        找出某个字段包含 text 中所有字符的物品（用于边输入边筛选，调用方再检查是否包含整个子串）。
+        参数：
+        field (str): 字段名称
+        text (str): 筛选文本
+        返回：
+        item_ids (set): 物品编号
+        '''
+        postings = self._postings[field]
+        # 从出现次数最少的字符开始求交集
+        chars = sorted(set(text), key=lambda char: len(postings.get(char, ())))
+        if not chars:
+            return set(self._entries[field])
+        result = set(postings.get(chars[0], ()))
+        for char in chars[1:]:
+            if not result:
+                break
+            result.intersection_update(postings.get(char, ()))
+        return result
+
+    def candidates(self, keyword, threshold=50):
+        '''
+        找出名称或描述与关键字的 partial_ratio 可能不低于阈值的物品。
+        参数：
+        keyword (str): 搜索关键字
+        threshold (int): 相似度阈值
+        返回：
+        item_ids (set): 候选物品的编号
+        '''
+        if not keyword:
+            return set()
+        keyword_counts = Counter(keyword)
+        # fuzz 的结果会四舍五入取整，因此上界达到 threshold - 0.5 就要保留
+        bound = threshold - 0.5
+        result = set()
+        for field in self.FIELDS:
+            postings = self._postings[field]
+            entries = self._entries[field]
+            common = defaultdict(int)
+            for char, count in keyword_counts.items():
+                for item_id, item_count in postings.get(char, {}).items():
+                    common[item_id] += min(count, item_count)
+            for item_id, shared in common.items():
+                if item_id in result:
+                    continue
+                shorter = min(len(keyword), entries[item_id][0])
+                shared = min(shared, shorter)
+                # partial_ratio <= 100 * 2M / (shorter + M)，M 为匹配字符数，不超过 shared
+                if 200 * shared >= bound * (shorter + shared):
+                    result.add(item_id)
+        return result
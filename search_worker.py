@@ -0,0 +1,120 @@
+"""
+后台搜索
+搜索（增量刷新物品、从索引取候选物品、模糊打分）在后台线程中进行，结果逐批放入队列，
+Tk 主循环通过 after() 定时从队列中取出结果再交给界面，搜索期间窗口始终可以操作。
+Tk 不是线程安全的，所以后台线程从不直接调用任何 Tk 方法。
+开始新的搜索会取消还在进行的搜索：旧搜索在打分的下一批候选物品之前停止（没有匹配的物品时也不会算完所有候选物品），
+已经放入队列的旧结果会被丢弃。
+"""
+import queue
+import threading
+import time
+
+
+class SearchWorker:
+    def __init__(self, widget, search, poll_interval=50, batch_size=200):
+        '''
+        初始化函数
+        参数：
+        widget (tk.Widget): 用来调用 after() 的窗口
+        search (function): search(*args, cancelled=函数) 返回结果的可迭代对象，在后台线程中调用；cancelled() 返回 True 时应尽快停止
+        poll_interval (int): 检查队列的间隔（毫秒）
+        batch_size (int): 每批最多放入队列的结果数；距上一批超过 poll_interval 时不满一批也会放入
+        '''
+        self.widget = widget
+        self.search = search
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._token = 0  # 当前搜索的序号，序号不同的结果属于已取消的搜索
+        self._callbacks = None
+        self._poll_job = None
+
+    @property
+    def running(self):
+        '''
+        是否有搜索正在进行。
+        '''
+        return self._callbacks is not None
+
+    def submit(self, args, on_batch, on_done, on_error):
+        '''
+        取消正在进行的搜索，在后台线程中开始新的搜索。回调函数都在 Tk 主循环中调用。
+        参数：
+        args (tuple): 传给 search 的参数
+        on_batch (function): on_batch(结果列表)，每取到一批结果调用一次
+        on_done (function): on_done()，搜索结束时调用
+        on_error (function): on_error(异常)，搜索出错时调用
+        '''
+        self.cancel()
+        token = self._token
+        self._callbacks = (on_batch, on_done, on_error)
+        threading.Thread(target=self._run, args=(token, args), daemon=True).start()
+        self._schedule_poll()
+
+    def cancel(self):
+        '''
+        取消正在进行的搜索，之后不会再调用它的回调函数。
+        '''
+        self._token += 1
+        self._callbacks = None
+
+    def close(self):
+        '''
+        取消搜索并停止检查队列（窗口关闭时调用）。
+        '''
+        self.cancel()
+        if self._poll_job is not None:
+            self.widget.after_cancel(self._poll_job)
+            self._poll_job = None
+
+    def _run(self, token, args):
+        '''
+        后台线程：执行搜索，把结果按批放入队列。
+        '''
+        try:
+            batch = []
+            flushed = time.monotonic()
+            cancelled = lambda: token != self._token
+            for result in self.search(*args, cancelled=cancelled):
+                if cancelled():
+                    return
+                batch.append(result)
+                now = time.monotonic()
+                if len(batch) >= self.batch_size or now - flushed >= self.poll_interval / 1000:
+                    self._queue.put((token, 'batch', batch))
+                    batch = []
+                    flushed = now
+            if batch:
+                self._queue.put((token, 'batch', batch))
+            self._queue.put((token, 'done', None))
+        except Exception as e:
+            self._queue.put((token, 'error', e))
+
+    def _schedule_poll(self):
+        if self._poll_job is None:
+            self._poll_job = self.widget.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        '''
+        Tk 主循环：取出队列中的结果，调用当前搜索的回调函数。
+        '''
+        self._poll_job = None
+        while True:
+            try:
+                token, kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if token != self._token or self._callbacks is None:
+                continue  # 已取消的搜索
+            on_batch, on_done, on_error = self._callbacks
+            if kind == 'batch':
+                on_batch(payload)
+            else:
+                self._callbacks = None
+                if kind == 'done':
+                    on_done()
+                else:
+                    on_error(payload)
+        if self._callbacks is not None:
+            self._schedule_poll()
@@ -0,0 +1,472 @@
+"""
+物品服务进程
+原来每个界面程序都自己加载全部数据、自己建立搜索索引。ExchangeServer 在一个进程中持有用户、物品类型和物品（以及搜索索引），
+通过本机的 HTTP/JSON 接口提供登录、注册、审核、添加/修改/删除物品和搜索；各台自助机的界面以瘦客户端模式
+（见 client.py）连接它，数据只在服务进程中保存一份，所有搜索都使用同一个已经建好的索引。
+
+接口：POST /<服务>/<方法>，请求体为 {"args": [...], "token": 会话令牌}，返回 {"result": ...}；
+业务错误返回 {"error": {"type": 异常类名, "message": 提示, "errors": 导入错误}}（HTTP 状态码 400）。
+参数的个数和类型在执行之前按方法表检查，不对时返回 400；执行中出现的其他异常是服务进程的错误，返回 500。
+物品以 JSON 对象传递，修改、删除物品时只传物品编号。连接使用 HTTP/1.1 持久连接，客户端可以复用。
+
+权限：users/login 返回 {"role": 角色, "token": 会话令牌}，之后的请求都带上令牌。登录、注册和读取物品类型不需要令牌；
+查看、添加、搜索物品需要登录（否则返回 401）；审核用户、查看用户信息、修改物品类型、修改/删除/导入/导出物品需要管理员令牌
+（普通用户返回 403）。返回的用户信息中不包含密码。接口使用明文 HTTP，默认只监听本机地址，监听其他地址需要 --allow-remote。
+
+用法：
+python server.py --storage sqlite --port 8765
+"""
+import argparse
+import bisect
+import collections
+import inspect
+import ipaddress
+import itertools
+import json
+import secrets
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from services import ExchangeService, ImportValidationError, ServiceError
+
+DEFAULT_PORT = 8765
+# 最多保留的会话数，超过时丢弃最早登录的会话（该用户需要重新登录）
+MAX_SESSIONS = 10000
+# 方法表中参数允许的 JSON 类型
+OPTIONAL_STR = (str, type(None))
+OPTIONAL_INT = (int, type(None))
+OPTIONAL_DICT = (dict, type(None))
+NUMBER = (int, float)
+# 一次搜索请求最多返回的物品数，更多的结果由客户端按页继续取用
+MAX_SEARCH_PAGE = 1000
+
+
+class AuthenticationError(ServiceError):
+    '''
+    请求需要登录，但没有带会话令牌或令牌已失效（HTTP 状态码 401）。
+    '''
+
+
+class PermissionDeniedError(ServiceError):
+    '''
+    已登录的用户没有权限执行该请求（HTTP 状态码 403）。
+    '''
+
+
+def item_to_json(item):
+    '''
+    参数：
+    item (Item): 物品
+    返回：
+    item (dict): 可以转换为 JSON 的物品信息
+    '''
+    data = dict(item)
+    data['properties'] = dict(item['properties'])
+    return data
+
+
+def error_response(error):
+    '''
+    把执行请求时的异常转换为错误响应。
+    参数：
+    error (Exception): 异常
+    返回：
+    status (int): HTTP 状态码：没有登录为 401，没有权限为 403，业务错误和请求格式错误为 400，其他为 500
+    body (dict): {"error": {"type": 异常类名, "message": 提示}}，导入错误另有 "errors"
+    '''
+    if isinstance(error, ServiceError):
+        body = {'type': type(error).__name__, 'message': str(error)}
+        if isinstance(error, ImportValidationError):
+            body['errors'] = error.errors
+        if isinstance(error, AuthenticationError):
+            return 401, {'error': body}
+        if isinstance(error, PermissionDeniedError):
+            return 403, {'error': body}
+        return 400, {'error': body}
+    return 500, {'error': {'type': 'ServiceError', 'message': f'服务器内部错误：{error}'}}
+
+
+def parse_request(data):
+    '''
+    解析请求体。
+    参数：
+    data (bytes): 请求体，为空时相当于 {}
+    返回：
+    args (list): 参数
+    token (str): 会话令牌，没有时为 None
+    '''
+    try:
+        request = json.loads(data or b'{}')
+    except ValueError as e:
+        raise ServiceError(f'请求格式错误：请求体不是 JSON：{e}')
+    if not isinstance(request, dict):
+        raise ServiceError('请求格式错误：请求体必须是 JSON 对象')
+    args = request.get('args', [])
+    if not isinstance(args, list):
+        raise ServiceError('请求格式错误：args 必须是数组')
+    return args, request.get('token')
+
+
+def required_args(function):
+    '''
+    参数：
+    function (function): 执行请求的函数
+    返回：
+    count (int): 没有默认值的参数个数
+    '''
+    return sum(1 for parameter in inspect.signature(function).parameters.values()
+               if parameter.default is parameter.empty)
+
+
+class ListOf:
+    def __init__(self, item_type):
+        '''
+        方法表中的参数类型：元素都是 item_type 的数组（例如用户名列表、属性名称列表、导入的行）。
+        参数：
+        item_type (type): 元素的类型
+        '''
+        self.item_type = item_type
+
+    @property
+    def __name__(self):
+        return f'{self.item_type.__name__} 数组'
+
+
+def matches(value, allowed):
+    '''
+    参数：
+    value: 参数的值
+    allowed (tuple): 允许的类型，可以包含 ListOf
+    返回：
+    matched (bool): 值的类型是否允许
+    '''
+    for expected in allowed:
+        if isinstance(expected, ListOf):
+            if isinstance(value, list) and all(matches(element, (expected.item_type,)) for element in value):
+                return True
+        # JSON 的 true/false 在 Python 中是 int 的子类，只有明确允许 bool 时才接受
+        elif isinstance(value, expected) and (not isinstance(value, bool) or expected is bool):
+            return True
+    return False
+
+
+def check_args(name, args, types, required):
+    '''
+    在执行请求之前检查参数的个数和类型，不对时抛出 ServiceError（HTTP 状态码 400）。
+    参数：
+    name (str): 'service/method'
+    args (list): 参数
+    types (tuple): 每个参数允许的类型（一个类型、ListOf 或它们的元组）
+    required (int): 必须提供的参数个数
+    '''
+    if not required <= len(args) <= len(types):
+        expected = required if required == len(types) else f'{required} 到 {len(types)}'
+        raise ServiceError(f'请求格式错误：{name} 需要 {expected} 个参数，收到 {len(args)} 个')
+    for position, (arg, allowed) in enumerate(zip(args, types), 1):
+        allowed = allowed if isinstance(allowed, tuple) else (allowed,)
+        if not matches(arg, allowed):
+            names = '、'.join('null' if t is type(None) else t.__name__ for t in allowed)
+            raise ServiceError(f'请求格式错误：{name} 的第 {position} 个参数应为 {names}，收到 {type(arg).__name__}')
+
+
+class ServiceMethods:
+    def __init__(self, service):
+        '''
+        初始化函数。服务进程可以对外提供的方法表，线程版（ExchangeServer）和 asyncio 版（见 async_server.py）的服务进程共用。
+        参数：
+        service (ExchangeService): 业务服务，由服务进程独占
+        '''
+        self.service = service
+        # 修改数据的请求逐个执行（例如两台电脑同时修改物品类型），查询和搜索可以并行
+        self.write_lock = threading.RLock()
+        # 会话令牌 -> (用户名, 角色)，按登录的先后排列
+        self.sessions = collections.OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self.methods = self._methods()
+        # 每个方法必须提供的参数个数（其余参数有默认值）
+        self.required = {name: required_args(method[0]) for name, method in self.methods.items()}
+
+    def _methods(self):
+        '''
+        返回：
+        methods (dict): 'service/method' -> (函数, 是否修改数据, 需要的角色, 参数类型)；角色为 None 时不需要登录，
+            'user' 表示任何登录的用户，'admin' 表示管理员；参数类型按位置给出每个参数允许的 JSON 类型
+        '''
+        service = self.service
+        users, item_types, items = service.users, service.item_types, service.items
+        return {
+            'users/login': (self.login, False, None, (str, str)),
+            'users/sign_up': (users.sign_up, True, None, (str, str, str, str, str)),
+            'users/get': (self.get_user, False, 'admin', (str,)),
+            'users/list': (users.list, False, 'admin', (OPTIONAL_STR,)),
+            'users/approve_many': (users.approve_many, True, 'admin', (ListOf(str),)),
+            'users/reject_many': (users.reject_many, True, 'admin', (ListOf(str),)),
+            'item_types/version': (lambda: item_types.version, False, None, ()),
+            'item_types/names': (item_types.names, False, None, ()),
+            'item_types/properties': (item_types.properties, False, None, (str,)),
+            'item_types/add': (item_types.add, True, 'admin', (str, ListOf(str))),
+            'item_types/modify': (item_types.modify, True, 'admin', (str, str, ListOf(str))),
+            'items/count': (self.count_items, False, 'user', ()),
+            'items/slice': (self.slice_items, False, 'user', (int, int)),
+            'items/get': (lambda item_id: item_to_json(items.upgrade(self.find_item(item_id))), False, 'user', (int,)),
+            'items/filter_by_name': (lambda text: [item_to_json(item) for item in items.filter_by_name(text)],
+                                     False, 'user', (str,)),
+            'items/add': (lambda item_type, fields, property_values: item_to_json(items.add(item_type, fields, property_values)),
+                          True, 'user', (str, dict, ListOf(str))),
+            'items/modify': (self.modify_item, True, 'admin', (int, dict, OPTIONAL_DICT)),
+            'items/delete': (lambda item_id: items.delete(self.find_item(item_id)), True, 'admin', (int,)),
+            'items/import_items': (self.import_items, True, 'admin', (ListOf(dict), bool, (ListOf(int), type(None)))),
+            'items/export_page': (self.export_page, False, 'admin', (OPTIONAL_STR, OPTIONAL_INT, int)),
+            'search/search': (self.search_page, False, 'user', (str, str, NUMBER, OPTIONAL_INT, int)),
+            'service/flush': (service.flush, True, 'user', ()),
+        }
+
+    def lookup(self, name, args, token=None):
+        '''
+        查找请求对应的函数，检查会话令牌的权限和参数的个数、类型。
+        参数：
+        name (str): 'service/method'
+        args (list): 参数
+        token (str): users/login 返回的会话令牌，没有登录时为 None
+        返回：
+        function (function): 执行请求的函数，修改数据的函数会先获得写锁
+        writes (bool): 是否修改数据
+        '''
+        method = self.methods.get(name)
+        if method is None:
+            raise ServiceError(f'未知的请求：{name}')
+        function, writes, role, types = method
+        if role is not None:
+            self.authorize(token, role)
+        check_args(name, args, types, self.required[name])
+        if not writes:
+            return function, False
+
+        def locked(*args):
+            with self.write_lock:
+                return function(*args)
+        return locked, True
+
+    def call(self, name, args, token=None):
+        '''
+        执行一个请求。
+        参数：
+        name (str): 'service/method'
+        args (list): 参数
+        token (str): 会话令牌
+        返回：
+        result: 可以转换为 JSON 的结果
+        '''
+        function, _ = self.lookup(name, args, token)
+        return function(*args)
+
+    def authorize(self, token, role):
+        '''
+        参数：
+        token (str): 会话令牌
+        role (str): 需要的角色，'user' 或 'admin'
+        返回：
+        session (tuple): (用户名, 角色)；没有登录时抛出 AuthenticationError，权限不够时抛出 PermissionDeniedError
+        '''
+        with self._sessions_lock:
+            session = self.sessions.get(token) if isinstance(token, str) else None
+        if session is None:
+            raise AuthenticationError('请先登录')
+        if role == 'admin' and session[1] != 'admin':
+            raise PermissionDeniedError('只有管理员可以执行该操作')
+        return session
+
+    def login(self, name, password):
+        '''
+        检查用户名和密码，登录成功后创建会话。
+        返回：
+        session (dict): {"role": 角色, "token": 会话令牌}
+        '''
+        role = self.service.users.login(name, password)
+        token = secrets.token_urlsafe(32)
+        with self._sessions_lock:
+            self.sessions[token] = (name, role)
+            while len(self.sessions) > MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+        return {'role': role, 'token': token}
+
+    def get_user(self, name):
+        '''
+        返回：
+        user_info (dict): 用户信息，不包含密码
+        '''
+        return {key: value for key, value in self.service.users.get(name).items() if key != 'password'}
+
+    def find_item(self, item_id):
+        '''
+        参数：
+        item_id (int): 物品编号
+        返回：
+        item (Item): 物品目录中的物品
+        '''
+        catalog = self.service.catalog
+        with catalog.lock:
+            item = catalog.by_id.get(item_id)
+            if item is None:
+                # 可能是其他程序刚添加的物品
+                catalog.refresh()
+                item = catalog.by_id.get(item_id)
+        if item is None:
+            raise ServiceError('物品不存在，可能已被删除')
+        return item
+
+    def count_items(self):
+        '''
+        返回：
+        count (int): 物品总数（先读取其他程序对物品做的改动）
+        '''
+        catalog = self.service.catalog
+        with catalog.lock:
+            catalog.refresh()
+            return len(catalog.items)
+
+    def slice_items(self, start, stop):
+        '''
+        返回物品列表中的一段，客户端的虚拟列表框滚动时按页取用。
+        '''
+        catalog = self.service.catalog
+        with catalog.lock:
+            return [item_to_json(item) for item in catalog.items[start:stop]]
+
+    def modify_item(self, item_id, fields, properties=None):
+        '''
+        修改物品，返回修改后的物品信息。
+        '''
+        item = self.find_item(item_id)
+        self.service.items.modify(item, fields, properties)
+        return item_to_json(item)
+
+    def search_page(self, item_type, keyword, threshold=50, after_id=None, limit=MAX_SEARCH_PAGE):
+        '''
+        按编号顺序返回 after_id 之后的至多 limit 个（不超过 MAX_SEARCH_PAGE 个）匹配的物品；
+        找够一页就停止打分，客户端逐页取用，不必一次计算和传输所有结果。
+        '''
+        matches = self.service.search.search(item_type, keyword, threshold, after_id=after_id)
+        return [item_to_json(item) for item in itertools.islice(matches, max(0, min(limit, MAX_SEARCH_PAGE)))]
+
+    def import_items(self, rows, skip_invalid=False, line_numbers=None):
+        '''
+        批量导入物品。line_numbers 是客户端读到的每一行在文件中的行号，错误信息中使用它；没有时按顺序从 1 开始编号。
+        '''
+        if line_numbers is not None and len(line_numbers) != len(rows):
+            raise ServiceError('请求格式错误：行号的个数与行数不一致')
+        numbered = zip(itertools.count(1) if line_numbers is None else line_numbers, rows)
+        return self.service.items.import_items(numbered, skip_invalid=skip_invalid)
+
+    def export_page(self, item_type=None, after_id=None, limit=1000):
+        '''
+        按编号顺序返回 after_id 之后的至多 limit 个要导出的物品，客户端逐页取用，不必一次传输所有物品。
+        '''
+        if item_type is not None and item_type not in self.service.item_types.names():
+            raise ServiceError(f"物品类型 '{item_type}' 不存在")
+        catalog, migrator = self.service.catalog, self.service.migrator
+        migrator.refresh()
+        page = []
+        with catalog.lock:
+            start = 0 if after_id is None else bisect.bisect_right(catalog.items, after_id, key=lambda x: x['id'])
+            for item in itertools.islice(catalog.items, start, None):
+                if item_type is None or item['type'] == item_type:
+                    page.append(item_to_json(migrator.upgrade(item)))
+                    if len(page) >= limit:
+                        break
+        return page
+
+
+class ExchangeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, host='127.0.0.1', port=DEFAULT_PORT):
+        '''
+        初始化函数。每个连接由一个线程处理，适合几台自助机这样的少量客户端；大量并发连接请使用 async_server.py。
+        参数：
+        service (ExchangeService): 业务服务，由服务进程独占
+        host (str): 监听地址，默认只接受本机连接
+        port (int): 监听端口，为 0 时由系统分配
+        '''
+        self.service = service
+        self.methods = ServiceMethods(service)
+        super().__init__((host, port), ExchangeRequestHandler)
+
+
+class ExchangeRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1：默认保持连接，客户端可以用同一个连接发送多个请求
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次发送，开着 Nagle 算法时每个请求都要等对方的延迟确认（约 40 毫秒）
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        try:
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                raise ServiceError('请求格式错误：Content-Length 不是整数')
+            args, token = parse_request(self.rfile.read(length))
+            status, body = 200, {'result': self.server.methods.call(self.path.strip('/'), args, token)}
+        except Exception as e:
+            status, body = error_response(e)
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_request(self, code='-', size='-'):
+        # 每个请求都打印一行日志太多，只保留错误
+        pass
+
+
+def is_loopback(host):
+    '''
+    参数：
+    host (str): 监听地址
+    返回：
+    loopback (bool): 是否只接受本机连接
+    '''
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_host(parser, args):
+    '''
+    接口使用明文 HTTP，监听本机以外的地址时必须明确指定 --allow-remote。
+    '''
+    if not is_loopback(args.host) and not args.allow_remote:
+        parser.error(f'监听地址 {args.host} 不是本机地址，接口使用明文 HTTP，确实需要时请加 --allow-remote')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='物品服务进程')
+    parser.add_argument('--storage', choices=['pickle', 'sqlite'], default='pickle', help='存储引擎')
+    parser.add_argument('--write-delay', type=float, default=0.1, help='延迟写入的时间窗口（秒），0 表示每次改动立即写入')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--allow-remote', action='store_true', help='允许监听本机以外的地址')
+    args = parser.parse_args(argv)
+    check_host(parser, args)
+
+    service = ExchangeService(args.storage, write_delay=args.write_delay)
+    server = ExchangeServer(service, args.host, args.port)
+    print(f'物品服务已启动：http://{server.server_address[0]}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,595 @@
+"""
+业务服务层
+用户、物品类型、物品和搜索的业务逻辑都在这里实现，不依赖 Tkinter：图形界面只负责收集输入和显示结果，
+脚本、后台进程和性能测试也可以直接调用这些服务，不需要显示器和 Tk 事件循环。
+业务上的错误通过 ServiceError 抛出，异常信息可以直接显示给用户。
+物品目录可以在后台线程中加载（ExchangeService 的 background_load），用户相关的操作（登录、注册、审核）和读取物品类型不需要等待；
+用到物品的操作（标记了 needs_items）会先等待加载完成。
+"""
+import bisect
+import functools
+import threading
+
+from repository import ItemCatalog, ItemTypeRegistry, UserRepository
+from schema import SchemaMigrator, detect_renames, evolve
+from scoring import ScoringEngine
+from storage import StorageEngine, open_storage
+from write_behind import WriteBehindStorage
+
+# 物品的公共信息字段
+ITEM_FIELDS = ('物品名称', '物品描述', '物品地址', '联系人手机', '邮箱')
+
+
+def needs_items(method):
+    '''
+    装饰器：物品目录加载完成后才执行方法（物品可能还在后台加载）。
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.catalog.wait_loaded()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def all_text(values):
+    '''
+    物品的公共信息、类型名称、属性名称和属性值都必须是字符串：其他类型的值写入之后，建立搜索索引时会出错，
+    以后每次加载物品都会失败。
+    参数：
+    values (iterable): 要检查的值
+    返回：
+    text (bool): 是否都是字符串
+    '''
+    return all(isinstance(value, str) for value in values)
+
+
+class ServiceError(Exception):
+    '''
+    业务错误，异常信息是给用户看的提示。
+    '''
+
+
+class NotRegisteredError(ServiceError):
+    '''
+    登录的用户还没有注册。
+    '''
+
+
+class ImportValidationError(ServiceError):
+    '''
+    批量导入的数据有错误，没有导入任何物品。errors 是 (行号, 错误信息) 的列表。
+    '''
+    def __init__(self, message, errors):
+        super().__init__(message)
+        self.errors = errors
+
+
+class UserService:
+    def __init__(self, users):
+        '''
+        初始化函数
+        参数：
+        users (UserRepository): 用户数据仓库
+        '''
+        self.users = users
+
+    def login(self, name, password):
+        '''
+        检查用户名、密码和审核状态。
+        参数：
+        name (str): 用户名
+        password (str): 密码
+        返回：
+        role (str): 'admin' 表示管理员，'user' 表示普通用户
+        '''
+        user_info = self.users.get(name)
+        if user_info is None:
+            raise NotRegisteredError('你还没有注册，请先注册')
+        if password != user_info['password']:
+            raise ServiceError('错误提示：密码不对，请重试')
+        if user_info['status'] != 'approved':
+            raise ServiceError('错误提示：用户未审核通过，请联系管理员')
+        return 'admin' if name == 'admin' else 'user'
+
+    def sign_up(self, name, password, password_confirm, address, contact):
+        '''
+        注册新用户，新用户需要等待管理员审核。
+        参数：
+        name (str): 用户名
+        password (str): 密码
+        password_confirm (str): 确认密码
+        address (str): 地址
+        contact (str): 联系方式
+        '''
+        if password != password_confirm:
+            raise ServiceError('密码和确认密码必须一样')
+        if not self.users.add(name, {'password': password, 'status': 'pending', 'address': address, 'contact': contact}):
+            raise ServiceError('用户名已存在！')
+
+    def set_status(self, name, status):
+        '''
+        修改用户的审核状态。
+        参数：
+        name (str): 用户名
+        status (str): 'approved' 或 'rejected'
+        '''
+        user_info = self.users.get(name)
+        if user_info is None:
+            raise ServiceError('用户不存在')
+        user_info['status'] = status
+        self.users.save(name, user_info)
+
+    def set_status_many(self, names, status):
+        '''
+        一次修改多个用户的审核状态，所有改动一次写入；有用户不存在时不修改任何用户。
+        参数：
+        names (iterable): 用户名
+        status (str): 'approved' 或 'rejected'
+        返回：
+        names (list): 修改了的用户名
+        '''
+        users = {}
+        for name in names:
+            user_info = self.users.get(name)
+            if user_info is None:
+                raise ServiceError(f'用户不存在：{name}')
+            user_info['status'] = status
+            users[name] = user_info
+        if users:
+            self.users.save_many(users)
+        return list(users)
+
+    def approve(self, name):
+        '''
+        批准新用户注册。
+        参数：
+        name (str): 用户名
+        '''
+        self.set_status(name, 'approved')
+
+    def reject(self, name):
+        '''
+        拒绝新用户注册。
+        参数：
+        name (str): 用户名
+        '''
+        self.set_status(name, 'rejected')
+
+    def approve_many(self, names):
+        '''
+        批量批准新用户注册。
+        参数：
+        names (iterable): 用户名
+        返回：
+        names (list): 批准了的用户名
+        '''
+        return self.set_status_many(names, 'approved')
+
+    def reject_many(self, names):
+        '''
+        批量拒绝新用户注册。
+        参数：
+        names (iterable): 用户名
+        返回：
+        names (list): 拒绝了的用户名
+        '''
+        return self.set_status_many(names, 'rejected')
+
+    def get(self, name):
+        '''
+        参数：
+        name (str): 用户名
+        返回：
+        user_info (dict): 用户信息
+        '''
+        user_info = self.users.get(name)
+        if user_info is None:
+            raise ServiceError('用户不存在')
+        return user_info
+
+    def list(self, status=None):
+        '''
+        参数：
+        status (str): 只返回该状态的用户，为 None 时返回所有用户
+        返回：
+        names (list): 用户名列表
+        '''
+        return self.users.list(status)
+
+
+class ItemTypeService:
+    def __init__(self, registry, catalog, migrator):
+        '''
+        初始化函数
+        参数：
+        registry (ItemTypeRegistry): 物品类型表
+        catalog (ItemCatalog): 物品目录
+        migrator (SchemaMigrator): 物品类型版本的升级器
+        '''
+        self.registry = registry
+        self.catalog = catalog
+        self.migrator = migrator
+
+    @property
+    def version(self):
+        '''
+        物品类型的版本号，每次变化后加一。
+        '''
+        return self.registry.version
+
+    def names(self):
+        '''
+        返回：
+        names (list): 所有物品类型的名称
+        '''
+        return self.registry.names()
+
+    def properties(self, name):
+        '''
+        参数：
+        name (str): 物品类型名称
+        返回：
+        properties (list): 该类型的属性名称
+        '''
+        item_type = self.registry.get(name)
+        if item_type is None:
+            raise ServiceError(f"物品类型 '{name}' 不存在")
+        return item_type['properties']
+
+    @needs_items
+    def add(self, name, properties):
+        '''
+        添加物品类型。
+        参数：
+        name (str): 物品类型名称
+        properties (list): 属性名称，空白的属性会被忽略
+        '''
+        if not name:
+            raise ServiceError('请输入物品类型名称')
+        if not all_text([name, *properties]):
+            raise ServiceError('物品类型名称和属性名称必须是文本')
+        item_types = dict(self.registry.all())
+        # 已有同名类型时作为它的新版本，该类型的物品随后升级
+        item_types[name] = evolve(item_types.get(name), [prop for prop in properties if prop.strip() != ""])
+        self.registry.save(item_types)
+        self.migrator.type_modified(name)
+
+    @needs_items
+    def modify(self, old_name, new_name, properties):
+        '''
+        修改物品类型的名称和属性。只写入物品类型的新版本，该类型的物品在读取时升级，并由后台分批写回
+        （见 schema.py）；被改名的属性保留原来的值。
+        参数：
+        old_name (str): 原物品类型名称
+        new_name (str): 新物品类型名称
+        properties (list): 新的属性名称，按输入框的顺序与原来的属性对应，空白的属性会被忽略
+        '''
+        if not old_name:
+            raise ServiceError('请选择要修改的物品类型')
+        if not all_text([old_name, new_name, *properties]):
+            raise ServiceError('物品类型名称和属性名称必须是文本')
+        entries = [prop.strip() for prop in properties]
+        properties = [prop for prop in entries if prop]  # 移除空属性
+        if not new_name or not properties:
+            raise ServiceError('请输入新的物品类型名称和属性')
+        item_types = dict(self.registry.all())
+        if old_name not in item_types:
+            raise ServiceError(f"物品类型 '{old_name}' 不存在")
+        renamed = old_name != new_name
+        if renamed and new_name in item_types:
+            raise ServiceError(f"物品类型 '{new_name}' 已存在")
+        old_type = item_types[old_name]
+        renames = detect_renames(old_type['properties'], entries)
+        # 写入物品类型的新版本，删除原来的名称
+        item_types[new_name] = evolve(old_type, properties, renames, former_name=old_name if renamed else None)
+        if renamed:
+            del item_types[old_name]
+        self.registry.save(item_types)
+        if renamed:
+            self.catalog.rename_type(old_name, new_name)
+        self.migrator.type_modified(new_name)
+
+
+class ItemService:
+    def __init__(self, catalog, registry, migrator):
+        '''
+        初始化函数
+        参数：
+        catalog (ItemCatalog): 物品目录
+        registry (ItemTypeRegistry): 物品类型表
+        migrator (SchemaMigrator): 物品类型版本的升级器
+        '''
+        self.catalog = catalog
+        self.registry = registry
+        self.migrator = migrator
+
+    @needs_items
+    def all(self):
+        '''
+        返回：
+        items (list): 内存中的所有物品（只读）
+        '''
+        return self.catalog.items
+
+    @needs_items
+    def filter_by_name(self, text):
+        '''
+        参数：
+        text (str): 筛选文本
+        返回：
+        items (list): 名称中包含 text 的物品
+        '''
+        return self.catalog.filter_by_name(text)
+
+    @needs_items
+    def add(self, item_type, fields, property_values):
+        '''
+        添加物品。
+        参数：
+        item_type (str): 物品类型名称
+        fields (dict): 物品的公共信息（物品名称、物品描述、物品地址、联系人手机、邮箱）
+        property_values (list): 按物品类型中属性的顺序填写的属性值
+        返回：
+        item (dict): 添加的物品信息
+        '''
+        # 检查是否填写了必填字段
+        if not item_type or any(not fields.get(key) for key in ITEM_FIELDS):
+            raise ServiceError('所有字段必须填写！')
+        if not all_text([item_type, *(fields[key] for key in ITEM_FIELDS), *property_values]):
+            raise ServiceError('物品信息和属性值必须是文本')
+        item_type_info = self.registry.get(item_type)
+        if item_type_info is None:
+            raise ServiceError(f"物品类型 '{item_type}' 不存在")
+        property_names = item_type_info['properties']
+        if len(property_values) != len(property_names):
+            raise ServiceError(f"物品类型 '{item_type}' 有 {len(property_names)} 个属性，填写了 {len(property_values)} 个")
+        properties = {property_names[i]: value for i, value in enumerate(property_values)}
+        # 检查是否有空值
+        if any(value == "" for value in properties.values()):
+            raise ServiceError('所有属性字段必须填写！')
+        item_info = {key: fields[key] for key in ITEM_FIELDS}
+        item_info['type'] = item_type
+        item_info['properties'] = properties
+        item_info['schema_version'] = self.migrator.current_version(item_type)
+        return self.catalog.add(item_info)
+
+    @needs_items
+    def import_items(self, rows, batch_size=1000, skip_invalid=False):
+        '''
+        批量导入物品：逐批检查物品类型、公共信息和属性，全部检查完后一次写入。
+        参数：
+        rows (iterable): (行号, 物品信息字典)，物品信息包括公共信息、'type' 和 'properties'；
+            可以是逐行读取文件的生成器（见 bulk.py），行号是文件中的行号，错误信息中使用它
+        batch_size (int): 每批检查的行数，每批读取一次物品类型
+        skip_invalid (bool): 为 True 时跳过有错误的行，只导入正确的行；为 False 时有任何错误都不导入
+        返回：
+        imported (int): 导入的物品数
+        errors (list): (行号, 错误信息)
+        '''
+        valid, errors, batch = [], [], []
+        for line, row in rows:
+            batch.append((line, row))
+            if len(batch) >= batch_size:
+                self._validate_batch(batch, valid, errors)
+                batch = []
+        self._validate_batch(batch, valid, errors)
+        if errors and not skip_invalid:
+            details = '\n'.join(f'第 {line} 行：{message}' for line, message in errors[:10])
+            raise ImportValidationError(f'有 {len(errors)} 行数据有错误，没有导入任何物品：\n{details}', errors)
+        self.catalog.add_many(valid)
+        return len(valid), errors
+
+    def _validate_batch(self, batch, valid, errors):
+        '''
+        检查一批行，正确的行转换为物品信息放入 valid，错误放入 errors。
+        '''
+        item_types = self.registry.all()
+        versions = {}
+        for line, row in batch:
+            item_type = row.get('type')
+            if not item_type or any(not row.get(key) for key in ITEM_FIELDS):
+                errors.append((line, '所有字段必须填写！'))
+                continue
+            properties = row.get('properties') or {}
+            if not isinstance(properties, dict) or not all_text([item_type, *(row[key] for key in ITEM_FIELDS),
+                                                                 *properties, *properties.values()]):
+                errors.append((line, '物品信息和属性值必须是文本'))
+                continue
+            if item_type not in item_types:
+                errors.append((line, f"物品类型 '{item_type}' 不存在"))
+                continue
+            property_names = item_types[item_type]['properties']
+            unknown = [key for key, value in properties.items() if key not in property_names and value]
+            if unknown:
+                errors.append((line, f"物品类型 '{item_type}' 没有属性：{'、'.join(unknown)}"))
+                continue
+            if any(not properties.get(prop) for prop in property_names):
+                errors.append((line, '所有属性字段必须填写！'))
+                continue
+            if item_type not in versions:
+                versions[item_type] = self.migrator.current_version(item_type)
+            item_info = {key: row[key] for key in ITEM_FIELDS}
+            item_info['type'] = item_type
+            item_info['properties'] = {prop: properties[prop] for prop in property_names}
+            item_info['schema_version'] = versions[item_type]
+            valid.append(item_info)
+
+    @needs_items
+    def export(self, item_type=None):
+        '''
+        逐个产生要导出的物品，不复制整个物品列表；物品都已经升级到其类型的当前版本。
+        参数：
+        item_type (str): 只导出该类型的物品，为 None 时导出所有物品
+        返回：
+        items (generator): 物品
+        '''
+        if item_type is not None and self.registry.get(item_type) is None:
+            raise ServiceError(f"物品类型 '{item_type}' 不存在")
+        self.migrator.refresh()
+        return (self.migrator.upgrade(item) for item in self.catalog.iter_items(item_type))
+
+    @needs_items
+    def upgrade(self, item):
+        '''
+        显示或修改物品的属性之前调用，把物品升级到其类型的当前版本。
+        参数：
+        item (dict): 物品信息
+        返回：
+        item (dict): 同一个物品对象
+        '''
+        self.migrator.refresh()
+        return self.migrator.upgrade(item)
+
+    @needs_items
+    def modify(self, item, fields, properties=None):
+        '''
+        修改物品信息。
+        参数：
+        item (dict): 被修改的物品
+        fields (dict): 修改后的公共信息
+        properties (dict): 修改后的属性，为 None 时不修改
+        '''
+        unknown = [key for key in fields if key not in ITEM_FIELDS]
+        if unknown:
+            raise ServiceError(f"不能修改物品的 {'、'.join(map(str, unknown))}")
+        if not all_text(fields.values()) or (properties is not None and not all_text([*properties, *properties.values()])):
+            raise ServiceError('物品信息和属性值必须是文本')
+        self.migrator.refresh()
+        with self.catalog.lock:
+            self.migrator.upgrade(item)
+            for key, value in fields.items():
+                item[key] = value
+            if properties is not None:
+                item['properties'] = properties
+            self.catalog.modify([item])
+            self.migrator.saved(item)
+
+    @needs_items
+    def delete(self, item):
+        '''
+        删除物品。
+        参数：
+        item (dict): 被删除的物品
+        '''
+        self.catalog.delete(item)
+
+
+class SearchService:
+    def __init__(self, catalog, scorer, migrator):
+        '''
+        初始化函数
+        参数：
+        catalog (ItemCatalog): 物品目录
+        scorer (ScoringEngine): 模糊匹配打分引擎
+        migrator (SchemaMigrator): 物品类型版本的升级器
+        '''
+        self.catalog = catalog
+        self.scorer = scorer
+        self.migrator = migrator
+
+    @needs_items
+    def search(self, item_type, keyword, threshold=50, cancelled=None, after_id=None):
+        '''
+        搜索物品：物品名称或描述与关键字的相似度高于阈值则认为匹配成功。可以在后台线程中调用（见 search_worker.py）。
+        参数：
+        item_type (str): 物品类型名称
+        keyword (str): 搜索关键字
+        threshold (int): 相似度阈值
+        cancelled (function): cancelled() 返回 True 时停止打分（在每批候选物品之间检查），为 None 时不检查
+        after_id (int): 只搜索编号大于它的物品（按页取用结果时从上一页的最后一个物品之后继续），为 None 时从头开始
+        返回：
+        matches (generator): 按物品列表中的顺序逐批产生匹配的物品
+        '''
+        if not item_type or not keyword:
+            raise ServiceError('物品类型和关键字不能为空！')
+        # 只读取其他程序对物品做的改动，然后在该类型的分区中从索引取出候选物品，只对候选物品计算相似度
+        self.catalog.refresh()
+        candidates = self.catalog.search_candidates(keyword, item_type, threshold)
+        if after_id is not None:
+            candidates = candidates[bisect.bisect_right(candidates, after_id, key=lambda x: x['id']):]
+        self.migrator.refresh()
+        # 相似度只看名称和描述，只有匹配的物品需要升级属性
+        matches = self.scorer.iter_match(keyword, candidates, threshold, cancelled)
+        return (self.migrator.upgrade(item) for item in matches)
+
+
+class ExchangeService:
+    def __init__(self, storage='pickle', scorer=None, write_delay=None, background_load=False):
+        '''
+        初始化函数，打开存储引擎并加载物品信息。
+        参数：
+        storage (str 或 StorageEngine): 存储引擎名称（'pickle' 或 'sqlite'），也可以直接传入存储引擎对象
+        scorer (ScoringEngine): 模糊匹配打分引擎，默认新建一个
+        write_delay (float): 延迟写入的时间窗口（秒），窗口内的改动在后台一次写入；为 None 或 0 时每次改动立即写入
+        background_load (bool): 为 True 时在后台线程中加载物品和建立索引，构造函数立即返回，登录等操作不必等待；
+            用到物品的操作会等待加载完成（见 is_loaded 和 wait_loaded）
+        '''
+        self.storage = storage if isinstance(storage, StorageEngine) else open_storage(storage)
+        if write_delay:
+            self.storage = WriteBehindStorage(self.storage, write_delay)
+        registry = ItemTypeRegistry(self.storage)
+        self.migrator = SchemaMigrator(registry)
+        self.catalog = ItemCatalog(self.storage, prepare=self.migrator.prepare)
+        self.scorer = scorer or ScoringEngine()
+        self.users = UserService(UserRepository(self.storage))
+        self.item_types = ItemTypeService(registry, self.catalog, self.migrator)
+        self.items = ItemService(self.catalog, registry, self.migrator)
+        self.search = SearchService(self.catalog, self.scorer, self.migrator)
+        self._loader = None
+        if background_load:
+            self._loader = threading.Thread(target=self._load_items, name='catalog-loader', daemon=True)
+            self._loader.start()
+        else:
+            self._load_items()
+
+    def _load_items(self):
+        '''
+        加载物品、建立索引并启动物品类型的后台升级，然后标记物品可用。
+        '''
+        try:
+            self.catalog.load()
+            self.migrator.attach(self.catalog)
+        except Exception as e:
+            # 等待物品的操作不能一直等下去，把失败的原因告诉它们
+            self.catalog.mark_loaded(ServiceError(f'物品信息加载失败：{e}'))
+            raise
+        self.catalog.mark_loaded()
+
+    def is_loaded(self):
+        '''
+        返回：
+        loaded (bool): 物品是否已经加载完成（加载失败也算完成）
+        '''
+        return self.catalog.loaded.is_set()
+
+    def wait_loaded(self, timeout=None):
+        '''
+        等待物品加载完成。
+        参数：
+        timeout (float): 最长等待时间（秒），为 None 时一直等待
+        返回：
+        loaded (bool): 是否已经加载完成；加载失败时抛出 ServiceError
+        '''
+        return self.catalog.wait_loaded(timeout)
+
+    def flush(self):
+        '''
+        立即写入所有延迟写入的改动。写入失败，或者物品类型修改后后台写回物品失败时抛出异常。
+        '''
+        self.storage.flush()
+        self._check_migrator()
+
+    def close(self):
+        '''
+        写入剩下的改动，释放存储引擎和打分进程池；全部释放后，后台写回物品失败过时抛出 ServiceError。
+        '''
+        if self._loader is not None:
+            self._loader.join()
+        self.migrator.close()
+        self.scorer.close()
+        self.storage.close()
+        self._check_migrator()
+
+    def _check_migrator(self):
+        if self.migrator.last_error is not None:
+            raise ServiceError(f'升级后的物品写回失败（下次读取或启动时会再次升级）：{self.migrator.last_error}')
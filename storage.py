@@ -0,0 +1,754 @@
+"""
+存储引擎
+用户、物品类型和物品信息的读写统一通过存储引擎完成，ExchangeSystemApp 启动时可以选择：
+1. PickleStorage：沿用原来的 item_types.pickle、item_info.pickle 两个文件，物品信息默认使用追加日志保存；
+   用户每人一个文件（见 user_store.py），原来的 usrs_info.pickle 在第一次使用时迁移。
+2. SQLiteStorage：使用标准库 sqlite3，把用户、物品类型和物品分别存到三张表中，并在物品类型、物品名称和用户状态上建立索引，
+   查询和单条记录的修改不再随数据量增长。第一次打开时会把已有的三个 pickle 文件一次性迁移进数据库。
+多个程序可以同时使用同一个数据目录：整文件写入都在文件锁中先写临时文件再改名；
+写入前发现文件已被其他程序修改时，只把本程序的改动（相对于上次读取或写入时的数据）合并到文件中的最新数据上，
+不会覆盖其他程序的改动。物品编号由各个程序共享的计数器分配。
+"""
+import copy
+import json
+import os
+import pickle
+import sqlite3
+
+from file_lock import FileLock, SharedCounter, atomic_write
+from item_log import ItemLog, file_stamp
+from item_model import Item, pack_items
+from user_store import UserStore
+
+# 默认的管理员账户和物品类型，数据文件不存在时使用
+DEFAULT_USERS = {'admin': {'password': '123456', 'status': 'approved', 'address': 'SJTU', 'contact': 'zhangsiyao618@163.com'}}
+DEFAULT_ITEM_TYPES = {'书籍': {'properties': ['作者','出版社']}, '食品': {'properties': ['生产日期','保质期']}, '工具': {'properties': ['品牌','型号']}}
+
+
+def merge_changes(current, ours, base, token):
+    '''
+    三方合并：把本程序的改动合并到文件中的最新数据上，按键逐个比较。
+    本程序添加或修改了的键使用本程序的值，本程序删除了的键被删除，其余的键保留文件中的值（包括其他程序的改动）；
+    两边都修改了同一个键时以本程序（后写入的一方）为准。
+    参数：
+    current (dict): 文件中的最新数据，合并结果直接写入其中
+    ours (dict): 本程序要写入的数据
+    base (dict): 本程序上次读取或写入时每个键的 token
+    token (function): token(值) 返回用于比较是否修改过的值
+    返回：
+    current (dict): 合并后的数据
+    '''
+    for key, value in ours.items():
+        if key not in base or base[key] != token(value):
+            current[key] = value
+    for key in base.keys() - ours.keys():
+        current.pop(key, None)
+    return current
+
+
+def item_fingerprint(item):
+    '''
+    参数：
+    item (dict): 物品信息
+    返回：
+    fingerprint (int): 物品内容的哈希值，与键的顺序无关，用来判断物品是否被修改过
+    '''
+    return hash((frozenset((key, value) for key, value in item.items() if key != 'properties'),
+                 frozenset(item['properties'].items())))
+
+
+class StorageEngine:
+    '''
+    存储引擎的公共接口，子类需要实现下面的所有方法。
+    '''
+    # 是否每次改动物品后都需要调用 save_items 全量保存（整文件模式）
+    writes_full_items = False
+
+    def load_users(self):
+        '''
+        返回：
+        usrs_info (dict): 用户名到用户信息的字典
+        '''
+        raise NotImplementedError
+
+    def get_user(self, name):
+        '''
+        参数：
+        name (str): 用户名
+        返回：
+        user_info (dict): 用户信息，用户不存在时返回 None
+        '''
+        raise NotImplementedError
+
+    def list_users(self, status=None):
+        '''
+        参数：
+        status (str): 只返回该状态的用户，为 None 时返回所有用户
+        返回：
+        names (list): 用户名列表
+        '''
+        raise NotImplementedError
+
+    def save_user(self, name, user_info):
+        '''
+        参数：
+        name (str): 用户名
+        user_info (dict): 用户信息
+        '''
+        raise NotImplementedError
+
+    def add_user(self, name, user_info):
+        '''
+        写入一个新用户，检查用户名是否已存在和写入是一步完成的。
+        参数：
+        name (str): 用户名
+        user_info (dict): 用户信息
+        返回：
+        added (bool): 是否写入；用户已存在时返回 False
+        '''
+        raise NotImplementedError
+
+    def save_users(self, usrs_info, changed):
+        '''
+        保存用户数据，默认只逐个写入发生变化的用户。
+        参数：
+        usrs_info (dict): 完整的用户数据
+        changed (list): 发生变化的用户名
+        '''
+        for name in changed:
+            self.save_user(name, usrs_info[name])
+
+    def users_stamp(self):
+        '''
+        返回用户数据的变化标记，标记不同说明数据被修改过。
+        '''
+        raise NotImplementedError
+
+    def load_item_types(self):
+        '''
+        返回：
+        item_types (dict): 物品类型名称到类型定义的字典
+        '''
+        raise NotImplementedError
+
+    def save_item_types(self, item_types):
+        '''
+        参数：
+        item_types (dict): 物品类型数据
+        '''
+        raise NotImplementedError
+
+    def item_types_stamp(self):
+        '''
+        返回物品类型数据的变化标记，标记不同说明数据被修改过。
+        '''
+        raise NotImplementedError
+
+    def load_items(self):
+        '''
+        返回：
+        items (list): 物品信息数据，每个物品都带有编号 'id'
+        '''
+        raise NotImplementedError
+
+    def load_item_changes(self):
+        '''
+        读取上次加载之后数据文件中发生的变化（例如其他程序添加、修改、删除的物品）。
+        返回：
+        records (list): (操作, 物品编号, 物品信息) 组成的列表，操作为 'add'、'modify' 或 'delete'；
+                        无法只读取增量时返回 None，调用方需要重新加载全部物品
+        '''
+        raise NotImplementedError
+
+    def save_items(self, items):
+        '''
+        全量保存物品信息。
+        参数：
+        items (list): 物品信息数据
+        '''
+        raise NotImplementedError
+
+    def add_item(self, item):
+        '''
+        添加一个物品，并为其分配编号。
+        参数：
+        item (dict): 物品信息
+        '''
+        raise NotImplementedError
+
+    def modify_item(self, item):
+        '''
+        参数：
+        item (dict): 修改后的物品信息
+        '''
+        raise NotImplementedError
+
+    def delete_item(self, item):
+        '''
+        参数：
+        item (dict): 被删除的物品信息
+        '''
+        raise NotImplementedError
+
+    def allocate_item_id(self):
+        '''
+        预先分配一个物品编号（延迟写入时物品在写入之前就需要编号）。
+        返回：
+        item_id (int): 物品编号
+        '''
+        raise NotImplementedError
+
+    def allocate_item_ids(self, count):
+        '''
+        一次预先分配多个物品编号（批量导入）。
+        参数：
+        count (int): 编号个数
+        返回：
+        item_ids (list): 物品编号
+        '''
+        return [self.allocate_item_id() for _ in range(count)]
+
+    def write_batch(self, usrs_info=None, changed_users=(), item_types=None, items=None, item_records=()):
+        '''
+        一次写入一批改动（成组提交）。默认逐项调用上面的方法，子类可以把它们合并成一次写入。
+        参数：
+        usrs_info (dict): 完整的用户数据，为 None 时用户没有改动
+        changed_users (iterable): 发生变化的用户名
+        item_types (dict): 物品类型数据，为 None 时没有改动
+        items (list): 需要全量保存的物品信息，为 None 时不全量保存；先于 item_records 写入
+        item_records (list): (操作, 物品编号, 物品信息) 组成的列表，物品都已经有编号
+        '''
+        if usrs_info is not None:
+            self.save_users(usrs_info, list(changed_users))
+        if item_types is not None:
+            self.save_item_types(item_types)
+        if items is not None:
+            self.save_items(items)
+        for op, _, item in item_records:
+            getattr(self, f'{op}_item')(item)
+
+    def flush(self):
+        '''
+        把尚未写入的改动写入磁盘。同步写入的存储引擎不需要做任何事。
+        '''
+
+    def close(self):
+        '''
+        释放存储引擎占用的资源。
+        '''
+
+
+class PickleStorage(StorageEngine):
+    def __init__(self, data_dir='.', persistence='log'):
+        '''
+        初始化函数
+        参数：
+        data_dir (str): 数据文件所在目录
+        persistence (str): 物品信息的保存方式，'log' 为追加日志（每次改动只追加一条记录），'pickle' 为每次改动重写整个文件
+        '''
+        # 旧版本的用户文件，第一次使用时迁移到按用户名存取的 users 目录中
+        self.users_file = os.path.join(data_dir, 'usrs_info.pickle')
+        self.user_store = UserStore(os.path.join(data_dir, 'users'))
+        self.item_types_file = os.path.join(data_dir, 'item_types.pickle')
+        self.item_info_file = os.path.join(data_dir, 'item_info.pickle')
+        self.item_log = ItemLog(self.item_info_file) if persistence == 'log' else None
+        self.item_types_lock = FileLock(self.item_types_file + '.lock')
+        # 上次读取或写入物品类型时文件的变化标记和内容，写入时据此判断并合并其他程序的修改
+        self._item_types_stamp = None
+        self._item_types_base = {}
+        # 整文件模式下与追加日志使用同一把锁和同一个编号计数器
+        if self.item_log is not None:
+            self.items_lock, self.item_ids = self.item_log.file_lock, self.item_log.ids
+        else:
+            self.items_lock = FileLock(self.item_info_file + '.lock')
+            self.item_ids = SharedCounter(self.item_info_file + '.ids', self.items_lock)
+        self._next_item_id = 1
+        self._items_stamp = None
+        self._items_base = {}  # 整文件模式：物品编号 -> 上次读取或写入时的 item_fingerprint
+
+    def _users(self):
+        '''
+        返回按用户名存取的用户数据。第一次使用时创建：有旧的 usrs_info.pickle 就迁移其中的账户，
+        否则写入默认的管理员账户。
+        '''
+        if not self.user_store.exists():
+            try:
+                with open(self.users_file, 'rb') as usr_file:
+                    usrs_info = pickle.load(usr_file)
+            except FileNotFoundError:
+                usrs_info = {name: dict(info) for name, info in DEFAULT_USERS.items()}
+            self.user_store.create(usrs_info)
+        return self.user_store
+
+    def load_users(self):
+        '''
+        加载所有用户数据（需要读取每一个用户，只在迁移等场合使用）。
+        '''
+        return self._users().load_all()
+
+    def save_users(self, usrs_info, changed=None):
+        '''
+        保存发生变化的用户，每个用户单独写入。
+        参数：
+        usrs_info (dict): 用户数据（可以只包含发生变化的用户）
+        changed (list): 发生变化的用户名，为 None 时写入 usrs_info 中的所有用户
+        '''
+        store = self._users()
+        for name in (usrs_info if changed is None else changed):
+            store.put(name, usrs_info[name])
+
+    def users_stamp(self):
+        return self._users().stamp()
+
+    def get_user(self, name):
+        return self._users().get(name)
+
+    def list_users(self, status=None):
+        return self._users().list(status)
+
+    def save_user(self, name, user_info):
+        self._users().put(name, user_info)
+
+    def add_user(self, name, user_info):
+        return self._users().add(name, user_info)
+
+    def load_item_types(self):
+        '''
+        加载物品类型数据，如果文件不存在则创建一个新文件，并设置默认的物品类型。
+        '''
+        with self.item_types_lock:
+            item_types = self._read_item_types()
+            if item_types is None:
+                item_types = {name: {'properties': list(info['properties'])} for name, info in DEFAULT_ITEM_TYPES.items()}
+                self.save_item_types(item_types)
+                return item_types
+            self._item_types_stamp = file_stamp(self.item_types_file)
+            self._item_types_base = copy.deepcopy(item_types)
+        return item_types
+
+    def _read_item_types(self):
+        try:
+            with open(self.item_types_file, 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save_item_types(self, item_types):
+        '''
+        保存物品类型。文件在上次读取之后被其他程序修改过时，只把本程序修改过的物品类型合并进去。
+        '''
+        with self.item_types_lock:
+            merged = item_types
+            if file_stamp(self.item_types_file) != self._item_types_stamp:
+                current = self._read_item_types()
+                if current is not None:
+                    merged = merge_changes(current, item_types, self._item_types_base, lambda info: info)
+            atomic_write(self.item_types_file, lambda file: pickle.dump(merged, file))
+            # 合并了其他程序的修改时，内存中的数据与文件不一致，下次写入仍需合并
+            self._item_types_stamp = file_stamp(self.item_types_file) if merged is item_types else None
+            self._item_types_base = copy.deepcopy(item_types)
+
+    def item_types_stamp(self):
+        return file_stamp(self.item_types_file)
+
+    def load_items(self):
+        '''
+        加载物品信息数据，如果文件不存在则返回空列表。
+        '''
+        if self.item_log is not None:
+            return self.item_log.load()
+        with self.items_lock:
+            items = self._read_items()
+            self._items_stamp = file_stamp(self.item_info_file)
+        self._next_item_id = max((item.get('id', 0) for item in items), default=0) + 1
+        for item in items:
+            self._assign_id(item)
+        self._items_base = {item['id']: item_fingerprint(item) for item in items}
+        return items
+
+    def _read_items(self):
+        try:
+            with open(self.item_info_file, 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError):
+            return []
+
+    def save_items(self, items):
+        '''
+        全量保存物品。整文件模式下，文件在上次读取之后被其他程序修改过时，
+        只把本程序添加、修改、删除的物品合并进去，其他程序的改动在下次刷新时读入。
+        '''
+        if self.item_log is not None:
+            self.item_log.rewrite(items)
+            return
+        for item in items:
+            self._assign_id(item)
+        with self.items_lock:
+            merged = items
+            if file_stamp(self.item_info_file) != self._items_stamp:
+                current = {item['id']: item for item in self._read_items() if 'id' in item}
+                merged = merge_changes(current, {item['id']: item for item in items}, self._items_base, item_fingerprint)
+                merged = sorted(merged.values(), key=lambda item: item['id'])
+            atomic_write(self.item_info_file, lambda f: pickle.dump(pack_items(merged), f))
+            # 合并了其他程序的改动时让 load_item_changes 返回 None，物品目录随后重新加载
+            self._items_stamp = file_stamp(self.item_info_file) if merged is items else None
+        self._items_base = {item['id']: item_fingerprint(item) for item in items}
+
+    def load_item_changes(self):
+        if self.item_log is not None:
+            return self.item_log.changes()
+        # 整文件模式下只能判断文件是否变化
+        return [] if file_stamp(self.item_info_file) == self._items_stamp else None
+
+    def add_item(self, item):
+        # 整文件模式下由调用方随后调用 save_items 保存
+        if self.item_log is not None:
+            self.item_log.add(item)
+        else:
+            self._assign_id(item)
+
+    def modify_item(self, item):
+        if self.item_log is not None:
+            self.item_log.modify(item)
+
+    def delete_item(self, item):
+        if self.item_log is not None:
+            self.item_log.delete(item)
+
+    def allocate_item_id(self):
+        return self.allocate_item_ids(1)[0]
+
+    def allocate_item_ids(self, count):
+        if self.item_log is not None:
+            return self.item_log.allocate_ids(count)
+        first = self.item_ids.reserve(count, self._next_item_id)
+        self._next_item_id = first + count
+        return range(first, first + count)
+
+    def write_batch(self, usrs_info=None, changed_users=(), item_types=None, items=None, item_records=()):
+        # 只写入变化的用户，物品类型重写一次文件，物品记录一次追加到日志
+        if usrs_info is not None:
+            self.save_users(usrs_info, changed_users)
+        if item_types is not None:
+            self.save_item_types(item_types)
+        if items is not None:
+            self.save_items(items)
+        if item_records and self.item_log is not None:
+            self.item_log.append(list(item_records))
+
+    def close(self):
+        if self.item_log is not None:
+            self.item_log.close()
+        self.item_types_lock.close()
+        self.item_ids.close()
+        self.items_lock.close()
+
+    def _assign_id(self, item):
+        if 'id' not in item:
+            item['id'] = self.allocate_item_id()
+
+    @property
+    def writes_full_items(self):
+        return self.item_log is None
+
+
+class SQLiteStorage(StorageEngine):
+    # 物品的公共信息字段与数据表列名的对应关系
+    ITEM_COLUMNS = (('物品名称', 'name'), ('物品描述', 'description'), ('物品地址', 'address'),
+                    ('联系人手机', 'phone'), ('邮箱', 'email'))
+    # item_changes 表最多保留的变更记录数
+    MAX_ITEM_CHANGES = 100000
+
+    def __init__(self, data_dir='.', db_name='exchange.db', migrate=True):
+        '''
+        初始化函数，打开（必要时创建）数据库，并在第一次打开时迁移已有的 pickle 数据。
+        参数：
+        data_dir (str): 数据文件所在目录
+        db_name (str): 数据库文件名
+        migrate (bool): 是否从同目录下的 pickle 文件迁移数据
+        '''
+        self.data_dir = data_dir
+        self.db_file = os.path.join(data_dir, db_name)
+        # 延迟写入时由后台线程提交，连接的使用由 WriteBehindStorage 加锁串行化
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self._changes_seq = 0  # 已经读取到的变更记录序号
+        self._item_types_base = {}  # 上次读取或写入时的物品类型，写入时只写入与之不同的部分
+        self._create_tables()
+        if self._get_meta('initialized') is None:
+            self._initialize(migrate)
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS users (
+                    name TEXT PRIMARY KEY, password TEXT, status TEXT, address TEXT, contact TEXT);
+                CREATE INDEX IF NOT EXISTS idx_users_status ON users(status);
+                CREATE TABLE IF NOT EXISTS item_types (name TEXT PRIMARY KEY, properties TEXT, schema TEXT DEFAULT '{}');
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY, name TEXT, description TEXT, address TEXT,
+                    phone TEXT, email TEXT, type TEXT, properties TEXT, schema_version INTEGER DEFAULT 0);
+                CREATE INDEX IF NOT EXISTS idx_items_type ON items(type);
+                CREATE INDEX IF NOT EXISTS idx_items_name ON items(name);
+                CREATE TABLE IF NOT EXISTS item_changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT, item_id INTEGER);
+                CREATE TRIGGER IF NOT EXISTS items_added AFTER INSERT ON items BEGIN
+                    INSERT INTO item_changes (op, item_id) VALUES ('add', NEW.id); END;
+                CREATE TRIGGER IF NOT EXISTS items_modified AFTER UPDATE ON items BEGIN
+                    INSERT INTO item_changes (op, item_id) VALUES ('modify', NEW.id); END;
+                CREATE TRIGGER IF NOT EXISTS items_deleted AFTER DELETE ON items BEGIN
+                    INSERT INTO item_changes (op, item_id) VALUES ('delete', OLD.id); END;
+            ''')
+            # 物品类型的版本历史和物品的版本号（见 schema.py），旧版本创建的数据库没有这两列
+            self._add_column('item_types', 'schema', "TEXT DEFAULT '{}'")
+            self._add_column('items', 'schema_version', 'INTEGER DEFAULT 0')
+            # 变更记录只保留最近的一部分，落后太多的读取方会重新加载全部物品
+            self.conn.execute('DELETE FROM item_changes WHERE seq <= (SELECT MAX(seq) FROM item_changes) - ?',
+                              (self.MAX_ITEM_CHANGES,))
+
+    def _add_column(self, table, column, definition):
+        columns = {row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')}
+        if column not in columns:
+            self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def _get_meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _initialize(self, migrate):
+        '''
+        一次性初始化数据库：如果同目录下有旧的 pickle 文件则迁移，否则写入默认的管理员账户和物品类型。
+        先按文件名检查有没有旧数据，没有时不打开 PickleStorage，不会在数据目录中创建 pickle 文件和锁文件。
+        '''
+        user_store = UserStore(os.path.join(self.data_dir, 'users'))
+        users_file, item_types_file, item_info_file = (
+            os.path.join(self.data_dir, name) for name in ('usrs_info.pickle', 'item_types.pickle', 'item_info.pickle'))
+        has_pickles = migrate and (user_store.exists() or any(
+            os.path.exists(path) for path in (users_file, item_types_file, item_info_file, item_info_file + '.log')))
+        usrs_info, item_types, items = DEFAULT_USERS, DEFAULT_ITEM_TYPES, []
+        if has_pickles:
+            # 只读取存在的文件：缺少的部分使用默认值，不让 PickleStorage 在迁移时补写
+            if user_store.exists():
+                usrs_info = user_store.load_all()
+            elif os.path.exists(users_file):
+                with open(users_file, 'rb') as usr_file:
+                    usrs_info = pickle.load(usr_file)
+            source = PickleStorage(self.data_dir, persistence='log')
+            try:
+                if os.path.exists(item_types_file):
+                    item_types = source.load_item_types()
+                items = source.load_items()
+            finally:
+                source.close()
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)',
+                                  [self._user_row(name, info) for name, info in usrs_info.items()])
+            self.conn.executemany('INSERT OR REPLACE INTO item_types VALUES (?, ?, ?)',
+                                  [self._item_type_row(name, info) for name, info in item_types.items()])
+            self.conn.executemany('INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                  [self._item_row(item) for item in items])
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('initialized', ?)",
+                              ('migrated' if has_pickles else 'default',))
+
+    @staticmethod
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    @staticmethod
+    def _user_row(name, info):
+        return (name, info['password'], info['status'], info.get('address', ''), info.get('contact', ''))
+
+    @staticmethod
+    def _user_info(row):
+        return {'password': row[0], 'status': row[1], 'address': row[2], 'contact': row[3]}
+
+    def _item_type_row(self, name, info):
+        # 属性列表单独一列，版本历史等其他信息放在 schema 列中
+        return (name, self._dumps(info['properties']),
+                self._dumps({key: value for key, value in info.items() if key != 'properties'}))
+
+    def _item_row(self, item):
+        return ((item.get('id'),) + tuple(item.get(key, '') for key, _ in self.ITEM_COLUMNS)
+                + (item['type'], self._dumps(dict(item['properties'])), item.get('schema_version', 0)))
+
+    def _item_info(self, row):
+        item = Item()
+        for (key, _), value in zip(self.ITEM_COLUMNS, row[1:6]):
+            item[key] = value
+        item['type'] = row[6]
+        item['properties'] = json.loads(row[7])
+        item['id'] = row[0]
+        if row[8]:
+            item['schema_version'] = row[8]
+        return item
+
+    def load_users(self):
+        rows = self.conn.execute('SELECT name, password, status, address, contact FROM users ORDER BY rowid')
+        return {row[0]: self._user_info(row[1:]) for row in rows}
+
+    def get_user(self, name):
+        row = self.conn.execute('SELECT password, status, address, contact FROM users WHERE name = ?', (name,)).fetchone()
+        return self._user_info(row) if row else None
+
+    def list_users(self, status=None):
+        if status is None:
+            rows = self.conn.execute('SELECT name FROM users ORDER BY rowid')
+        else:
+            rows = self.conn.execute('SELECT name FROM users WHERE status = ? ORDER BY rowid', (status,))
+        return [row[0] for row in rows]
+
+    def save_user(self, name, user_info):
+        with self.conn:
+            self._upsert_users([(name, user_info)])
+
+    def add_user(self, name, user_info):
+        with self.conn:
+            cursor = self.conn.execute('INSERT INTO users VALUES (?, ?, ?, ?, ?) ON CONFLICT(name) DO NOTHING',
+                                       self._user_row(name, user_info))
+        return cursor.rowcount == 1
+
+    def _upsert_users(self, users):
+        self.conn.executemany('''INSERT INTO users VALUES (?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET
+                                 password = excluded.password, status = excluded.status,
+                                 address = excluded.address, contact = excluded.contact''',
+                              [self._user_row(name, user_info) for name, user_info in users])
+
+    def save_users(self, usrs_info, changed):
+        with self.conn:
+            self._upsert_users([(name, usrs_info[name]) for name in changed])
+
+    def users_stamp(self):
+        # data_version 只在其他连接提交修改后才会变化
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    item_types_stamp = users_stamp
+
+    def load_item_types(self):
+        rows = self.conn.execute('SELECT name, properties, schema FROM item_types ORDER BY rowid')
+        item_types = {name: {'properties': json.loads(properties), **json.loads(schema or '{}')} for name, properties, schema in rows}
+        self._item_types_base = copy.deepcopy(item_types)
+        return item_types
+
+    def save_item_types(self, item_types):
+        with self.conn:
+            self._replace_item_types(item_types)
+
+    def _replace_item_types(self, item_types):
+        # 只写入本程序添加、修改、删除的物品类型，其他程序同时添加或修改的物品类型保持不变
+        base = self._item_types_base
+        self.conn.executemany('DELETE FROM item_types WHERE name = ?',
+                              [(name,) for name in base.keys() - item_types.keys()])
+        self.conn.executemany('''INSERT INTO item_types VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET
+                                 properties = excluded.properties, schema = excluded.schema''',
+                              [self._item_type_row(name, info) for name, info in item_types.items() if base.get(name) != info])
+        self._item_types_base = copy.deepcopy(item_types)
+
+    def _last_change(self):
+        return self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM item_changes').fetchone()[0]
+
+    def load_items(self):
+        self._changes_seq = self._last_change()
+        rows = self.conn.execute('SELECT * FROM items ORDER BY id')
+        return [self._item_info(row) for row in rows]
+
+    def load_item_changes(self):
+        first = self.conn.execute('SELECT MIN(seq) FROM item_changes').fetchone()[0]
+        if first is not None and first > self._changes_seq + 1:
+            return None
+        rows = self.conn.execute('SELECT seq, op, item_id FROM item_changes WHERE seq > ? ORDER BY seq',
+                                 (self._changes_seq,)).fetchall()
+        records = []
+        for _, op, item_id in rows:
+            item = None
+            if op != 'delete':
+                row = self.conn.execute('SELECT * FROM items WHERE id = ?', (item_id,)).fetchone()
+                if row is None:
+                    # 物品之后又被删除了，后面的删除记录会处理它
+                    continue
+                item = self._item_info(row)
+            records.append((op, item_id, item))
+        if rows:
+            self._changes_seq = rows[-1][0]
+        return records
+
+    def save_items(self, items):
+        with self.conn:
+            self._replace_items(items)
+
+    def _replace_items(self, items):
+        self.conn.execute('DELETE FROM items')
+        for item in items:
+            self._insert_item(item)
+
+    def _insert_item(self, item):
+        cursor = self.conn.execute('INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self._item_row(item))
+        item['id'] = cursor.lastrowid
+
+    def add_item(self, item):
+        # 编号从共享的计数器中分配，不能用 SQLite 自动分配的 rowid：其他程序可能已经预先分配了它还没写入的编号
+        if item.get('id') is None:
+            item['id'] = self.allocate_item_id()
+        with self.conn:
+            self._insert_item(item)
+
+    def modify_item(self, item):
+        with self.conn:
+            self._update_item(item)
+
+    def _update_item(self, item):
+        self.conn.execute('UPDATE items SET name = ?, description = ?, address = ?, phone = ?, email = ?, '
+                          'type = ?, properties = ?, schema_version = ? WHERE id = ?', self._item_row(item)[1:] + (item['id'],))
+
+    def delete_item(self, item):
+        with self.conn:
+            self.conn.execute('DELETE FROM items WHERE id = ?', (item['id'],))
+
+    def allocate_item_id(self):
+        return self.allocate_item_ids(1)[0]
+
+    def allocate_item_ids(self, count):
+        # 计数器保存在 meta 表中，UPDATE 取得写锁后再读取，同时分配编号的程序不会拿到相同的编号
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO meta VALUES ('next_item_id', 1)")
+            self.conn.execute("""UPDATE meta SET value = MAX(CAST(value AS INTEGER),
+                                 (SELECT COALESCE(MAX(id), 0) + 1 FROM items)) + ? WHERE key = 'next_item_id'""",
+                              (count,))
+            end = int(self._get_meta('next_item_id'))
+        return range(end - count, end)
+
+    def write_batch(self, usrs_info=None, changed_users=(), item_types=None, items=None, item_records=()):
+        # 所有改动在一个事务中提交
+        with self.conn:
+            if usrs_info is not None:
+                self._upsert_users([(name, usrs_info[name]) for name in changed_users])
+            if item_types is not None:
+                self._replace_item_types(item_types)
+            if items is not None:
+                self._replace_items(items)
+            for op, item_id, item in item_records:
+                if op == 'add':
+                    self._insert_item(item)
+                elif op == 'modify':
+                    self._update_item(item)
+                else:
+                    self.conn.execute('DELETE FROM items WHERE id = ?', (item_id,))
+
+    def close(self):
+        self.conn.close()
+
+
+def open_storage(kind='pickle', data_dir='.', **options):
+    '''
+    按名称创建存储引擎。
+    参数：
+    kind (str): 'pickle' 或 'sqlite'
+    data_dir (str): 数据文件所在目录
+    options: 传给存储引擎的其他参数
+    返回：
+    storage (StorageEngine): 存储引擎
+    '''
+    engines = {'pickle': PickleStorage, 'sqlite': SQLiteStorage}
+    if kind not in engines:
+        raise ValueError(f'未知的存储引擎：{kind}')
+    return engines[kind](data_dir, **options)
@@ -0,0 +1,98 @@
+"""
+符号表（字典编码）
+物品类型名称、属性名称和取值不多的属性值（出版社、品牌、成色……）在成千上万个物品中反复出现。
+符号表给每个不同的值一个小整数编号：内存中重复的值只保存一个字符串对象，属性列中只保存 4 个字节的编号，
+比较是否相等时只比较编号；写入文件时，取值不多的列只写一次不同的值，每个物品只写一个编号。
+"""
+import threading
+from array import array
+
+
+class SymbolTable:
+    def __init__(self):
+        '''
+        初始化函数。编号 0 固定表示 None（空着的格子）。
+        '''
+        self.values = [None]
+        self.codes = {None: 0}
+        self._lock = threading.Lock()
+
+    def code(self, value):
+        '''
+        参数：
+        value (str): 值
+        返回：
+        code (int): 值的编号，第一次出现时分配新的编号
+        '''
+        code = self.codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(value)
+                if code is None:
+                    code = len(self.values)
+                    self.values.append(value)
+                    self.codes[value] = code
+        return code
+
+    def lookup(self, value):
+        '''
+        参数：
+        value (str): 值
+        返回：
+        code (int): 值的编号，从没出现过时返回 None（不分配新的编号）
+        '''
+        return self.codes.get(value)
+
+    def intern(self, value):
+        '''
+        参数：
+        value (str): 值
+        返回：
+        value (str): 符号表中相等的那个字符串对象，重复的值共用同一个对象
+        '''
+        return self.values[self.code(value)]
+
+    def __len__(self):
+        return len(self.values)
+
+
+# 所有物品共用的符号表
+symbols = SymbolTable()
+
+
+def encode_column(values):
+    '''
+    写入文件前对一列值做字典编码：不同的值不超过一半时，保存不同的值和每个值的编号，否则原样保存。
+    参数：
+    values (list): 一列值
+    返回：
+    column (list 或 tuple): 原样的列表，或 (不同的值, 编号数组)
+    '''
+    try:
+        distinct = dict.fromkeys(values)
+    except TypeError:
+        return values
+    if len(distinct) * 2 > len(values):
+        return values
+    index = {value: i for i, value in enumerate(distinct)}
+    typecode = 'B' if len(index) <= 0x100 else 'H' if len(index) <= 0x10000 else 'I'
+    return (list(distinct), array(typecode, map(index.__getitem__, values)))
+
+
+def decode_column(column, intern=False):
+    '''
+    参数：
+    column (list 或 tuple): encode_column 的结果
+    intern (bool): 是否把值放入符号表。符号表只增不减，只有取值范围固定的列（物品类型）才放入，
+                   地址、描述这类自由填写的文本放入符号表会一直占用内存
+    返回：
+    values (list): 一列值，编码过的列中重复的值共用同一个对象
+    '''
+    if not isinstance(column, tuple):
+        if intern:
+            return [symbols.intern(value) if isinstance(value, str) else value for value in column]
+        return column
+    distinct, codes = column
+    if intern:
+        distinct = [symbols.intern(value) if isinstance(value, str) else value for value in distinct]
+    return [distinct[code] for code in codes]
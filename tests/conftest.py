@@ -0,0 +1,7 @@
+"""
+测试共用的设置：测试直接导入项目根目录中的模块。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,115 @@
+"""
+asyncio 版物品服务进程的权限检查和参数检查（不建立网络连接，直接调用 dispatch）。
+"""
+import asyncio
+import json
+
+import pytest
+
+from async_server import AsyncExchangeServer
+from services import ExchangeService
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = ExchangeService('pickle')
+    server = AsyncExchangeServer(service, port=0, workers=2)
+    yield server
+    asyncio.run(server.close())
+    service.close()
+
+
+def request(server, path, *args, token=None):
+    payload = {'args': list(args)}
+    if token is not None:
+        payload['token'] = token
+    status, data = asyncio.run(server.dispatch('POST', path, json.dumps(payload).encode('utf-8')))
+    return status, json.loads(data)
+
+
+def login(server, name, password):
+    status, body = request(server, '/users/login', name, password)
+    assert status == 200
+    return body['result']['token']
+
+
+def test_admin_call_without_token_is_refused(server):
+    request(server, '/users/sign_up', 'bob', 'pw1234', 'pw1234', 'SJTU', '13800000000')
+    status, body = request(server, '/users/approve_many', ['bob'])
+    assert status == 401
+    assert body['error']['type'] == 'AuthenticationError'
+    assert server.methods.service.users.get('bob')['status'] == 'pending'
+
+
+def test_admin_call_with_user_token_is_refused(server):
+    request(server, '/users/sign_up', 'bob', 'pw1234', 'pw1234', 'SJTU', '13800000000')
+    admin_token = login(server, 'admin', '123456')
+    assert request(server, '/users/approve_many', ['bob'], token=admin_token)[0] == 200
+    user_token = login(server, 'bob', 'pw1234')
+    status, body = request(server, '/item_types/add', '玩具', ['品牌'], token=user_token)
+    assert status == 403
+    assert body['error']['type'] == 'PermissionDeniedError'
+    assert '玩具' not in request(server, '/item_types/names')[1]['result']
+
+
+def test_user_info_does_not_include_password(server):
+    token = login(server, 'admin', '123456')
+    status, body = request(server, '/users/get', 'admin', token=token)
+    assert status == 200
+    assert 'password' not in body['result']
+
+
+def test_bad_arguments_are_rejected_before_dispatch(server):
+    token = login(server, 'admin', '123456')
+    assert request(server, '/users/get', token=token)[0] == 400
+    assert request(server, '/users/get', 'admin', 'extra', token=token)[0] == 400
+    status, body = request(server, '/items/slice', '0', 10, token=token)
+    assert status == 400
+    assert '第 1 个参数' in body['error']['message']
+    assert request(server, '/items/import_items', [], 1, token=token)[0] == 400
+
+
+def test_unexpected_error_is_a_server_error(server, monkeypatch):
+    token = login(server, 'admin', '123456')
+    # 方法表在创建时取出了函数，直接替换表中的函数
+    function, writes, role, types = server.methods.methods['users/list']
+    monkeypatch.setitem(server.methods.methods, 'users/list', (lambda status=None: {}['missing'], writes, role, types))
+    status, body = request(server, '/users/list', None, token=token)
+    assert status == 500
+
+
+def test_search_results_are_paged(server):
+    token = login(server, 'admin', '123456')
+    properties = request(server, '/item_types/properties', '书籍')[1]['result']
+    rows = [{'type': '书籍', '物品名称': f'Python 入门 {i}', '物品描述': '旧书', '物品地址': 'SJTU', '联系人手机': '13800000000',
+             '邮箱': 'a@sjtu.edu.cn', 'properties': {prop: '未知' for prop in properties}} for i in range(25)]
+    assert request(server, '/items/import_items', rows, False, token=token)[0] == 200
+    found, after_id = [], None
+    while True:
+        status, body = request(server, '/search/search', '书籍', 'Python 入门', 50, after_id, 10, token=token)
+        assert status == 200
+        page = body['result']
+        assert len(page) <= 10
+        found.extend(item['id'] for item in page)
+        if len(page) < 10:
+            break
+        after_id = page[-1]['id']
+    assert found == sorted(found) and len(found) == len(set(found)) == 25
+
+
+def test_non_string_values_are_rejected_before_saving(server):
+    token = login(server, 'admin', '123456')
+    properties = request(server, '/item_types/properties', '书籍')[1]['result']
+    fields = {'物品名称': 123, '物品描述': '旧书', '物品地址': 'SJTU', '联系人手机': '13800000000', '邮箱': 'a@sjtu.edu.cn'}
+    status, body = request(server, '/items/add', '书籍', fields, ['未知'] * len(properties), token=token)
+    assert status == 400
+    assert body['error']['type'] == 'ServiceError'
+    fields['物品名称'] = 'Python 入门'
+    assert request(server, '/items/add', '书籍', fields, [1] * len(properties), token=token)[0] == 400
+    assert request(server, '/item_types/add', '玩具', ['品牌', 2], token=token)[0] == 400
+    assert request(server, '/users/approve_many', ['bob', None], token=token)[0] == 400
+    assert request(server, '/items/import_items', ['not a row'], False, token=token)[0] == 400
+    assert request(server, '/items/count', token=token)[1]['result'] == 0
+    # 数据目录没有被写坏，重新启动后仍然可以加载
+    ExchangeService('pickle').close()
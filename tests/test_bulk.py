@@ -0,0 +1,77 @@
+"""
+批量导入（bulk.py 和 ItemService.import_items）：有错误的行不会写入，错误信息中的行号是文件中的行号。
+"""
+import json
+
+import pytest
+
+from bulk import import_file
+from services import ExchangeService, ImportValidationError
+
+FIELDS = {'物品名称': 'Python 入门', '物品描述': '旧书', '物品地址': 'SJTU', '联系人手机': '13800000000', '邮箱': 'a@sjtu.edu.cn'}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = ExchangeService('pickle')
+    yield service
+    service.close()
+
+
+def book(**fields):
+    return {**FIELDS, 'type': '书籍', 'properties': {'作者': '张三', '出版社': '上交出版社'}, **fields}
+
+
+def write_jsonl(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(row if isinstance(row, str) else json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def test_non_string_values_are_rejected_per_row(service, tmp_path):
+    service.item_types.modify('书籍', '书籍', ['作者', '出版社'])
+    path = tmp_path / 'items.jsonl'
+    write_jsonl(path, [book(), book(物品名称=7), dict(book(), properties={'作者': 1, '出版社': 'x'})])
+    with pytest.raises(ImportValidationError) as error:
+        import_file(service, str(path))
+    assert [line for line, message in error.value.errors] == [2, 3]
+    assert len(service.items.all()) == 0
+
+    imported, errors = import_file(service, str(path), skip_invalid=True)
+    assert imported == 1 and len(errors) == 2
+    # 数据目录没有被写坏，重新启动后仍然可以加载
+    reloaded = ExchangeService('pickle')
+    assert [item['物品名称'] for item in reloaded.items.all()] == ['Python 入门']
+    reloaded.close()
+
+
+def test_item_that_cannot_be_indexed_is_not_written(service):
+    service.item_types.modify('书籍', '书籍', ['作者', '出版社'])
+    item = dict(book(), 物品名称=7)
+    with pytest.raises(TypeError):
+        service.catalog.add_many([book(), item])
+    with pytest.raises(TypeError):
+        service.catalog.add(item)
+    assert service.catalog.items == [] and service.catalog.by_id == {}
+    reloaded = ExchangeService('pickle')
+    assert len(reloaded.items.all()) == 0
+    reloaded.close()
+
+
+def test_errors_use_file_line_numbers(service, tmp_path):
+    service.item_types.modify('书籍', '书籍', ['作者', '出版社'])
+    path = tmp_path / 'items.jsonl'
+    write_jsonl(path, [book(), '\n', '\n', book(物品名称=''), book(type='玩具')])
+    with pytest.raises(ImportValidationError) as error:
+        import_file(service, str(path))
+    assert [line for line, message in error.value.errors] == [4, 5]
+
+    path = tmp_path / 'items.csv'
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('物品名称,物品描述,物品地址,联系人手机,邮箱,物品类型,作者,出版社\n')
+        f.write('Python 入门,旧书,SJTU,13800000000,a@sjtu.edu.cn,书籍,张三,上交出版社\n')
+        f.write(',旧书,SJTU,13800000000,a@sjtu.edu.cn,书籍,张三,上交出版社\n')
+    with pytest.raises(ImportValidationError) as error:
+        import_file(service, str(path))
+    assert error.value.errors == [(3, '所有字段必须填写！')]
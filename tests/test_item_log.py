@@ -0,0 +1,82 @@
+"""
+物品追加日志（见 item_log.py）：重新打开时回放日志，截掉末尾写了一半的记录，合并回快照后数据不变。
+"""
+import os
+import pickle
+
+from item_log import ItemLog
+
+
+def names(items):
+    return [item['物品名称'] for item in items]
+
+
+def test_log_is_replayed_on_load(tmp_path):
+    snapshot = os.path.join(tmp_path, 'item_info.pickle')
+    log = ItemLog(snapshot)
+    log.load()
+    first, second, third = {'物品名称': '旧书'}, {'物品名称': '台灯'}, {'物品名称': '自行车'}
+    for item in (first, second, third):
+        log.add(item)
+    log.modify(dict(second, 物品名称='新台灯'))
+    log.delete(first)
+    log.close()
+    assert not os.path.exists(snapshot)
+
+    reopened = ItemLog(snapshot)
+    try:
+        items = reopened.load()
+        assert names(items) == ['新台灯', '自行车']
+        assert [item['id'] for item in items] == [2, 3]
+        reopened.add({'物品名称': '笔记本'})
+        assert names(reopened.load())[-1] == '笔记本'
+        assert reopened.load()[-1]['id'] == 4
+    finally:
+        reopened.close()
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    snapshot = os.path.join(tmp_path, 'item_info.pickle')
+    log = ItemLog(snapshot)
+    log.load()
+    log.add({'物品名称': '旧书'})
+    log.close()
+    size = os.path.getsize(log.log_file)
+    # 程序在写入第二条记录时退出，只留下一半
+    record = pickle.dumps(('add', 2, {'物品名称': '台灯', 'id': 2}))
+    with open(log.log_file, 'ab') as f:
+        f.write(record[:len(record) // 2])
+
+    reopened = ItemLog(snapshot)
+    try:
+        assert names(reopened.load()) == ['旧书']
+        assert os.path.getsize(reopened.log_file) == size
+        # 之后追加的记录接在完整的记录后面，能被正常读出
+        reopened.add({'物品名称': '自行车'})
+        assert names(reopened.load()) == ['旧书', '自行车']
+    finally:
+        reopened.close()
+
+
+def test_compaction_keeps_all_items(tmp_path):
+    snapshot = os.path.join(tmp_path, 'item_info.pickle')
+    log = ItemLog(snapshot, compact_threshold=2000)
+    log.load()
+    items = [{'物品名称': f'物品{i}', '物品描述': '旧物' * 20} for i in range(30)]
+    for item in items:
+        log.add(item)
+    for item in items[::3]:
+        log.delete(item)
+    log._wait_compactor()
+    assert os.path.exists(snapshot)
+    assert not os.path.exists(log.compacting_file)
+    expected = [item['物品名称'] for i, item in enumerate(items) if i % 3]
+    # 自己写入的记录都已读入，合并后不需要重新加载
+    assert log.changes() == []
+    log.close()
+
+    reopened = ItemLog(snapshot)
+    try:
+        assert names(reopened.load()) == expected
+    finally:
+        reopened.close()
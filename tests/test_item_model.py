@@ -0,0 +1,31 @@
+"""
+紧凑的物品表示（见 item_model.py）：只有取值范围固定的内容放入只增不减的符号表，自由填写的地址等文本不放入。
+"""
+import pickle
+
+from item_model import PropertyTable, as_item, pack_items
+from symbols import symbols
+
+
+def make_items(count, tag):
+    return [{'物品名称': '旧书', '物品描述': '旧物', '物品地址': f'{tag}地址{i}', '联系人手机': '13800000000',
+             '邮箱': 'a@sjtu.edu.cn', 'type': '书籍', 'id': i + 1,
+             'properties': {'作者': f'{tag}作者{i}', '出版社': '上交出版社'}}
+            for i in range(count)]
+
+
+def test_free_text_is_not_interned():
+    count = PropertyTable.MAX_DISTINCT + 10
+    items = [as_item(item) for item in make_items(count, '第一批')]
+    before = len(symbols)
+    items[0]['物品地址'] = '新地址'
+    loaded = pickle.loads(pickle.dumps(pack_items(items)))
+    restored = pickle.loads(pickle.dumps(items[:5]))
+    assert len(symbols) == before
+    assert symbols.lookup('新地址') is None
+    assert loaded[0]['物品地址'] == '新地址'
+    assert [item['properties']['作者'] for item in loaded[-2:]] == [f'第一批作者{i}' for i in (count - 2, count - 1)]
+    assert restored[1]['物品地址'] == '第一批地址1'
+    # 物品类型和取值不多的属性值仍然共用符号表中的字符串
+    assert loaded[0]['type'] is symbols.values[symbols.lookup('书籍')]
+    assert loaded[0]['properties']['出版社'] is loaded[1]['properties']['出版社']
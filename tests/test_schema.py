@@ -0,0 +1,69 @@
+"""
+物品类型的版本（见 schema.py）：修改物品类型时只写入物品类型，物品在读取时升级，由后台写回；
+改名前的类型名称记录在 former_names 中，其他程序读入旧名称的物品时归到新名称下。
+"""
+import os
+
+import pytest
+
+from services import ExchangeService
+from storage import PickleStorage
+
+FIELDS = {'物品名称': '旧书', '物品描述': '旧物', '物品地址': 'SJTU', '联系人手机': '13800000000', '邮箱': 'a@sjtu.edu.cn'}
+
+
+def stored_items(data_dir):
+    storage = PickleStorage(data_dir)
+    try:
+        return storage.load_items()
+    finally:
+        storage.close()
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ExchangeService(PickleStorage(tmp_path))
+    for i in range(5):
+        service.items.add('书籍', dict(FIELDS, 物品名称=f'旧书{i}'), ['张三', '上交出版社'])
+    # 停止后台写回，由测试决定什么时候写回
+    service.migrator.close()
+    yield service
+    service.close()
+
+
+def test_items_are_upgraded_lazily(service, tmp_path):
+    log_file = os.path.join(tmp_path, 'item_info.pickle.log')
+    size = os.path.getsize(log_file)
+    service.item_types.modify('书籍', '书籍', ['作者姓名', '出版社', '出版年份'])
+    # 修改物品类型不改写物品
+    assert os.path.getsize(log_file) == size
+    assert [dict(item['properties']) for item in stored_items(tmp_path)] == [{'作者': '张三', '出版社': '上交出版社'}] * 5
+
+    item = service.items.all()[0]
+    service.items.upgrade(item)
+    assert dict(item['properties']) == {'作者姓名': '张三', '出版社': '上交出版社', '出版年份': '未知'}
+    assert item['schema_version'] == 1
+
+    while service.migrator.step():
+        pass
+    stored = stored_items(tmp_path)
+    assert {item['schema_version'] for item in stored} == {1}
+    assert [dict(item['properties']) for item in stored] == [
+        {'作者姓名': '张三', '出版社': '上交出版社', '出版年份': '未知'}] * 5
+
+
+def test_renamed_type_keeps_its_items(service, tmp_path):
+    service.item_types.modify('书籍', '图书', ['作者', '出版社'])
+    assert '书籍' not in service.item_types.names()
+    assert {item['type'] for item in stored_items(tmp_path)} == {'书籍'}
+    assert len(list(service.search.search('图书', '旧书'))) == 5
+
+    # 另一个程序读入的物品还是原来的类型名称，按 former_names 归到新名称下
+    other = ExchangeService(PickleStorage(tmp_path))
+    try:
+        assert {item['type'] for item in other.items.all()} == {'图书'}
+        assert len(list(other.search.search('图书', '旧书'))) == 5
+        assert list(other.search.search('书籍', '旧书')) == []
+    finally:
+        other.close()
+    assert {item['type'] for item in stored_items(tmp_path)} == {'图书'}
@@ -0,0 +1,58 @@
+"""
+搜索索引的剪枝（见 search_index.py）：先从索引取候选物品再计算 partial_ratio，结果与对所有物品计算完全相同，
+包括得分四舍五入后正好达到阈值的物品。
+"""
+import random
+
+import pytest
+from fuzzywuzzy import fuzz
+
+from scoring import score_batch
+from services import ExchangeService
+from storage import PickleStorage
+
+FIELDS = {'物品地址': 'SJTU', '联系人手机': '13800000000', '邮箱': 'a@sjtu.edu.cn'}
+CHARS = '旧书新笔记本电脑台灯自行车'
+# 相似度为 50 / 101 = 49.5%，四舍五入后正好是 50；索引算出的上界也正好是 49.5，不能被剪掉
+BOUNDARY_KEYWORD, BOUNDARY_TEXT = 'a' * 25 + 'x' * 51, 'z' * 51 + 'a' * 25
+
+
+def random_text(rng, low, high):
+    return ''.join(rng.choice(CHARS) for _ in range(rng.randint(low, high)))
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    rng = random.Random(20240501)
+    rows = [{**FIELDS, '物品名称': random_text(rng, 1, 8), '物品描述': random_text(rng, 1, 20),
+             'type': '书籍', 'properties': {'作者': '张三', '出版社': '上交出版社'}} for _ in range(300)]
+    rows.append({**FIELDS, '物品名称': BOUNDARY_TEXT, '物品描述': '-', 'type': '书籍',
+                 'properties': {'作者': '张三', '出版社': '上交出版社'}})
+    service = ExchangeService(PickleStorage(tmp_path_factory.mktemp('data')))
+    service.items.import_items(enumerate(rows, 1))
+    yield service
+    service.close()
+
+
+def keywords():
+    rng = random.Random(7)
+    return [random_text(rng, 1, 6) for _ in range(30)] + [BOUNDARY_KEYWORD, BOUNDARY_KEYWORD[:-1]]
+
+
+@pytest.mark.parametrize('threshold', [50, 51, 80])
+def test_pruned_search_matches_full_scan(service, threshold):
+    items = [item for item in service.catalog.iter_items() if item['type'] == '书籍']
+    texts = [(item['物品名称'], item['物品描述']) for item in items]
+    for keyword in keywords():
+        full = [items[position]['id'] for position, _ in score_batch(keyword, texts, threshold)]
+        candidates = service.catalog.search_candidates(keyword, '书籍', threshold)
+        pruned = [candidates[position]['id'] for position, _ in
+                  score_batch(keyword, [(item['物品名称'], item['物品描述']) for item in candidates], threshold)]
+        assert pruned == full, keyword
+
+
+def test_boundary_item_is_kept(service):
+    assert fuzz.partial_ratio(BOUNDARY_KEYWORD, BOUNDARY_TEXT) == 50
+    found = [item['物品名称'] for item in service.search.search('书籍', BOUNDARY_KEYWORD, 50)]
+    assert found == [BOUNDARY_TEXT]
+    assert list(service.search.search('书籍', BOUNDARY_KEYWORD, 51)) == []
@@ -0,0 +1,130 @@
+"""
+多个程序共享同一个数据目录（见 file_lock.py）：同时添加物品时编号不重复，同时修改物品类型时改动合并，
+轮换日志时不会漏掉其他程序追加的记录，atomic_write 失败时不留下写了一半的文件。
+"""
+import multiprocessing
+import os
+import pickle
+
+import pytest
+
+from file_lock import atomic_write
+from item_log import ItemLog
+from services import ExchangeService
+from storage import PickleStorage, SQLiteStorage
+
+PROCESSES = 4
+ITEMS_PER_PROCESS = 30
+FIELDS = {'物品描述': '旧物', '物品地址': 'SJTU', '联系人手机': '13800000000', '邮箱': 'a@sjtu.edu.cn'}
+
+
+def open_engine(kind, data_dir):
+    if kind == 'sqlite':
+        return SQLiteStorage(data_dir)
+    return PickleStorage(data_dir, kind)
+
+
+def add_items(kind, data_dir, number, start):
+    # 在子进程中运行：等所有进程都打开存储引擎后同时开始添加物品，最后各自添加一个物品类型
+    service = ExchangeService(open_engine(kind, data_dir))
+    try:
+        properties = service.item_types.properties('书籍')
+        start.wait()
+        for i in range(ITEMS_PER_PROCESS):
+            service.items.add('书籍', dict(FIELDS, 物品名称=f'进程{number}-{i}'), ['未知'] * len(properties))
+        service.item_types.add(f'类型{number}', ['属性'])
+    finally:
+        service.close()
+
+
+@pytest.mark.parametrize('kind', ['log', 'pickle', 'sqlite'])
+def test_processes_adding_items_get_unique_ids(tmp_path, kind):
+    ExchangeService(open_engine(kind, tmp_path)).close()
+    start = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=add_items, args=(kind, tmp_path, number, start))
+                 for number in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    start.set()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * PROCESSES
+
+    service = ExchangeService(open_engine(kind, tmp_path))
+    try:
+        items = list(service.catalog.iter_items())
+        ids = [item['id'] for item in items]
+        assert len(items) == PROCESSES * ITEMS_PER_PROCESS
+        assert len(set(ids)) == len(ids)
+        assert {item['物品名称'] for item in items} == {f'进程{number}-{i}' for number in range(PROCESSES)
+                                                     for i in range(ITEMS_PER_PROCESS)}
+        assert {f'类型{number}' for number in range(PROCESSES)} <= set(service.item_types.names())
+    finally:
+        service.close()
+
+
+@pytest.mark.parametrize('kind', ['pickle', 'sqlite'])
+def test_concurrent_item_type_edits_are_merged(tmp_path, kind):
+    ExchangeService(open_engine(kind, tmp_path)).close()
+    first, second = open_engine(kind, tmp_path), open_engine(kind, tmp_path)
+    try:
+        # 两个程序读入同一份物品类型，各自修改后写入，后写入的程序没有重新读取
+        first_types, second_types = first.load_item_types(), second.load_item_types()
+        first_types['玩具'] = {'properties': ['品牌'], 'history': []}
+        first.save_item_types(first_types)
+        second_types['图书'] = dict(second_types.pop('书籍'), properties=['作者', '出版社'])
+        second.save_item_types(second_types)
+    finally:
+        first.close()
+        second.close()
+
+    engine = open_engine(kind, tmp_path)
+    try:
+        item_types = engine.load_item_types()
+        assert '书籍' not in item_types
+        assert item_types['玩具']['properties'] == ['品牌']
+        assert item_types['图书']['properties'] == ['作者', '出版社']
+    finally:
+        engine.close()
+
+
+def test_rotation_does_not_hide_records_from_other_programs(tmp_path):
+    snapshot = os.path.join(tmp_path, 'item_info.pickle')
+    first, second = ItemLog(snapshot, compact_threshold=2000), ItemLog(snapshot, compact_threshold=2000)
+    try:
+        first.load()
+        second.load()
+        second.add({'物品名称': '其他程序的物品'})
+        # first 追加到超过阈值，轮换日志并合并；second 的记录在 first 读到的位置之后
+        for i in range(20):
+            first.add({'物品名称': f'物品{i}', '物品描述': '旧物' * 20})
+        first._wait_compactor()
+        assert not os.path.exists(first.compacting_file)
+        records = first.changes()
+        # 只读增量时必须包含 second 的记录，否则要求重新加载
+        assert records is None or [item['物品名称'] for op, item_id, item in records] == ['其他程序的物品']
+        assert '其他程序的物品' in [item['物品名称'] for item in first.load()]
+    finally:
+        first.close()
+        second.close()
+
+
+@pytest.mark.parametrize('error', [OSError('磁盘已满'), KeyboardInterrupt()])
+def test_atomic_write_failure_leaves_no_partial_file(tmp_path, error):
+    path = os.path.join(tmp_path, 'data.pickle')
+    atomic_write(path, lambda f: pickle.dump({'version': 1}, f))
+
+    def dump(f):
+        f.write(b'partial data')
+        raise error
+
+    with pytest.raises(type(error)):
+        atomic_write(path, dump)
+    with open(path, 'rb') as f:
+        assert pickle.load(f) == {'version': 1}
+    assert os.listdir(tmp_path) == ['data.pickle']
+
+    new_path = os.path.join(tmp_path, 'new.pickle')
+    with pytest.raises(type(error)):
+        atomic_write(new_path, dump)
+    assert os.listdir(tmp_path) == ['data.pickle']
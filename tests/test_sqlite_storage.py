@@ -0,0 +1,40 @@
+"""
+SQLite 存储引擎的一次性初始化（见 storage.py）：没有旧的 pickle 文件时不创建任何 pickle 文件，
+有旧文件时迁移其中的数据，迁移后不留下打开的文件。
+"""
+import os
+import pickle
+
+from storage import DEFAULT_ITEM_TYPES, SQLiteStorage
+
+
+def open_files():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def test_new_database_creates_no_pickle_files(tmp_path):
+    before = open_files()
+    storage = SQLiteStorage(tmp_path)
+    try:
+        assert storage.get_user('admin') is not None
+        assert set(storage.load_item_types()) == set(DEFAULT_ITEM_TYPES)
+    finally:
+        storage.close()
+    assert sorted(name for name in os.listdir(tmp_path) if not name.startswith('exchange.db')) == []
+    assert open_files() == before
+
+
+def test_migration_reads_only_existing_files(tmp_path):
+    users = {'admin': {'password': 'admin', 'status': 'approved'}, '张三': {'password': '123', 'status': 'pending'}}
+    with open(tmp_path / 'usrs_info.pickle', 'wb') as f:
+        pickle.dump(users, f)
+    before = open_files()
+    storage = SQLiteStorage(tmp_path)
+    try:
+        assert storage.list_users('pending') == ['张三']
+        assert set(storage.load_item_types()) == set(DEFAULT_ITEM_TYPES)
+    finally:
+        storage.close()
+    assert open_files() == before
+    assert not os.path.exists(tmp_path / 'item_types.pickle')
+    assert not os.path.exists(tmp_path / 'users')
@@ -0,0 +1,66 @@
+"""
+按用户名存取的用户数据（见 user_store.py）：很长的用户名也能注册，同时注册同一个用户名时只有一个成功。
+"""
+import threading
+
+import pytest
+
+from services import ExchangeService, ServiceError
+from storage import PickleStorage, SQLiteStorage
+from write_behind import WriteBehindStorage
+
+
+def open_engine(kind, data_dir):
+    if kind == 'sqlite':
+        return SQLiteStorage(data_dir)
+    if kind == 'write_behind':
+        return WriteBehindStorage(PickleStorage(data_dir))
+    return PickleStorage(data_dir)
+
+
+@pytest.mark.parametrize('kind', ['log', 'sqlite', 'write_behind'])
+def test_long_names_can_sign_up(tmp_path, kind):
+    name = '很长的用户名' * 10
+    service = ExchangeService(open_engine(kind, tmp_path))
+    try:
+        service.users.sign_up(name, '123', '123', '地址', '13800000000')
+        assert service.users.get(name)['status'] == 'pending'
+        assert name in service.users.list('pending')
+        service.users.approve(name)
+        assert service.users.login(name, '123') == 'user'
+    finally:
+        service.close()
+
+
+@pytest.mark.parametrize('kind', ['log', 'sqlite', 'write_behind'])
+def test_simultaneous_sign_ups_with_the_same_name(tmp_path, kind):
+    ExchangeService(open_engine(kind, tmp_path)).close()
+    services = [ExchangeService(open_engine(kind, tmp_path)) for _ in range(4)]
+    start = threading.Barrier(len(services))
+    succeeded = []
+
+    def sign_up(number, service):
+        start.wait()
+        try:
+            service.users.sign_up('张三', f'密码{number}', f'密码{number}', '地址', '13800000000')
+        except ServiceError:
+            return
+        succeeded.append(number)
+
+    threads = [threading.Thread(target=sign_up, args=(number, service)) for number, service in enumerate(services)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for service in services:
+        service.close()
+
+    assert len(succeeded) == 1
+    service = ExchangeService(open_engine(kind, tmp_path))
+    try:
+        assert service.users.get('张三')['password'] == f'密码{succeeded[0]}'
+        assert service.users.list('pending') == ['张三']
+        with pytest.raises(ServiceError):
+            service.users.sign_up('张三', '123', '123', '地址', '13800000000')
+    finally:
+        service.close()
@@ -0,0 +1,74 @@
+"""
+延迟写入（见 write_behind.py）：时间窗口内的改动合并成一次写入，自己写入造成的文件变化不会让仓库重新加载。
+"""
+import pytest
+
+from storage import PickleStorage
+from write_behind import WriteBehindStorage
+
+ITEM = {'物品名称': '旧书', '物品描述': '旧物', '物品地址': 'SJTU', '联系人手机': '13800000000',
+        '邮箱': 'a@sjtu.edu.cn', 'type': '书籍', 'properties': {'作者': '张三', '出版社': '上交出版社'}}
+
+
+class RecordingStorage(PickleStorage):
+    def __init__(self, data_dir):
+        super().__init__(data_dir)
+        self.batches = []
+
+    def write_batch(self, **batch):
+        self.batches.append(batch)
+        super().write_batch(**batch)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = WriteBehindStorage(RecordingStorage(tmp_path), delay=60)
+    storage.load_items()
+    yield storage
+    storage.close()
+
+
+def test_changes_in_a_window_are_written_once(storage, tmp_path):
+    for i in range(200):
+        storage.save_user(f'用户{i}', {'password': '123', 'status': 'pending'})
+    storage.save_user('用户0', {'password': '123', 'status': 'approved'})
+    kept, dropped = dict(ITEM), dict(ITEM, 物品名称='台灯')
+    storage.add_item(kept)
+    storage.add_item(dropped)
+    kept['物品描述'] = '几乎全新'
+    storage.modify_item(kept)
+    storage.delete_item(dropped)
+    assert storage.get_user('用户0')['status'] == 'approved'
+    assert storage.storage.batches == []
+
+    storage.flush()
+    [batch] = storage.storage.batches
+    assert len(batch['changed_users']) == 200
+    assert [(op, item_id, item['物品描述']) for op, item_id, item in batch['item_records']] == [
+        ('add', kept['id'], '几乎全新')]
+
+    other = PickleStorage(tmp_path)
+    try:
+        assert other.get_user('用户0')['status'] == 'approved'
+        assert len(other.list_users('pending')) == 199
+        assert [item['物品描述'] for item in other.load_items()] == ['几乎全新']
+    finally:
+        other.close()
+
+
+def test_own_writes_do_not_change_the_stamp(storage, tmp_path):
+    storage.save_user('张三', {'password': '123', 'status': 'pending'})
+    storage.flush()
+    stamp = storage.users_stamp()
+    storage.save_user('李四', {'password': '123', 'status': 'pending'})
+    # 还没写入时内存中的数据比文件新
+    assert storage.users_stamp() == stamp
+    storage.flush()
+    assert storage.users_stamp() == stamp
+
+    other = PickleStorage(tmp_path)
+    try:
+        other.save_user('王五', {'password': '123', 'status': 'pending'})
+    finally:
+        other.close()
+    assert storage.users_stamp() != stamp
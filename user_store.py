@@ -0,0 +1,212 @@
+"""
+按用户名存取的用户数据
+原来所有账户都保存在 usrs_info.pickle 一个文件中，注册、审核一个用户都要读出并重写全部账户，
+账户越多越慢，两个程序同时注册时后写入的一方还会覆盖前者。UserStore 改为每个用户一个文件：
+users/records/<用户名的 sha256>.pickle，内容为 (用户名, 用户信息, 进入当前审核状态的时间)
+读取和写入一个用户只涉及这一个文件，与账户总数无关；写入先写临时文件再改名，改名是原子的，
+同时写入不同用户互不影响。文件名长度固定，再长的用户名也不会超出文件系统对文件名长度的限制。
+注册新用户（add）用硬链接把写好的临时文件链接为用户文件，用户文件已存在时链接失败，
+两个程序同时注册同一个用户名时只有一个能成功，不会互相覆盖。
+审核状态另有一个二级索引：users/status/<状态>/<用户名的 sha256> 是一个空文件，
+列出待审核用户只需要列出 status/pending 目录，不必读取所有账户。
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from item_log import file_stamp
+
+
+class UserStore:
+    def __init__(self, directory):
+        '''
+        初始化函数
+        参数：
+        directory (str): 用户数据所在的目录
+        '''
+        self.directory = directory
+        self.records_dir = os.path.join(directory, 'records')
+        self.status_dir = os.path.join(directory, 'status')
+
+    def exists(self):
+        '''
+        返回：
+        exists (bool): 用户数据目录是否已经创建
+        '''
+        return os.path.isdir(self.records_dir)
+
+    def create(self, usrs_info):
+        '''
+        创建用户数据目录并写入初始的用户（默认账户，或从 usrs_info.pickle 迁移来的账户）。
+        参数：
+        usrs_info (dict): 用户名到用户信息的字典
+        '''
+        os.makedirs(self.status_dir, exist_ok=True)
+        # 先在临时目录中写好，再改名为 records，其他程序不会看到只写了一半的用户数据
+        tmp_dir = f'{self.records_dir}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(tmp_dir, exist_ok=True)
+        since = time.time_ns()
+        for i, (name, user_info) in enumerate(usrs_info.items()):
+            # 迁移来的账户保持原来的先后顺序
+            with open(os.path.join(tmp_dir, self._key(name) + '.pickle'), 'wb') as f:
+                pickle.dump((name, user_info, since + i), f)
+            self._mark(name, user_info['status'])
+        try:
+            os.rename(tmp_dir, self.records_dir)
+        except OSError:
+            # 其他程序已经创建了用户数据
+            for file_name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, file_name))
+            os.rmdir(tmp_dir)
+
+    @staticmethod
+    def _key(name):
+        # sha256：任何用户名都是长度固定的合法文件名，在不区分大小写的文件系统上也不会冲突
+        return hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+    def _record_file(self, name):
+        return self._key_file(self._key(name))
+
+    def _key_file(self, key):
+        return os.path.join(self.records_dir, key + '.pickle')
+
+    def _marker_file(self, name, status):
+        return os.path.join(self.status_dir, status, self._key(name))
+
+    def _mark(self, name, status):
+        path = self._marker_file(name, status)
+        try:
+            open(path, 'wb').close()
+        except FileNotFoundError:
+            # 第一个处于该状态的用户
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+
+    def _unmark(self, name, status):
+        try:
+            os.remove(self._marker_file(name, status))
+        except FileNotFoundError:
+            pass
+
+    def _load(self, name):
+        record = self._load_key(self._key(name))
+        return record if record is not None and record[0] == name else None
+
+    def _load_key(self, key):
+        try:
+            with open(self._key_file(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_temp(self, path, record):
+        tmp_file = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(record, f)
+        return tmp_file
+
+    def get(self, name):
+        '''
+        参数：
+        name (str): 用户名
+        返回：
+        user_info (dict): 用户信息，用户不存在时返回 None
+        '''
+        record = self._load(name)
+        return record[1] if record is not None else None
+
+    def put(self, name, user_info):
+        '''
+        写入一个用户。先加新状态的索引，再写用户，最后删旧状态的索引：
+        中途退出（或其他程序正在写入）时索引中最多多出一项，list 会核对用户的状态并跳过它，不会漏掉用户。
+        参数：
+        name (str): 用户名
+        user_info (dict): 用户信息
+        '''
+        record = self._load(name)
+        old = record[1] if record is not None else None
+        status = user_info['status']
+        if old is None or old['status'] != status:
+            self._mark(name, status)
+            since = time.time_ns()
+        else:
+            since = record[2]
+        path = self._record_file(name)
+        os.replace(self._write_temp(path, (name, user_info, since)), path)
+        if old is not None and old['status'] != status:
+            self._unmark(name, old['status'])
+
+    def add(self, name, user_info):
+        '''
+        写入一个新用户，用户已存在时不写入。检查和写入是一步完成的，同时注册同一个用户名的程序中只有一个会成功。
+        参数：
+        name (str): 用户名
+        user_info (dict): 用户信息
+        返回：
+        added (bool): 是否写入；用户已存在时返回 False
+        '''
+        self._mark(name, user_info['status'])
+        path = self._record_file(name)
+        tmp_file = self._write_temp(path, (name, user_info, time.time_ns()))
+        try:
+            os.link(tmp_file, path)
+        except FileExistsError:
+            # 已存在的用户处于其他状态时，撤销上面多加的索引
+            if self.get(name)['status'] != user_info['status']:
+                self._unmark(name, user_info['status'])
+            return False
+        finally:
+            os.remove(tmp_file)
+        return True
+
+    def list(self, status=None):
+        '''
+        参数：
+        status (str): 只返回该状态的用户，为 None 时返回所有用户
+        返回：
+        names (list): 用户名；按状态列出时按进入该状态的先后排列，列出所有用户时按用户名排列
+        '''
+        if status is None:
+            return [record[0] for record in self._records()]
+        try:
+            file_names = os.listdir(os.path.join(self.status_dir, status))
+        except FileNotFoundError:
+            return []
+        found = []
+        for file_name in file_names:
+            record = self._load_key(file_name)
+            if record is not None and record[1]['status'] == status:
+                found.append((record[2], record[0]))
+        found.sort()
+        return [name for _, name in found]
+
+    def load_all(self):
+        '''
+        返回：
+        usrs_info (dict): 所有用户，按用户名排列
+        '''
+        return {name: user_info for name, user_info, _ in self._records()}
+
+    def _records(self):
+        try:
+            entries = [entry for entry in os.scandir(self.records_dir) if entry.name.endswith('.pickle')]
+        except FileNotFoundError:
+            return []
+        records = []
+        for entry in entries:
+            try:
+                with open(entry.path, 'rb') as f:
+                    records.append(pickle.load(f))
+            except FileNotFoundError:
+                pass  # 读取时被其他程序删除
+        records.sort(key=lambda record: record[0])
+        return records
+
+    def stamp(self):
+        '''
+        返回：
+        stamp (tuple): 用户数据的变化标记；写入用户时会在 records 目录中改名，目录的修改时间随之变化
+        '''
+        return file_stamp(self.records_dir)
@@ -0,0 +1,365 @@
+"""
+界面组件
+PagedResultsView：分页显示搜索结果的窗口。结果从生成器中按页读取，只格式化当前页的物品，
+无论匹配的物品有多少，首次显示的时间和占用的内存都是有限的；也可以由后台搜索通过 extend 逐批送入结果。
+不指定标题时不单独弹出窗口，而是作为一个框架放在其他窗口中（例如边输入边搜索的搜索窗口）。
+VirtualListbox：虚拟列表框。列表框中只放入当前可见的几行，滚动时再从底层数据中取出对应的行，
+打开十万个物品的列表也不需要把所有名称插入列表框；顶部的输入框支持边输入边筛选。
+selectmode='extended' 时可以用 Ctrl/Shift 多选（包括滚动到别处的行），处理完的行用 remove_rows 移出列表，不必重新读取数据。
+load_thumbnail：读取缩小后的图片。缩略图保存为 PNG 文件，由 Tk 直接读取，只有原图变化后才用 PIL 重新缩小。
+"""
+import os
+import tkinter as tk
+
+from file_lock import atomic_write
+
+
+def thumbnail_path(path, size):
+    '''
+    参数：
+    path (str): 原图路径
+    size (tuple): 缩略图的 (宽, 高)
+    返回：
+    thumb_path (str): 缩略图路径，与原图在同一目录，例如 image.150x120.png
+    '''
+    root, _ = os.path.splitext(path)
+    return f'{root}.{size[0]}x{size[1]}.png'
+
+
+def load_thumbnail(path, size, master=None):
+    '''
+    读取图片并缩小到指定大小。缩略图的修改时间与原图相同时直接读取缩略图，不需要导入 PIL，也不需要解码和缩小原图；
+    否则用 PIL 重新生成缩略图，并把它的修改时间设为原图的修改时间。
+    参数：
+    path (str): 原图路径
+    size (tuple): 缩略图的 (宽, 高)
+    master (tk.Misc): 图片所属的窗口
+    返回：
+    image (tk.PhotoImage): 缩略图，调用方需要保存引用，否则图片会被回收
+    '''
+    thumb_path = thumbnail_path(path, size)
+    source = os.stat(path)
+    try:
+        if os.stat(thumb_path).st_mtime_ns == source.st_mtime_ns:
+            return tk.PhotoImage(master=master, file=thumb_path)
+    except (OSError, tk.TclError):
+        pass  # 没有缩略图或缩略图已损坏，重新生成
+
+    from PIL import Image, ImageTk
+
+    with Image.open(path) as image:
+        resized = image.resize(size, Image.LANCZOS)
+    try:
+        atomic_write(thumb_path, lambda f: resized.save(f, 'PNG'), sync=False)
+        os.utime(thumb_path, ns=(source.st_atime_ns, source.st_mtime_ns))
+    except OSError:
+        pass  # 目录不可写时只是每次都要重新缩小
+    return ImageTk.PhotoImage(resized, master=master)
+
+
+class PagedResultsView:
+    def __init__(self, master, title, results, formatter, page_size=20):
+        '''
+        初始化函数
+        参数：
+        master (tk.Widget): 父窗口
+        title (str): 窗口标题；为 None 时不弹出新窗口，结果显示在 self.window 框架中，由调用方放入 master
+        results (iterable): 结果的生成器，翻到后面的页时才继续读取；为 None 时结果通过 extend 和 finish 送入
+        formatter (function): formatter(序号, 结果) 返回该结果的显示文本，只对当前页的结果调用
+        page_size (int): 每页显示的结果数
+        '''
+        self.results = iter(results) if results is not None else None
+        self.formatter = formatter
+        self.page_size = page_size
+        self.fetched = []  # 已经从生成器中读取的结果
+        self.exhausted = False
+        self.page = 0
+
+        if title is None:
+            self.window = tk.Frame(master)
+        else:
+            self.window = tk.Toplevel(master)
+            self.window.title(title)
+            self.window.geometry('500x400')
+
+        text_frame = tk.Frame(self.window)
+        text_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        scrollbar = tk.Scrollbar(text_frame)
+        scrollbar.pack(side=tk.RIGHT, fill='y')
+        self.text = tk.Text(text_frame, wrap='word', width=60, height=15, yscrollcommand=scrollbar.set)
+        self.text.pack(side=tk.LEFT, fill='both', expand=True)
+        scrollbar.config(command=self.text.yview)
+
+        button_frame = tk.Frame(self.window)
+        button_frame.pack(pady=5)
+        self.btn_prev = tk.Button(button_frame, text='上一页', command=lambda: self.show_page(self.page - 1))
+        self.btn_prev.grid(row=0, column=0, padx=10)
+        self.page_label = tk.Label(button_frame)
+        self.page_label.grid(row=0, column=1, padx=10)
+        self.btn_next = tk.Button(button_frame, text='下一页', command=lambda: self.show_page(self.page + 1))
+        self.btn_next.grid(row=0, column=2, padx=10)
+
+        self.show_page(0)
+
+    def _fetch(self, count):
+        '''
+        从生成器中读取结果，直到已读取的结果不少于 count 个或生成器结束。
+        参数：
+        count (int): 需要的结果数
+        '''
+        while self.results is not None and not self.exhausted and len(self.fetched) < count:
+            try:
+                self.fetched.append(next(self.results))
+            except StopIteration:
+                self.exhausted = True
+
+    def show_page(self, page):
+        '''
+        显示指定的页，只格式化这一页的结果。
+        参数：
+        page (int): 页码，从 0 开始
+        '''
+        start = page * self.page_size
+        # 多读取一个结果，用来判断是否还有下一页
+        self._fetch(start + self.page_size + 1)
+        if page < 0 or (page > 0 and start >= len(self.fetched)):
+            return
+        self.page = page
+        rows = self.fetched[start:start + self.page_size]
+
+        self.text.config(state='normal')
+        self.text.delete('1.0', tk.END)
+        self.text.insert(tk.END, '\n\n'.join(self.formatter(start + i, row) for i, row in enumerate(rows)))
+        self.text.config(state='disabled')
+
+        has_next = len(self.fetched) > start + self.page_size
+        self.btn_prev.config(state='normal' if page > 0 else 'disabled')
+        self.btn_next.config(state='normal' if has_next else 'disabled')
+        if not rows:
+            self.page_label.config(text='没有结果' if self.exhausted else '正在搜索…')
+            return
+        shown = f'第 {start + 1}-{start + len(rows)} 个'
+        self.page_label.config(text=shown if has_next or not self.exhausted else f'{shown}，共 {len(self.fetched)} 个')
+
+    def exists(self):
+        '''
+        返回：
+        exists (bool): 窗口是否还没有被关闭
+        '''
+        return bool(self.window.winfo_exists())
+
+    def reset(self):
+        '''
+        清空结果，等待通过 extend 送入新的结果。
+        '''
+        self.results = None
+        self.fetched = []
+        self.exhausted = False
+        self.show_page(0)
+
+    def clear(self):
+        '''
+        清空结果，不再等待新的结果（例如搜索关键字被删空时）。
+        '''
+        self.results = None
+        self.fetched = []
+        self.exhausted = True
+        self.show_page(0)
+        self.page_label.config(text='')
+
+    def extend(self, rows):
+        '''
+        追加一批结果；只有当前页或“下一页”按钮受影响时才重新显示。
+        参数：
+        rows (list): 新的结果
+        '''
+        before = len(self.fetched)
+        self.fetched.extend(rows)
+        if before <= (self.page + 1) * self.page_size:
+            self.show_page(self.page)
+
+    def finish(self):
+        '''
+        所有结果都已送入。
+        '''
+        self.exhausted = True
+        self.show_page(self.page)
+
+
+class VirtualListbox(tk.Frame):
+    def __init__(self, master, rows=(), label=str, filter_rows=None, height=10, width=30, selectmode='browse'):
+        '''
+        初始化函数
+        参数：
+        master (tk.Widget): 父窗口
+        rows (sequence): 底层数据，支持 len() 和下标访问即可（例如物品列表），不会被复制
+        label (function): label(行) 返回该行显示的文本，只对可见的行调用
+        filter_rows (function): filter_rows(筛选文本) 返回筛选后的行；默认在所有行的显示文本中查找子串
+        height (int): 可见的行数
+        width (int): 列表框宽度
+        selectmode (str): 'browse' 只能选中一行，'extended' 可以多选
+        '''
+        super().__init__(master)
+        self.rows = rows
+        self.label = label
+        self.filter_rows = filter_rows or self._filter_by_label
+        self.height = height
+        self.selectmode = selectmode
+        self.filtered = None  # 筛选后的行，没有筛选时为 None
+        self.top = 0  # 第一个可见行的位置
+        self.selected_indices = set()  # 选中的行在（筛选后的）行中的位置，不可见的行也保留
+        self._filter_job = None
+
+        self.filter_var = tk.StringVar()
+        tk.Entry(self, textvariable=self.filter_var, width=width).pack(fill='x')
+        self.filter_var.trace('w', self._on_filter_changed)
+
+        list_frame = tk.Frame(self)
+        list_frame.pack(fill='both', expand=True)
+        self.scrollbar = tk.Scrollbar(list_frame, command=self._on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill='y')
+        self.listbox = tk.Listbox(list_frame, height=height, width=width, exportselection=False, selectmode=selectmode)
+        self.listbox.pack(side=tk.LEFT, fill='both', expand=True)
+        self.listbox.bind('<Button-1>', self._on_click)
+        self.listbox.bind('<<ListboxSelect>>', self._on_select)
+        self.listbox.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.listbox.bind('<Button-4>', lambda event: self.scroll(-1))
+        self.listbox.bind('<Button-5>', lambda event: self.scroll(1))
+        self.render()
+
+    def _visible_rows(self):
+        return self.rows if self.filtered is None else self.filtered
+
+    def _filter_by_label(self, text):
+        return [row for row in self.rows if text in self.label(row)]
+
+    def _on_filter_changed(self, *args):
+        # 输入停顿 200 毫秒后再筛选，避免每输入一个字就筛选一次
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(200, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        text = self.filter_var.get()
+        self.filtered = self.filter_rows(text) if text else None
+        self.top = 0
+        self.selected_indices.clear()
+        self.render()
+
+    def _on_scroll(self, action, value, unit=None):
+        '''
+        滚动条的回调，action 为 'moveto'（拖动到某个比例）或 'scroll'（按行或按页滚动）。
+        '''
+        if action == 'moveto':
+            self.top = int(float(value) * len(self._visible_rows()))
+            self.render()
+        else:
+            self.scroll(int(value) * (self.height if unit == 'pages' else 1))
+
+    def _on_click(self, event):
+        # 没有按住 Shift 或 Ctrl 的单击重新选择，同时取消滚动到别处的行的选中状态
+        if self.selectmode == 'browse' or not event.state & 0x5:
+            self.selected_indices.clear()
+
+    def _on_select(self, event=None):
+        # 列表框中只有可见的行，用它的选中状态更新可见范围内的行
+        if self.selectmode == 'browse':
+            self.selected_indices.clear()
+        end = self.top + self.listbox.size()
+        self.selected_indices.difference_update(range(self.top, end))
+        self.selected_indices.update(self.top + index for index in self.listbox.curselection())
+
+    def scroll(self, lines):
+        '''
+        向下（正数）或向上（负数）滚动若干行。
+        参数：
+        lines (int): 滚动的行数
+        '''
+        self.top += lines
+        self.render()
+
+    def render(self):
+        '''
+        只把可见的几行放入列表框，并更新滚动条的位置。
+        '''
+        rows = self._visible_rows()
+        total = len(rows)
+        self.top = max(0, min(self.top, total - self.height))
+        end = min(self.top + self.height, total)
+        self.listbox.delete(0, tk.END)
+        for index in range(self.top, end):
+            self.listbox.insert(tk.END, self.label(rows[index]))
+        for index in self.selected_indices:
+            if self.top <= index < end:
+                self.listbox.selection_set(index - self.top)
+        if total:
+            self.scrollbar.set(self.top / total, end / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def set_rows(self, rows):
+        '''
+        更换底层数据，保留当前的筛选文本，清除选中状态。
+        参数：
+        rows (sequence): 新的底层数据
+        '''
+        self.rows = rows
+        self.selected_indices.clear()
+        self.refresh()
+
+    def refresh(self):
+        '''
+        底层数据变化后重新筛选并重新显示可见的行。
+        '''
+        text = self.filter_var.get()
+        self.filtered = self.filter_rows(text) if text else None
+        rows = self._visible_rows()
+        self.selected_indices = {index for index in self.selected_indices if index < len(rows)}
+        self.render()
+
+    def remove_rows(self, removed):
+        '''
+        从列表中移除若干行（例如已经审核完的用户），保留筛选文本和滚动位置，不重新筛选。
+        只适用于底层数据是列表、行可以放进集合的情况。
+        参数：
+        removed (iterable): 要移除的行
+        '''
+        removed = set(removed)
+        self.rows = [row for row in self.rows if row not in removed]
+        if self.filtered is not None:
+            self.filtered = [row for row in self.filtered if row not in removed]
+        self.selected_indices.clear()
+        self.render()
+
+    def select_all(self):
+        '''
+        选中（筛选后的）所有行。
+        '''
+        self.selected_indices = set(range(len(self._visible_rows())))
+        self.render()
+
+    def selected(self):
+        '''
+        返回：
+        row: 当前选中的行（多选时为最靠前的一行），没有选中时返回 None
+        '''
+        rows = self.selected_rows()
+        return rows[0] if rows else None
+
+    def selected_rows(self):
+        '''
+        返回：
+        rows (list): 所有选中的行，按在列表中的顺序排列
+        '''
+        rows = self._visible_rows()
+        return [rows[index] for index in sorted(self.selected_indices) if index < len(rows)]
+
+    def bind_rows(self, sequence, callback):
+        '''
+        为列表框中的行绑定事件，例如双击。
+        参数：
+        sequence (str): 事件名称
+        callback (function): 回调函数
+        '''
+        self.listbox.bind(sequence, callback)
@@ -0,0 +1,326 @@
+"""
+延迟写入（write-behind）
+WriteBehindStorage 包装一个存储引擎：添加、修改、删除物品，保存用户和物品类型时只在内存中记下改动就立即返回，
+后台写入线程等待一个可配置的时间窗口，把窗口内的所有改动合并成一次写入（成组提交）：
+同一个用户、同一个物品的多次改动只写最后的结果，连续审核 200 个用户只写一次（只提交一个事务）。
+退出登录和退出程序时调用 flush / close，把尚未写入的改动立即写入磁盘。
+"""
+import threading
+import time
+
+from item_model import Item
+from storage import StorageEngine
+
+
+def _snapshot(item):
+    '''
+    复制物品信息（连同属性），后台线程写入的是改动时的内容，不受界面线程之后修改的影响。
+    '''
+    return Item(item)
+
+
+class PendingWrites:
+    '''
+    尚未写入的改动，同一对象的多次改动合并为一次。
+    '''
+    def __init__(self):
+        self.users = {}  # 用户名 -> 用户信息的副本（只有发生变化的用户）
+        self.item_types = None
+        self.items = None  # 需要全量保存的物品
+        self.item_records = {}  # 物品编号 -> (操作, 物品信息)
+
+    def __bool__(self):
+        return (bool(self.users) or self.item_types is not None or self.items is not None
+                or bool(self.item_records))
+
+    def add_record(self, op, item_id, item):
+        '''
+        记下一个物品的改动：先添加后修改仍是添加，添加后又删除则什么也不用写。
+        '''
+        previous = self.item_records.get(item_id)
+        if previous is not None and previous[0] == 'add':
+            if op == 'delete':
+                del self.item_records[item_id]
+                return
+            op = 'add'
+        self.item_records[item_id] = (op, item)
+
+    def merge(self, newer):
+        '''
+        把较新的改动合并进来（写入失败时，把没写成的改动放回去再与之后的改动合并）。
+        参数：
+        newer (PendingWrites): 较新的改动
+        '''
+        self.users.update(newer.users)
+        if newer.item_types is not None:
+            self.item_types = newer.item_types
+        if newer.items is not None:
+            self.items = newer.items
+            self.item_records = {}
+        for item_id, (op, item) in newer.item_records.items():
+            self.add_record(op, item_id, item)
+
+
+class WriteBehindStorage(StorageEngine):
+    def __init__(self, storage, delay=0.1):
+        '''
+        初始化函数
+        参数：
+        storage (StorageEngine): 实际读写数据的存储引擎
+        delay (float): 时间窗口（秒），第一条改动之后等待这么久再写入，期间的改动一起写入
+        '''
+        self.storage = storage
+        self.delay = delay
+        self.last_error = None  # 后台写入最近一次失败的原因，下一次写入成功后清除
+        self._pending = PendingWrites()
+        self._pending_lock = threading.Lock()  # 保护 _pending，记下改动时只持有很短的时间
+        self._io_lock = threading.RLock()  # 串行化对实际存储引擎的所有调用
+        self._wakeup = threading.Condition(self._pending_lock)
+        self._closed = False
+        # 自己写入后数据文件的变化标记，以及最近一次报告给调用方的标记（见 _stamp）
+        self._committed_stamps = {}
+        self._reported_stamps = {}
+        self._writer = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._writer.start()
+
+    @property
+    def writes_full_items(self):
+        return self.storage.writes_full_items
+
+    def _enqueue(self, update):
+        '''
+        在锁中修改尚未写入的改动，并唤醒后台写入线程。
+        参数：
+        update (function): update(PendingWrites)
+        '''
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError('存储引擎已经关闭')
+            update(self._pending)
+            self._wakeup.notify()
+
+    def _run(self):
+        '''
+        后台写入线程：有改动后等待一个时间窗口，再把窗口内的所有改动一次写入。
+        '''
+        while True:
+            with self._pending_lock:
+                while not self._pending and not self._closed:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                # 收集时间窗口内的其他改动，剩下的改动由 close 写入
+                if not self._wait_window():
+                    return
+            try:
+                self._commit()
+            except Exception as e:
+                # 改动已经放回，等下一个时间窗口重试
+                self.last_error = e
+                with self._pending_lock:
+                    if not self._wait_window():
+                        return
+
+    def _wait_window(self):
+        '''
+        在持有 _pending_lock 时等待一个时间窗口；新的改动不会提前结束等待，close 会。
+        返回：
+        running (bool): 存储引擎是否还没有关闭
+        '''
+        deadline = time.monotonic() + self.delay
+        while not self._closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            self._wakeup.wait(remaining)
+        return False
+
+    def _commit(self):
+        '''
+        取出所有尚未写入的改动并一次写入；失败时把改动放回。
+        '''
+        with self._io_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, PendingWrites()
+            if not batch:
+                return
+            try:
+                self.storage.write_batch(
+                    usrs_info=batch.users if batch.users else None,
+                    changed_users=list(batch.users),
+                    item_types=batch.item_types,
+                    items=batch.items,
+                    item_records=[(op, item_id, item) for item_id, (op, item) in batch.item_records.items()])
+            except Exception:
+                with self._pending_lock:
+                    batch.merge(self._pending)
+                    self._pending = batch
+                raise
+            if batch.users:
+                self._committed_stamps['users'] = self.storage.users_stamp()
+            if batch.item_types is not None:
+                self._committed_stamps['item_types'] = self.storage.item_types_stamp()
+            self.last_error = None
+
+    def flush(self):
+        '''
+        立即写入所有尚未写入的改动，写入失败时抛出异常。
+        '''
+        self._commit()
+
+    def close(self):
+        '''
+        停止后台写入线程，写入剩下的改动，再关闭实际的存储引擎。
+        '''
+        with self._pending_lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._writer.join()
+        try:
+            self._commit()
+        finally:
+            self.storage.close()
+
+    def _stamp(self, key, stamp_function):
+        '''
+        数据文件的变化标记。自己延迟写入造成的变化不算变化，否则仓库会在每次写入后重新加载一遍自己刚写的数据；
+        还有改动没写入时，内存中的数据比文件新，也不需要重新加载。
+        '''
+        with self._io_lock:
+            with self._pending_lock:
+                pending = bool(self._pending.users) if key == 'users' else self._pending.item_types is not None
+            if pending and key in self._reported_stamps:
+                return self._reported_stamps[key]
+            stamp = stamp_function()
+            if key in self._reported_stamps and stamp == self._committed_stamps.get(key):
+                return self._reported_stamps[key]
+            self._reported_stamps[key] = stamp
+            self._committed_stamps.pop(key, None)
+            return stamp
+
+    # 用户
+    def load_users(self):
+        self.flush()
+        with self._io_lock:
+            return self.storage.load_users()
+
+    def get_user(self, name):
+        # 还没写入的用户以内存中的为准，不必为读取一个用户而提前写入
+        with self._io_lock:
+            with self._pending_lock:
+                user_info = self._pending.users.get(name)
+            if user_info is not None:
+                return dict(user_info)
+            return self.storage.get_user(name)
+
+    def list_users(self, status=None):
+        self.flush()
+        with self._io_lock:
+            return self.storage.list_users(status)
+
+    def save_user(self, name, user_info):
+        self.save_users({name: user_info}, [name])
+
+    def add_user(self, name, user_info):
+        # 注册要立即知道用户名是否已被占用，直接写入，不延迟
+        with self._io_lock:
+            with self._pending_lock:
+                if name in self._pending.users:
+                    return False
+            return self.storage.add_user(name, dict(user_info))
+
+    def save_users(self, usrs_info, changed):
+        snapshot = {name: dict(usrs_info[name]) for name in changed}
+        self._enqueue(lambda pending: pending.users.update(snapshot))
+
+    def users_stamp(self):
+        return self._stamp('users', self.storage.users_stamp)
+
+    # 物品类型
+    def load_item_types(self):
+        with self._pending_lock:
+            if self._pending.item_types is not None:
+                return self._pending.item_types
+        with self._io_lock:
+            return self.storage.load_item_types()
+
+    def save_item_types(self, item_types):
+        def update(pending):
+            pending.item_types = item_types
+        self._enqueue(update)
+
+    def item_types_stamp(self):
+        return self._stamp('item_types', self.storage.item_types_stamp)
+
+    # 物品
+    def load_items(self):
+        self.flush()
+        with self._io_lock:
+            return self.storage.load_items()
+
+    def load_item_changes(self):
+        with self._io_lock:
+            records = self.storage.load_item_changes()
+            if records is None:
+                return None
+            # 还没写入的物品以内存中的为准，忽略文件中关于它们的旧记录
+            with self._pending_lock:
+                pending_ids = set(self._pending.item_records)
+            return [record for record in records if record[1] not in pending_ids]
+
+    def save_items(self, items):
+        snapshot = [_snapshot(item) for item in items]
+
+        def update(pending):
+            pending.items = snapshot
+            pending.item_records = {}
+        self._enqueue(update)
+
+    def add_item(self, item):
+        if self.writes_full_items:
+            # 整文件模式下只分配编号，随后由 save_items 保存
+            with self._io_lock:
+                self.storage.add_item(item)
+            return
+        if item.get('id') is None:
+            with self._io_lock:
+                item['id'] = self.storage.allocate_item_id()
+        snapshot = _snapshot(item)
+        self._enqueue(lambda pending: pending.add_record('add', item['id'], snapshot))
+
+    def modify_item(self, item):
+        if self.writes_full_items:
+            return
+        snapshot = _snapshot(item)
+        self._enqueue(lambda pending: pending.add_record('modify', item['id'], snapshot))
+
+    def delete_item(self, item):
+        if self.writes_full_items:
+            return
+        self._enqueue(lambda pending: pending.add_record('delete', item['id'], None))
+
+    def write_batch(self, usrs_info=None, changed_users=(), item_types=None, items=None, item_records=()):
+        # 一批改动一次记下，与时间窗口内的其他改动一起写入
+        users = {name: dict(usrs_info[name]) for name in changed_users} if usrs_info is not None else {}
+        items = [_snapshot(item) for item in items] if items is not None else None
+        item_records = [(op, item_id, _snapshot(item) if item is not None else None)
+                        for op, item_id, item in item_records]
+
+        def update(pending):
+            pending.users.update(users)
+            if item_types is not None:
+                pending.item_types = item_types
+            if items is not None:
+                pending.items = items
+                pending.item_records = {}
+            for op, item_id, item in item_records:
+                pending.add_record(op, item_id, item)
+        self._enqueue(update)
+
+    def allocate_item_id(self):
+        with self._io_lock:
+            return self.storage.allocate_item_id()
+
+    def allocate_item_ids(self, count):
+        with self._io_lock:
+            return self.storage.allocate_item_ids(count)